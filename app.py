@@ -1,28 +1,29 @@
+import os
+import time
 import streamlit as st
 import pandas as pd
-import random
-import re
-import requests
-from datetime import datetime
 import theme_analog_warmth as theme
+from instrumentation import METRICS, METRICS_LOG_PATH, METRICS_PORT, serve_metrics, span
+from engine import (BUY_FEES, BATCH_REQUIRED_COLS, BATCH_MARKET_REQUIRED_COLS, CPM_DECAY, CPM_FLOOR, TURN_WINDOWS, AppraisalSettings,
+                    appraise_market, batch_usecols, prepare_batch, price_batch, sensitivity_grid)
+from excel_ingest import read_workbook
+from vin_decoder import VinDecoder, apply_decodes
+from vin_cache import VinCache
+from vin_offline import VinPrefixIndex
+from market_data import MarketData, market_stats
+from results_view import ALERT_LEVELS, PAGE_SIZES, PRIORITY_LEVELS, SORT_COLUMNS, STATUS_LEVELS, format_page, results_csv, select_rows
+from sales_ingest import SALES_STORE_PATH, MissingColumnsError, RooftopSales, SalesSummaryCache, merge_upload
 
 st.set_page_config(page_title="Profit Logic V5 — Dealer Direct OS", layout="wide")
 theme.apply_theme()
 
+# Stage timings for this rerun, shown in the sidebar's diagnostics panel
+run_started = time.perf_counter()
+run_timings = METRICS.begin_run()
+
 # ---------------------------------------------------------
 # CONSTANTS & DEFAULTS
 # ---------------------------------------------------------
-BUY_FEES = 865
-CURRENT_YEAR = datetime.now().year
-
-DEFAULT_INDUSTRY_TURN = {
-    'hyundai_tucson': 30, 'hyundai_elantra': 32, 'hyundai_sonata': 32,
-    'hyundai_kona': 25, 'hyundai_palisade': 28, 'hyundai_santa_fe': 42,
-    'nissan_rogue': 36, 'nissan_altima': 40, 'nissan_kicks': 33,
-    'toyota_camry': 26, 'toyota_rav4': 35, 'honda_accord': 32,
-    'kia_sportage': 56, 'genesis_gv70': 36, 'genesis_g70': 42
-}
-
 # Extensive Make/Model database for dropdowns
 VEHICLE_DB = {
     "Chevrolet": ["Silverado 1500", "Equinox", "Malibu", "Tahoe", "Traverse", "Colorado", "Trax", "Suburban"],
@@ -39,19 +40,35 @@ VEHICLE_DB = {
     "Other": ["Other Model"]
 }
 
-BASE_MSRP = {
-    'hyundai_tucson': 26000, 'hyundai_elantra': 21000, 'hyundai_sonata': 25000,
-    'nissan_rogue': 28000, 'nissan_altima': 25000, 'toyota_camry': 27000,
-    'toyota_rav4': 29000, 'honda_accord': 28000, 'kia_sportage': 27000,
-    'genesis_gv70': 45000, 'chevrolet_equinox': 26000, 'ford_escape': 27000
-}
+# Sidebar choices; the what-if grids cover every combination
+MARGIN_OPTIONS = ["5%", "8%", "10%", "12%", "14%", "16%", "18%"]
+RECON_OPTIONS = ["$1,000", "$1,500", "$2,000"]
+MARGIN_STEPS = [float(m.strip('%')) / 100.0 for m in MARGIN_OPTIONS]
+RECON_STEPS = [float(r.replace('$', '').replace(',', '')) for r in RECON_OPTIONS]
+TURN_WINDOW_LABELS = {'all': "All Sales", '30d': "Last 30 Days", '90d': "Last 90 Days",
+                      '365d': "Last 365 Days", 'ewma': "Recency-Weighted"}
+
+# Rows behind the Batch Processor's "Load Sample" button
+SAMPLE_BATCH = [
+    {"vin": "1G1AL58FX7", "year": 2021, "make": "Chevrolet", "model": "Equinox", "mileage": 45000, "retail": 22000, "appraisal": 16000},
+    {"vin": "JHMCR2F39C", "year": 2019, "make": "Honda", "model": "Accord", "mileage": 98000, "retail": 18500, "appraisal": 13000},
+    {"vin": "4T1B11HK5M", "year": 2022, "make": "Toyota", "model": "Camry", "mileage": 25000, "retail": 26000, "appraisal": 20000},
+    {"vin": "5XYPK4A63C", "year": 2020, "make": "Kia", "model": "Sportage", "mileage": 105000, "retail": 15000, "appraisal": 11000},
+    {"vin": "KM8R54AP1L", "year": 2023, "make": "Hyundai", "model": "Tucson", "mileage": 12000, "retail": 29000, "appraisal": 24000}
+]
 
 # ---------------------------------------------------------
 # SESSION STATE
 # ---------------------------------------------------------
-if 'dealer_turn_data' not in st.session_state: st.session_state.dealer_turn_data = {}
-if 'dealer_gross_data' not in st.session_state: st.session_state.dealer_gross_data = {}
-if 'sales_summary' not in st.session_state: st.session_state.sales_summary = None
+# Merged turn/gross sums from every sales log uploaded so far, per rooftop (see sales_ingest.RooftopSales)
+if 'sales_store' not in st.session_state:
+    st.session_state.sales_store = RooftopSales.load(SALES_STORE_PATH) if SALES_STORE_PATH else RooftopSales()
+if 'sales_file_id' not in st.session_state: st.session_state.sales_file_id = None
+if 'sales_upload_msg' not in st.session_state: st.session_state.sales_upload_msg = None
+
+# Batch Processor State
+if 'batch_sample' not in st.session_state: st.session_state.batch_sample = False
+if 'batch_stages' not in st.session_state: st.session_state.batch_stages = {}
 
 # VIN Decoder State
 if 'dec_make' not in st.session_state: st.session_state.dec_make = "Kia"
@@ -61,114 +78,71 @@ if 'dec_year' not in st.session_state: st.session_state.dec_year = 2020
 # ---------------------------------------------------------
 # HELPER FUNCTIONS
 # ---------------------------------------------------------
-def parse_currency(val):
-    if pd.isna(val): return 0.0
-    val_str = str(val).strip()
-    if not val_str or val_str == '-': return 0.0
-    is_neg = False
-    if val_str.startswith('(') and val_str.endswith(')'):
-        is_neg, val_str = True, val_str[1:-1]
-    elif val_str.startswith('-'):
-        is_neg, val_str = True, val_str[1:]
-    val_str = re.sub(r'[^\d.]', '', val_str)
-    try: return -float(val_str) if is_neg else float(val_str)
-    except ValueError: return 0.0
-
-def get_base_cpm(price):
-    if price < 15000: return 0.10
-    if price < 45000: return 0.15
-    if price < 80000: return 0.20
-    return 0.30
-
-def calculate_cpm(price, vehicle_year, current_year, use_auto, manual_cpm):
-    base_cpm = get_base_cpm(price) if use_auto else manual_cpm
-    age = max(current_year - vehicle_year, 0)
-    return max(base_cpm * (0.85 ** age), 0.03)
-
-def get_turn_days(make, model):
-    key = f"{str(make).lower()}_{str(model).lower().replace(' ', '_')}"
-    if key in st.session_state.dealer_turn_data:
-        return st.session_state.dealer_turn_data[key], "YOUR Data"
-    return DEFAULT_INDUSTRY_TURN.get(key, 38), "Industry Averages"
-
-def get_priority(turn_days, margin):
-    if turn_days <= 30 and margin >= 0.12: return "HIGH"
-    if turn_days >= 60 and margin < 0.08: return "LOW"
-    return "MEDIUM"
+@st.cache_resource
+def get_vin_decoder():
+    """One pooled NHTSA session shared by every rerun and session, backed by the on-disk VIN cache"""
+    cache = VinCache()
+    index = VinPrefixIndex.from_decodes(cache.iter_decodes())
+    METRICS.watch_cache("vin_cache", cache)
+    METRICS.watch_cache("vin_prefix_index", index)
+    return VinDecoder(cache=cache, index=index)
 
 @st.cache_data(show_spinner=False)
 def decode_vin_nhtsa(vin):
     """Pings the free US Govt NHTSA API to fully decode Make, Model, and Year"""
-    if len(vin) != 17 or any(c in vin for c in 'IOQ'): return "", "", CURRENT_YEAR - 3
-    try:
-        url = f"https://vpic.nhtsa.dot.gov/api/vehicles/DecodeVinValues/{vin}?format=json"
-        response = requests.get(url, timeout=5)
-        if response.status_code == 200:
-            data = response.json()['Results'][0]
-            make = data.get('Make', '').title()
-            model = data.get('Model', '').title()
-            try: year = int(data.get('ModelYear', ''))
-            except ValueError: year = CURRENT_YEAR - 3
-            return make, model, year
-    except Exception: pass
-    return "", "", CURRENT_YEAR - 3
-
-def generate_vauto_market_data(make, model, year, target_mileage, radius, zip_code):
-    """
-    FUTURE API PLUG-IN: Replace this mock logic with a call to MarketCheck API.
-    Example: requests.get(f"https://api.marketcheck.com/v2/search/car/active?api_key=YOUR_KEY...")
-    """
-    key = f"{str(make).lower()}_{str(model).lower().replace(' ', '_')}"
-    base_price = BASE_MSRP.get(key, 25000) * (0.85 ** max(0, CURRENT_YEAR - year))
-    
-    # Generate 15 to 30 simulated live listings within the radius
-    random.seed(f"{make}{model}{year}{zip_code}")
-    num_listings = random.randint(18, 35) 
-    rad_int = int(radius.replace(" miles", ""))
-    
-    sellers = ["SUN STATE FORD", "MAZDA OF WESLEY...", "GETTEL STADIUM...", "Prime Leasing and Sales", "CAR SELECT LLC", "Universal Nissan", "OFFLEASE ORLANDO", "C & L MOTORS"]
-    colors = ["Blue", "Black", "Gray", "Silver", "White", "Red"]
-    interiors = ["Black Cloth", "Gray Cloth", "Black Leather", "Beige Leather"]
-    
-    listings = []
-    for i in range(num_listings):
-        price_var = random.gauss(0, 1500)
-        mileage_var = random.gauss(0, 15000)
-        dist = random.randint(0, rad_int)
-        
-        listings.append({
-            "Vehicle": f"{year} {make} {model}",
-            "Color": random.choice(colors),
-            "Interior": random.choice(interiors),
-            "List Price": max(4000, int(base_price - ((target_mileage + mileage_var - target_mileage) * 0.08) + price_var)),
-            "Odometer (mi)": max(1000, int(target_mileage + mileage_var)),
-            "Age": int(abs(random.gauss(45, 30))),
-            "Distance (mi)": dist,
-            "Seller": random.choice(sellers),
-            "VDP": "🔗 Link"
-        })
-    
-    df = pd.DataFrame(listings)
-    # Sort by price ascending to match vAuto default Rank
-    df = df.sort_values(by="List Price", ascending=True).reset_index(drop=True)
-    df.insert(0, "Rank", df.index + 1)
-    
-    # Randomize vRank (vAuto's proprietary value rank)
-    v_ranks = list(range(1, len(df) + 1))
-    random.shuffle(v_ranks)
-    df.insert(1, "vRank", v_ranks)
-    
-    return df
+    decoded = get_vin_decoder().decode(vin)
+    return decoded.make, decoded.model, decoded.year
+
+@st.cache_resource
+def get_sales_cache():
+    """Per-file sales aggregates keyed by content hash, shared across reruns and sessions"""
+    cache = SalesSummaryCache()
+    METRICS.watch_cache("sales_summary", cache.memory)
+    return cache
+
+def store_monthly_trend(store):
+    """Units sold and average turn per month over every model, from the store's month buckets"""
+    monthly = store.monthly_breakdown()
+    monthly = monthly.assign(Turn_Sum=monthly['Avg_Turn'] * monthly['Units_Sold']).groupby('Month')[['Units_Sold', 'Turn_Sum']].sum()
+    return monthly.assign(Avg_Turn=monthly['Turn_Sum'] / monthly['Units_Sold'])
+
+def cached_stage(name, key, compute):
+    """Per-session memo of one batch pipeline stage, recomputed only when its `key` changes"""
+    stages = st.session_state.batch_stages
+    if name not in stages or stages[name][0] != key:
+        METRICS.count("batch_stage_misses")
+        stages[name] = (key, compute())
+    else:
+        METRICS.count("batch_stage_hits")
+    return stages[name][1]
+
+def sensitivity_table(values, fmt):
+    """Margin target x recon cost grid of `values` as a display frame"""
+    return pd.DataFrame([[fmt(v) for v in row] for row in values], index=pd.Index(MARGIN_OPTIONS, name="Margin"), columns=RECON_OPTIONS)
+
+@st.cache_resource
+def get_market_data():
+    """Market comps provider plus its LRU/TTL cache, shared across reruns and sessions"""
+    market_data = MarketData()
+    METRICS.watch_cache("market", market_data.cache)
+    return market_data
+
+@st.cache_resource
+def start_metrics_server():
+    """Prometheus-style /metrics endpoint on METRICS_PORT, one per process"""
+    return serve_metrics(METRICS_PORT)
+
+if METRICS_PORT: start_metrics_server()
 
 # ---------------------------------------------------------
 # SIDEBAR SETTINGS
 # ---------------------------------------------------------
 with st.sidebar:
     st.markdown("## Settings")
-    margin_str = st.selectbox("Margin Target", ["5%", "8%", "10%", "12%", "14%", "16%", "18%"], index=3)
+    margin_str = st.selectbox("Margin Target", MARGIN_OPTIONS, index=3)
     margin_target = float(margin_str.strip('%')) / 100.0
 
-    recon_str = st.selectbox("Recon Cost", ["$1,000", "$1,500", "$2,000"], index=1)
+    recon_str = st.selectbox("Recon Cost", RECON_OPTIONS, index=1)
     recon_cost = float(recon_str.replace('$', '').replace(',', ''))
 
     below_line = st.number_input("Below the Line", min_value=0, max_value=5000, step=100, value=1200)
@@ -178,15 +152,33 @@ with st.sidebar:
     manual_cpm = 0.15
     if not auto_cpm:
         manual_cpm = st.slider("Manual CPM", 0.05, 0.50, 0.15, step=0.01)
+    with st.expander("Taper Curve"):
+        cpm_decay = st.number_input("Yearly CPM Decay", 0.50, 1.00, CPM_DECAY, step=0.01,
+                                    help="CPM is multiplied by this once per model year of age")
+        cpm_floor = st.number_input("CPM Floor", 0.00, 0.20, CPM_FLOOR, step=0.01)
 
     st.markdown(f"**Buy Fees:** ${BUY_FEES}")
+    settings = AppraisalSettings(margin_target, recon_cost, below_line, auto_cpm, manual_cpm,
+                                 cpm_decay=cpm_decay, cpm_floor=cpm_floor)
+    # What-if grids compare auto CPM with the manual rate
+    cpm_modes = [(True, manual_cpm), (False, manual_cpm)]
+    cpm_labels = ["Auto CPM", f"Manual ${manual_cpm:.2f}/mi"]
     
     st.markdown("---")
-    num_models = len(st.session_state.dealer_turn_data)
+    turn_window = st.selectbox("Turn Window", TURN_WINDOWS, format_func=TURN_WINDOW_LABELS.get,
+                               help="Which of your sales the turn days and priorities come from")
+    turn_tables = st.session_state.sales_store.turn_table(turn_window)
+    rooftop = None
+    if turn_tables.stores:
+        # Rows of a batch with their own rooftop column use that rooftop instead
+        rooftop = st.selectbox("Rooftop", [None, *turn_tables.stores], format_func=lambda r: r or "Whole Group",
+                               help="Whose turn days to use; models a rooftop hasn't sold fall back to the group's")
+    num_models = len(turn_tables.stores.get(rooftop, turn_tables.group))
     if num_models > 0:
         st.success(f"🟢 **Source:** YOUR Data ({num_models} models)")
     else:
         st.warning("🟡 **Source:** Industry Averages")
+    show_diagnostics = st.checkbox("Show Diagnostics", help="Per-stage timings for the last rerun and cache hit rates")
 
 # ---------------------------------------------------------
 # MAIN APP TABS
@@ -205,11 +197,15 @@ with tab1:
     if vin_input and len(vin_input) == 17:
         with st.spinner("Decoding via US Govt Database..."):
             d_make, d_model, d_year = decode_vin_nhtsa(vin_input)
-            if d_make:
+            if d_make and d_model:
                 st.session_state.dec_make = d_make
                 st.session_state.dec_model = d_model
                 st.session_state.dec_year = d_year
                 st.success(f"Decoded: {d_year} {d_make} {d_model}")
+            elif d_make:
+                st.session_state.dec_make = d_make
+                st.session_state.dec_year = d_year
+                st.warning(f"NHTSA unavailable. VIN identifies a {d_year} {d_make}; select the model manually.")
             else:
                 st.error("Invalid VIN or not found in NHTSA database.")
                 
@@ -237,16 +233,15 @@ with tab1:
             st.warning("Please fill Make and Model.")
         else:
             # Fetch simulated data to match vAuto format
-            df_mkt = generate_vauto_market_data(make_input, model_input, year_input, mileage_input, rad, zip_code)
+            df_mkt = get_market_data().search(make_input, model_input, year_input, rad, zip_code, target_mileage=mileage_input)
             
             market_avg_price = df_mkt["List Price"].mean()
             market_median_mileage = df_mkt["Odometer (mi)"].median()
             avg_dom = df_mkt["Age"].mean()
             
-            cpm = calculate_cpm(market_avg_price, year_input, CURRENT_YEAR, auto_cpm, manual_cpm)
-            mileage_impact = (market_median_mileage - mileage_input) * cpm
-            adjusted_retail = market_avg_price + mileage_impact
-            max_buy = (adjusted_retail * (1 - margin_target)) - recon_cost - BUY_FEES
+            cpm, mileage_impact, adjusted_retail, max_buy = appraise_market(
+                market_avg_price, market_median_mileage, mileage_input, year_input, settings
+            )
             
             st.markdown("---")
             
@@ -279,6 +274,18 @@ with tab1:
                 st.write(f"KBB.com: **${market_avg_price * 1.05:,.0f}**")
                 st.write(f"MMR: **${market_avg_price * 0.88:,.0f}**")
 
+            with st.expander("What-if: Max Buy by Margin Target and Recon Cost"):
+                one = pd.DataFrame({'year': [year_input], 'make': [make_input], 'model': [model_input],
+                                    'mileage': [mileage_input], 'appraisal': [0.0]})
+                comps = pd.DataFrame({'market_price': [market_avg_price], 'market_odometer': [market_median_mileage],
+                                      'market_days': [avg_dom]})
+                grid = sensitivity_grid(prepare_batch(one, market=comps, current_year=settings.current_year),
+                                        MARGIN_STEPS, RECON_STEPS, cpm_modes, cpm_decay=cpm_decay, cpm_floor=cpm_floor,
+                                        current_year=settings.current_year)
+                for col, label, max_buy in zip(st.columns(len(cpm_modes)), cpm_labels, grid.max_buy[..., 0]):
+                    col.markdown(f"**{label}**")
+                    col.markdown(sensitivity_table(max_buy, lambda x: f"${x:,.0f}").to_html(), unsafe_allow_html=True)
+
             st.markdown("---")
             
             # VAUTO STYLE COMPETITIVE SET TABLE
@@ -293,7 +300,8 @@ with tab1:
             df_disp = df_disp[["Rank", "vRank", "Vehicle", "List Price", "Odometer (mi)", "Age", "Distance (mi)", "Seller", "VDP"]]
             
             # To render the HTML inside the dataframe correctly in Streamlit, we must use to_html
-            st.markdown(df_disp.to_html(escape=False, index=False), unsafe_allow_html=True)
+            with span("render"):
+                st.markdown(df_disp.to_html(escape=False, index=False), unsafe_allow_html=True)
 
 
 # TAB 2: SALES PERFORMANCE (DATA UPLOAD)
@@ -302,7 +310,8 @@ with tab2:
     st.markdown("""
     <div class="info-box">
     Upload your dealer's DMS sales log (CSV or Excel) to extract custom turn rates and gross averages by Make/Model. 
-    The logic engine will automatically apply your proprietary data.
+    The logic engine will automatically apply your proprietary data. Each upload is merged into what you've already loaded
+    (deals already included are skipped), so monthly updates only need the new month's log.
     </div>
     """, unsafe_allow_html=True)
     
@@ -313,66 +322,38 @@ with tab2:
         st.write("")
         st.write("")
         if st.button("Clear Data", use_container_width=True):
-            st.session_state.dealer_turn_data = {}
-            st.session_state.dealer_gross_data = {}
-            st.session_state.sales_summary = None
+            st.session_state.sales_store = RooftopSales()
+            st.session_state.batch_stages = {}
+            if SALES_STORE_PATH and os.path.exists(SALES_STORE_PATH): os.remove(SALES_STORE_PATH)
+            st.session_state.sales_file_id = None
+            st.session_state.sales_upload_msg = None
             st.rerun()
             
-    if uploaded_file:
+    # Reruns with the same upload still attached skip ingestion entirely; new uploads are
+    # folded into the store, so only this month's log needs uploading
+    if uploaded_file and uploaded_file.file_id != st.session_state.sales_file_id:
+        st.session_state.sales_file_id = uploaded_file.file_id
+        store = st.session_state.sales_store
         try:
-            df = pd.read_csv(uploaded_file) if uploaded_file.name.endswith('.csv') else pd.read_excel(uploaded_file)
-            req_cols = ['Sold Date', 'Received Date', 'Make', 'Model', 'Front Gross', 'Total Gross', 'Deal Type', 'Sold Price']
-            missing = [c for c in req_cols if c not in df.columns]
-            
-            if missing:
-                st.error(f"Missing expected columns: {', '.join(missing)}")
+            added = merge_upload(store, uploaded_file.getvalue(), uploaded_file.name, cache=get_sales_cache())
+            if added:
+                if SALES_STORE_PATH: store.save(SALES_STORE_PATH)
+                st.session_state.sales_upload_msg = ("success", f"✅ Data processed successfully! {added:,} new deals merged into your turn rates.")
+            elif store.summary:
+                st.session_state.sales_upload_msg = ("info", "No new deals in this file; every Retail deal in it is already included.")
             else:
-                df = df[df['Deal Type'].astype(str).str.upper() == 'RETAIL'].copy()
-                df = df.dropna(subset=['Sold Date', 'Received Date'])
-                df['Sold Date'] = pd.to_datetime(df['Sold Date'], errors='coerce')
-                df['Received Date'] = pd.to_datetime(df['Received Date'], errors='coerce')
-                
-                df['Days_To_Sell'] = (df['Sold Date'] - df['Received Date']).dt.days
-                df = df[(df['Days_To_Sell'] >= 0) & (df['Days_To_Sell'] <= 365)]
-                
-                for col in ['Front Gross', 'F&I Products Gross', 'Back Gross', 'Total Gross', 'Sold Price']:
-                    if col in df.columns: df[col] = df[col].apply(parse_currency)
-                
-                total_sales = len(df)
-                if total_sales > 0:
-                    t_front = df['Front Gross'].sum()
-                    t_gross = df['Total Gross'].sum()
-                    avg_turn = df['Days_To_Sell'].mean()
-                    avg_front = df['Front Gross'].mean()
-                    
-                    breakdown = df.groupby(['Make', 'Model']).agg(
-                        Units_Sold=('Days_To_Sell', 'count'),
-                        Avg_Turn=('Days_To_Sell', 'mean'),
-                        Avg_Front_Gross=('Front Gross', 'mean'),
-                        Avg_Total_Gross=('Total Gross', 'mean')
-                    ).reset_index()
-                    
-                    turn_dict, gross_dict = {}, {}
-                    for _, row in breakdown.iterrows():
-                        key = f"{str(row['Make']).lower()}_{str(row['Model']).lower().replace(' ', '_')}"
-                        turn_dict[key] = row['Avg_Turn']
-                        gross_dict[key] = {'front': row['Avg_Front_Gross'], 'total': row['Avg_Total_Gross']}
-                        
-                    st.session_state.dealer_turn_data = turn_dict
-                    st.session_state.dealer_gross_data = gross_dict
-                    st.session_state.sales_summary = {
-                        "total_sales": total_sales, "t_front": t_front, "t_gross": t_gross,
-                        "avg_turn": avg_turn, "avg_front": avg_front, "breakdown": breakdown
-                    }
-                    st.success("✅ Data processed successfully! Turn rates saved to session.")
-                else:
-                    st.warning("No valid Retail deals found in the file.")
-                
+                st.session_state.sales_upload_msg = ("warning", "No valid Retail deals found in the file.")
+        except MissingColumnsError as e:
+            st.session_state.sales_upload_msg = ("error", str(e))
         except Exception as e:
-            st.error(f"Error processing file: {e}")
+            st.session_state.sales_upload_msg = ("error", f"Error processing file: {e}")
 
-    if st.session_state.sales_summary:
-        ss = st.session_state.sales_summary
+    if uploaded_file and st.session_state.sales_upload_msg:
+        level, msg = st.session_state.sales_upload_msg
+        getattr(st, level)(msg)
+
+    if st.session_state.sales_store.summary:
+        ss = st.session_state.sales_store.summary
         st.subheader("Performance Summary")
         c1, c2, c3, c4, c5 = st.columns(5)
         c1.metric("Total Sales", f"{ss['total_sales']:,}")
@@ -385,7 +366,22 @@ with tab2:
         disp_df = ss['breakdown'].copy()
         disp_df['Avg_Turn'] = disp_df['Avg_Turn'].apply(lambda x: f"{x:.0f}d")
         for col in ['Avg_Front_Gross', 'Avg_Total_Gross']: disp_df[col] = disp_df[col].apply(lambda x: f"${x:,.2f}")
-        st.markdown(disp_df.to_html(index=False), unsafe_allow_html=True)
+        with span("render"):
+            st.markdown(disp_df.to_html(index=False), unsafe_allow_html=True)
+
+        st.subheader("Monthly Trend")
+        st.caption("Units sold and average turn per month of sale, across all models")
+        monthly = store_monthly_trend(st.session_state.sales_store)
+        tc1, tc2 = st.columns(2)
+        tc1.bar_chart(monthly['Units_Sold'])
+        tc2.line_chart(monthly['Avg_Turn'])
+
+        if st.session_state.sales_store.rooftops:
+            st.subheader("Rooftop Breakdown")
+            roof_df = st.session_state.sales_store.rooftop_breakdown()
+            roof_df['Avg_Turn'] = roof_df['Avg_Turn'].apply(lambda x: f"{x:.0f}d")
+            for col in ['Avg_Front_Gross', 'Avg_Total_Gross']: roof_df[col] = roof_df[col].apply(lambda x: f"${x:,.2f}")
+            st.markdown(roof_df.to_html(index=False), unsafe_allow_html=True)
 
 
 # TAB 3: BATCH PROCESSOR
@@ -398,58 +394,59 @@ with tab3:
         st.write("")
         st.write("")
         load_sample = st.button("Load Sample", type="primary")
+        decode_vins = st.checkbox("Decode VINs (NHTSA)", help="Fill blank Make/Model/Year from the VIN and flag rows that disagree with NHTSA")
+        use_market = st.checkbox("Price off Market Comps", help="Use market average price and median odometer per Make/Model/Year instead of the file's retail column")
+    if use_market:
+        mc1, mc2 = st.columns([1, 1])
+        batch_zip = mc1.text_input("Market Zip Code", value="32801", help="Rows with a `zip` column use their own")
+        batch_rad = mc2.selectbox("Market Radius", ["25 miles", "50 miles", "100 miles", "200 miles"], index=1)
         
-    df_batch = None
-    if load_sample:
-        df_batch = pd.DataFrame([
-            {"vin": "1G1AL58FX7", "year": 2021, "make": "Chevrolet", "model": "Equinox", "mileage": 45000, "retail": 22000, "appraisal": 16000},
-            {"vin": "JHMCR2F39C", "year": 2019, "make": "Honda", "model": "Accord", "mileage": 98000, "retail": 18500, "appraisal": 13000},
-            {"vin": "4T1B11HK5M", "year": 2022, "make": "Toyota", "model": "Camry", "mileage": 25000, "retail": 26000, "appraisal": 20000},
-            {"vin": "5XYPK4A63C", "year": 2020, "make": "Kia", "model": "Sportage", "mileage": 105000, "retail": 15000, "appraisal": 11000},
-            {"vin": "KM8R54AP1L", "year": 2023, "make": "Hyundai", "model": "Tucson", "mileage": 12000, "retail": 29000, "appraisal": 24000}
-        ])
-    elif batch_file:
-        df_batch = pd.read_csv(batch_file) if batch_file.name.endswith('.csv') else pd.read_excel(batch_file)
-            
-    if df_batch is not None:
-        df_batch.columns = [str(c).lower().strip() for c in df_batch.columns]
-        req = ['vin', 'year', 'make', 'model', 'mileage', 'retail', 'appraisal']
-        missing = [c for c in req if c not in df_batch.columns]
+    def read_batch():
+        with span("batch_read"):
+            if not batch_file: df = pd.DataFrame(SAMPLE_BATCH)
+            elif batch_file.name.endswith('.csv'): df = pd.read_csv(batch_file)
+            else: df = read_workbook(batch_file.getvalue(), batch_usecols, "batch")
+        df.columns = [str(c).lower().strip() for c in df.columns]
+        return df
+
+    def decode_batch(df):
+        with st.spinner(f"Decoding {df['vin'].nunique():,} VINs via US Govt Database..."):
+            return apply_decodes(df, get_vin_decoder().decode_many(df['vin']))
+
+    def pull_market(df):
+        with st.spinner("Pulling market comps..."):
+            return market_stats(df, get_market_data(), batch_rad, batch_zip)
+
+    # The sample stays loaded across reruns until a file is uploaded
+    if load_sample: st.session_state.batch_sample = True
+    source = batch_file.file_id if batch_file else ("sample" if st.session_state.batch_sample else None)
+
+    if source is not None:
+        # Each stage is cached per session and recomputed only when its own inputs change, so
+        # sidebar tweaks just re-price the prepared batch
+        df_batch = cached_stage("input", source, read_batch)
+        required = BATCH_MARKET_REQUIRED_COLS if use_market else BATCH_REQUIRED_COLS
+        missing = [c for c in required if c not in df_batch.columns]
         
         if missing:
             st.error(f"Missing columns: {', '.join(missing)}")
         else:
-            results = []
-            for _, row in df_batch.iterrows():
-                expected_miles = max(CURRENT_YEAR - row['year'], 1) * 12000
-                cpm = calculate_cpm(row['retail'], row['year'], CURRENT_YEAR, auto_cpm, manual_cpm)
-                
-                mileage_impact = (expected_miles - row['mileage']) * cpm
-                adj_retail = row['retail'] + mileage_impact
-                
-                max_buy = (adj_retail * (1 - margin_target)) - recon_cost - BUY_FEES
-                room = max_buy - row['appraisal']
-                
-                front_gross = adj_retail - row['appraisal'] - recon_cost - BUY_FEES
-                front_margin = front_gross / adj_retail if adj_retail > 0 else 0
-                total_deal = front_gross + below_line
-                
-                turn_days, source = get_turn_days(row['make'], row['model'])
-                priority = get_priority(turn_days, front_margin)
-                alert = "100K+ CLIFF" if row['mileage'] >= 100000 else "NEAR 100K" if row['mileage'] >= 95000 else ""
-                status = "UNDER BUDGET" if room >= 0 else "OVER BUDGET"
-                
-                results.append({
-                    "Priority": priority, "Alert": alert,
-                    "Year": row['year'], "Make": row['make'], "Model": row['model'], "Mileage": row['mileage'],
-                    "Base Retail": row['retail'], "Mileage Impact": mileage_impact,
-                    "Adjusted Retail": adj_retail, "Max Buy": max_buy, "Room": room,
-                    "Front Gross": front_gross, "Front Margin": front_margin, "Total Deal": total_deal,
-                    "Turn Days": turn_days, "Data Source": source, "Status": status,
-                    "_raw_mi": mileage_impact, "_raw_front": front_gross
-                })
-                
-            res_df = pd.DataFrame(results)
+            if decode_vins:
+                df_batch = cached_stage("decoded", source, lambda: decode_batch(df_batch))
+                checks = df_batch['vin_check'].value_counts()
+                st.caption(f"VIN check: {checks.get('OK', 0)} OK · {checks.get('FILLED', 0)} filled · "
+                           f"{checks.get('MISMATCH', 0)} mismatched · {checks.get('ERROR', 0)} not decoded")
+                if checks.get('MISMATCH', 0):
+                    st.warning("Some rows disagree with the NHTSA decode. Check Make/Model/Year before buying.")
+
+            market, market_key = None, None
+            if use_market:
+                market_key = (source, decode_vins, batch_rad, batch_zip)
+                market = cached_stage("market", market_key, lambda: pull_market(df_batch))
+            store = st.session_state.sales_store
+            prepared = cached_stage("prepared", (source, decode_vins, market_key, store.version, turn_window, rooftop),
+                                    lambda: prepare_batch(df_batch, store, market, window=turn_window, rooftop=rooftop))
+            res_df = price_batch(prepared, settings)
             
             st.subheader("Summary Metrics")
             c1, c2, c3, c4 = st.columns(4)
@@ -461,30 +458,76 @@ with tab3:
             c4.metric("100K+ Alerts", len(res_df[res_df['Alert'] == '100K+ CLIFF']))
             
             c5, c6, c7 = st.columns(3)
-            val_added = res_df[res_df['_raw_mi'] > 0]['_raw_mi'].sum()
-            val_deducted = res_df[res_df['_raw_mi'] < 0]['_raw_mi'].sum()
+            val_added = res_df[res_df['Mileage Impact'] > 0]['Mileage Impact'].sum()
+            val_deducted = res_df[res_df['Mileage Impact'] < 0]['Mileage Impact'].sum()
             c5.metric("Net Mileage Impact", f"${val_added + val_deducted:,.2f}")
-            c6.metric("Total Front Gross", f"${res_df['_raw_front'].sum():,.2f}")
+            c6.metric("Total Front Gross", f"${res_df['Front Gross'].sum():,.2f}")
             c7.metric("Avg Front Margin %", f"{res_df['Front Margin'].mean()*100:.1f}%")
             
-            disp_df = res_df.drop(columns=['_raw_mi', '_raw_front', 'Total Deal']).copy()
-            disp_df['Priority'] = disp_df['Priority'].apply(theme.priority_badge)
-            disp_df['Alert'] = disp_df['Alert'].apply(theme.alert_badge)
-            disp_df['Status'] = disp_df['Status'].apply(theme.status_indicator)
-            
-            disp_df['Mileage'] = disp_df['Mileage'].apply(lambda x: f"{x:,.0f}")
-            for col in ['Base Retail', 'Mileage Impact', 'Adjusted Retail', 'Max Buy', 'Room', 'Front Gross']:
-                disp_df[col] = disp_df[col].apply(lambda x: f"${x:,.2f}")
-            
-            disp_df['Front Margin'] = disp_df['Front Margin'].apply(lambda x: f"{x*100:.1f}%")
-            disp_df['Turn Days'] = disp_df['Turn Days'].apply(lambda x: f"{x:.0f}d")
-            
             st.markdown("### Results Table")
-            st.markdown(disp_df.to_html(escape=False, index=False), unsafe_allow_html=True)
-            
-            csv_df = res_df.drop(columns=['_raw_mi', '_raw_front'])
-            csv_df['Turn Days'] = csv_df['Turn Days'].apply(lambda x: f"{x:.0f}d")
-            csv_df['Front Margin'] = csv_df['Front Margin'].apply(lambda x: f"{x*100:.1f}%")
-            csv = csv_df.to_csv(index=False).encode('utf-8')
-            
-            st.download_button("Download Results CSV", data=csv, file_name="batch_results.csv", mime="text/csv")
+            f1, f2, f3, f4, f5 = st.columns([2, 2, 2, 2, 1])
+            pick_priority = f1.multiselect("Priority", PRIORITY_LEVELS)
+            pick_status = f2.multiselect("Status", STATUS_LEVELS)
+            pick_alert = f3.multiselect("Alert", ALERT_LEVELS)
+            sort_by = f4.selectbox("Sort By", ["Input Order", *SORT_COLUMNS])
+            with f5:
+                st.write("")
+                descending = st.checkbox("Descending", value=sort_by in ("Room", "Front Gross", "Front Margin"))
+
+            # Filtering and sorting are vectorized over the whole batch; only the visible page is formatted and rendered
+            rows = select_rows(res_df, pick_priority, pick_status, pick_alert,
+                               sort_by=None if sort_by == "Input Order" else sort_by, ascending=not descending)
+            p1, p2, p3 = st.columns([1, 1, 4])
+            page_size = p1.selectbox("Rows per Page", PAGE_SIZES, index=1)
+            n_pages = max(1, -(-len(rows) // page_size))
+            view_key = (tuple(pick_priority), tuple(pick_status), tuple(pick_alert), sort_by, descending, page_size, len(res_df))
+            page = p2.number_input(f"Page (of {n_pages:,})", min_value=1, max_value=n_pages, value=1, step=1,
+                                   key=f"results_page_{hash(view_key)}")
+            start = (page - 1) * page_size
+            page_rows = rows[start:start + page_size]
+            filtered = f" (filtered from {len(res_df):,})" if len(rows) != len(res_df) else ""
+            p3.caption(f"Showing {start + 1 if len(page_rows) else 0:,}-{start + len(page_rows):,} of {len(rows):,} rows{filtered}")
+
+            page_html = format_page(res_df.iloc[page_rows], market=use_market).to_html(escape=False, index=False)
+            with span("render"):
+                st.markdown(page_html, unsafe_allow_html=True)
+
+            # The CSV is only built when the button is clicked
+            st.download_button("Download Results CSV", data=lambda: results_csv(res_df), file_name="batch_results.csv", mime="text/csv")
+
+            if st.toggle("What-if Grid", help="Every margin target x recon cost x CPM mode in one pass"):
+                grid = sensitivity_grid(prepared, MARGIN_STEPS, RECON_STEPS, cpm_modes, buy_fees=settings.buy_fees,
+                                        cpm_decay=cpm_decay, cpm_floor=cpm_floor, current_year=settings.current_year)
+                st.markdown("#### Vehicles Under Budget")
+                for col, label, room in zip(st.columns(len(cpm_modes)), cpm_labels, grid.room):
+                    under = (room >= 0).sum(axis=-1)
+                    col.markdown(f"**{label}**")
+                    col.markdown(sensitivity_table(under, lambda x: f"{x:,} / {len(res_df):,}").to_html(), unsafe_allow_html=True)
+
+                st.markdown("#### Break-Even Margin (room hits $0) for Vehicles on This Page")
+                be_df = res_df.iloc[page_rows][['Year', 'Make', 'Model']].copy()
+                be_df['Appraisal'] = [f"${x:,.0f}" for x in prepared.appraisal[page_rows]]
+                for ci, label in enumerate(cpm_labels):
+                    for ri, recon in enumerate(RECON_OPTIONS):
+                        be_df[f"{label} · {recon}"] = ["—" if pd.isna(x) else f"{x*100:.1f}%" for x in grid.break_even_margin[ci, ri, page_rows]]
+                st.markdown(be_df.to_html(index=False), unsafe_allow_html=True)
+
+# ---------------------------------------------------------
+# DIAGNOSTICS
+# ---------------------------------------------------------
+METRICS.end_run()
+run_ms = (time.perf_counter() - run_started) * 1000
+if METRICS_LOG_PATH: METRICS.log_run(METRICS_LOG_PATH, run_timings, rerun_ms=round(run_ms, 3))
+if show_diagnostics:
+    with st.sidebar:
+        st.markdown("### Diagnostics")
+        st.caption(f"Last rerun: {run_ms:,.0f} ms (nested stages overlap)")
+        if run_timings:
+            stage_df = pd.DataFrame(run_timings, columns=["Stage", "seconds"]).groupby("Stage", sort=False)["seconds"].agg(["count", "sum"])
+            stage_df = stage_df.sort_values("sum", ascending=False).rename(columns={"count": "Calls", "sum": "ms"})
+            stage_df["ms"] = (stage_df["ms"] * 1000).map(lambda x: f"{x:,.1f}")
+            st.markdown(stage_df.reset_index().to_html(index=False), unsafe_allow_html=True)
+        cache_rows = [(name, hits, misses, f"{hits / (hits + misses) * 100:.0f}%" if hits + misses else "—")
+                      for name, (hits, misses, _) in METRICS.cache_stats().items()]
+        if cache_rows:
+            st.markdown(pd.DataFrame(cache_rows, columns=["Cache", "Hits", "Misses", "Hit Rate"]).to_html(index=False), unsafe_allow_html=True)
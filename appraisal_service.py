@@ -0,0 +1,471 @@
+"""
+JSON appraisal service for DMS and lot-management integrations. A small asyncio HTTP/1.1
+server (keep-alive, no extra dependencies) in front of `engine.appraise_batch`: concurrent
+requests are coalesced into micro-batches so the vectorized math runs once per batch, and
+VIN decodes and market comps go through one shared VinDecoder and MarketData.
+
+    python appraisal_service.py --port 8710 --sales dms_2025.csv --margin 0.14
+    curl -d '{"year": 2021, "make": "Toyota", "model": "Camry", "mileage": 42000,
+              "retail": 24500, "appraisal": 18000}' localhost:8710/appraise
+
+POST /appraise  one vehicle object, or {"vehicles": [...]} for bulk; either form may add
+                "settings" (AppraisalSettings fields), "market_zip"/"market_radius" to price
+                off market comps, and "decode_vins": true. Returns one result object for a
+                single vehicle, {"results": [...]} for bulk; 400 with {"error": ...} on bad input.
+GET  /stats     request/vehicle/batch counts, p50/p99 latency (ms) and cache hit rates
+GET  /metrics   instrumentation spans and counters in Prometheus text format
+GET  /health
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import NamedTuple
+
+from batch_appraiser import add_settings_args, appraise_chunk, load_turn_data, settings_from_args
+from engine import BATCH_OPTIONAL_COLS, BATCH_REQUIRED_COLS, MODEL_YEAR_MAX, AppraisalSettings
+from instrumentation import METRICS
+
+# ---------------------------------------------------------
+# SETTINGS
+# ---------------------------------------------------------
+SERVICE_HOST = os.environ.get("SERVICE_HOST", "127.0.0.1")
+SERVICE_PORT = int(os.environ.get("SERVICE_PORT") or 8710)
+BATCH_MAX_ROWS = 2048       # a micro-batch closes at this many vehicles...
+BATCH_MAX_WAIT = 0.002      # ...or this many seconds after its first request
+MAX_BODY_BYTES = 16 * 2**20
+MAX_HEADER_BYTES = 64 * 1024
+LATENCY_WINDOW = 10_000     # most recent /appraise latencies behind p50/p99
+
+VEHICLE_FIELDS = BATCH_REQUIRED_COLS + BATCH_OPTIONAL_COLS
+INT_FIELDS = ('year', 'mileage')
+FLOAT_FIELDS = ('retail', 'appraisal')
+FIELD_RANGES = {'year': (1900, MODEL_YEAR_MAX), 'mileage': (0, 2_000_000)}  # inclusive
+SETTING_FIELDS = [f for f in AppraisalSettings._fields if f != 'current_year']
+# (check, what the message says) per numeric setting
+SETTING_RANGES = {
+    'margin_target': (lambda v: 0 <= v < 1, "at least 0 and below 1"),
+    'cpm_decay': (lambda v: 0 < v <= 1, "above 0 and at most 1"),
+    **dict.fromkeys(['recon_cost', 'below_line', 'manual_cpm', 'buy_fees', 'cpm_floor'], (lambda v: v >= 0, "at least 0")),
+}
+OPTION_FIELDS = ('settings', 'market_zip', 'market_radius', 'decode_vins')
+
+REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+           411: "Length Required", 413: "Payload Too Large", 431: "Request Header Fields Too Large",
+           500: "Internal Server Error"}
+
+
+class BadRequest(ValueError):
+    """Invalid request body; the message goes back to the client with a 400."""
+
+
+class BatchKey(NamedTuple):
+    """Requests only share a micro-batch when all of these match."""
+    settings: AppraisalSettings
+    market_zip: object = None
+    market_radius: int = 50
+    decode_vins: bool = False
+
+
+class Job(NamedTuple):
+    key: BatchKey
+    rows: list     # tuples in VEHICLE_FIELDS order
+    future: object
+
+# ---------------------------------------------------------
+# REQUEST PARSING
+# ---------------------------------------------------------
+def parse_number(field, value):
+    """`value` as a finite float; BadRequest naming `field` otherwise."""
+    try: value = float(value)
+    except (TypeError, ValueError): raise BadRequest(f"{field} must be a number, got {value!r}") from None
+    if not math.isfinite(value): raise BadRequest(f"{field} must be finite")
+    return value
+
+def parse_settings(obj, base):
+    if obj is None: return base
+    if not isinstance(obj, dict): raise BadRequest("settings must be an object")
+    unknown = set(obj) - set(SETTING_FIELDS)
+    if unknown: raise BadRequest(f"unknown settings: {', '.join(sorted(unknown))}")
+    if not isinstance(obj.get('use_auto', True), bool): raise BadRequest("use_auto must be true or false")
+    values = {}
+    for field, value in obj.items():
+        if field != 'use_auto':
+            value = parse_number(field, value)
+            check, expected = SETTING_RANGES[field]
+            if not check(value): raise BadRequest(f"{field} must be {expected}, got {value:g}")
+        values[field] = value
+    return base._replace(**values)
+
+def parse_vehicle(obj, required):
+    """One vehicle object as a row tuple; whole numbers for year/mileage, floats for prices."""
+    if not isinstance(obj, dict): raise BadRequest("each vehicle must be an object")
+    missing = [c for c in required if obj.get(c) in (None, "")]
+    if missing: raise BadRequest(f"missing fields: {', '.join(missing)}")
+    row = []
+    for field in VEHICLE_FIELDS:
+        value = obj.get(field)
+        if value in (None, ""):
+            value = None if field in INT_FIELDS or field in FLOAT_FIELDS else ""
+        elif field in INT_FIELDS or field in FLOAT_FIELDS:
+            value = parse_number(field, value)
+            if field in FIELD_RANGES:
+                low, high = FIELD_RANGES[field]
+                if not low <= value <= high: raise BadRequest(f"{field} must be between {low} and {high}, got {value:g}")
+            if field in INT_FIELDS:
+                if not value.is_integer(): raise BadRequest(f"{field} must be a whole number, got {value:g}")
+                value = int(value)
+        else:
+            value = str(value)
+        row.append(value)
+    return tuple(row)
+
+def parse_request(payload, base_settings):
+    """(BatchKey, rows, bulk) for a decoded /appraise body."""
+    if not isinstance(payload, dict): raise BadRequest("body must be a JSON object")
+    bulk = 'vehicles' in payload
+    vehicles = payload['vehicles'] if bulk else [{k: v for k, v in payload.items() if k not in OPTION_FIELDS}]
+    if not isinstance(vehicles, list) or not vehicles: raise BadRequest("vehicles must be a non-empty list")
+
+    market_zip = payload.get('market_zip')
+    try: radius = int(payload.get('market_radius', 50))
+    except (TypeError, ValueError): raise BadRequest("market_radius must be a whole number of miles") from None
+    decode = payload.get('decode_vins', False)
+    if not isinstance(decode, bool): raise BadRequest("decode_vins must be true or false")
+    key = BatchKey(parse_settings(payload.get('settings'), base_settings),
+                   None if market_zip in (None, "") else str(market_zip), radius, decode)
+
+    required = [c for c in BATCH_REQUIRED_COLS if c != 'vin' and not (c == 'retail' and key.market_zip)]
+    if decode: required = ['vin'] + [c for c in required if c not in ('make', 'model', 'year')]
+    return key, [parse_vehicle(v, required) for v in vehicles], bulk
+
+# ---------------------------------------------------------
+# MICRO-BATCHING
+# ---------------------------------------------------------
+def result_name(column):
+    return column.lower().replace(' ', '_')
+
+
+class MicroBatcher:
+    """
+    Coalesces queued Jobs into micro-batches of up to `max_rows` vehicles, waiting at most
+    `max_wait` seconds after the first one, and runs `run(key, [rows, ...])` (returning one
+    JSON array per job) on `executor` for every BatchKey in the batch. At most `workers`
+    batches are in flight; while they are, new jobs queue up and join the next batch.
+    """
+
+    def __init__(self, run, executor, workers, max_rows=BATCH_MAX_ROWS, max_wait=BATCH_MAX_WAIT):
+        self.run = run
+        self.executor = executor
+        self.max_rows = max_rows
+        self.max_wait = max_wait
+        self.queue = asyncio.Queue()
+        self.slots = asyncio.Semaphore(workers)
+        self.batches = 0
+        self.batch_rows = 0
+        self._tasks = set()
+
+    async def submit(self, key, rows):
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put(Job(key, rows, future))
+        return await future
+
+    async def collect(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            jobs = [await self.queue.get()]
+            rows = len(jobs[0].rows)
+            deadline = loop.time() + self.max_wait
+            while rows < self.max_rows:
+                if self.queue.empty():
+                    timeout = deadline - loop.time()
+                    if timeout <= 0: break
+                    try: job = await asyncio.wait_for(self.queue.get(), timeout)
+                    except asyncio.TimeoutError: break
+                else:
+                    job = self.queue.get_nowait()
+                jobs.append(job)
+                rows += len(job.rows)
+
+            groups = {}
+            for job in jobs: groups.setdefault(job.key, []).append(job)
+            for key, group in groups.items():
+                await self.slots.acquire()
+                task = asyncio.create_task(self._run(key, group))
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, key, group):
+        loop = asyncio.get_running_loop()
+        try:
+            self.batches += 1
+            self.batch_rows += sum(len(job.rows) for job in group)
+            METRICS.count("service_batches")
+            try:
+                bodies = await loop.run_in_executor(self.executor, self.run, key, [job.rows for job in group])
+            except Exception:
+                if len(group) == 1: raise
+                # one bad request shouldn't fail its neighbours: retry them one by one
+                bodies = []
+                for job in group:
+                    try: body = (await loop.run_in_executor(self.executor, self.run, key, [job.rows]))[0]
+                    except Exception as e: body = e
+                    bodies.append(body)
+            for job, body in zip(group, bodies):
+                if job.future.done(): continue
+                if isinstance(body, Exception): job.future.set_exception(body)
+                else: job.future.set_result(body)
+        except Exception as e:
+            for job in group:
+                if not job.future.done(): job.future.set_exception(e)
+        finally:
+            self.slots.release()
+
+# ---------------------------------------------------------
+# SERVICE
+# ---------------------------------------------------------
+class AppraisalService:
+    """
+    The appraisal state shared by every request: default settings, dealer turn tables and the
+    rooftop vehicles without one are priced for, and the VinDecoder (with its VinCache/
+    VinPrefixIndex and pooled session) and MarketData cache.
+    """
+
+    def __init__(self, settings=None, dealer_turn_data=None, decoder=None, market_data=None,
+                 workers=2, max_rows=BATCH_MAX_ROWS, max_wait=BATCH_MAX_WAIT, rooftop=None):
+        self.settings = settings or AppraisalSettings()
+        self.dealer_turn_data = dealer_turn_data
+        self.rooftop = rooftop
+        self.decoder = decoder
+        self.market_data = market_data
+        self.workers = workers
+        self.max_rows = max_rows
+        self.max_wait = max_wait
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="appraise")
+        self.batcher = None
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+        self.requests = 0
+        self.vehicles = 0
+        self.errors = 0
+        if decoder is not None and decoder.cache is not None: METRICS.watch_cache("vin_cache", decoder.cache)
+        if decoder is not None: METRICS.watch_cache("vin_prefix_index", decoder.index)
+        if market_data is not None: METRICS.watch_cache("market", market_data.cache)
+
+    def appraise_rows(self, key, row_lists):
+        """Runs on the executor: one appraisal over every job's rows, split back into JSON arrays."""
+        import numpy as np
+        import pandas as pd
+
+        if key.decode_vins and self.decoder is None: raise BadRequest("VIN decoding is not enabled on this service")
+        if key.market_zip and self.market_data is None: raise BadRequest("market pricing is not enabled on this service")
+        chunk = pd.DataFrame.from_records([row for rows in row_lists for row in rows], columns=VEHICLE_FIELDS)
+        if key.decode_vins:
+            from vin_decoder import apply_decodes
+            chunk = apply_decodes(chunk, self.decoder.decode_many(chunk['vin']))
+        market = None
+        if key.market_zip:
+            from market_data import market_stats
+            if chunk['zip'].eq("").all(): chunk = chunk.drop(columns='zip')
+            else: chunk['zip'] = chunk['zip'].mask(chunk['zip'].eq(""), key.market_zip)
+            market = market_stats(chunk, self.market_data, key.market_radius, key.market_zip)
+        res_df = appraise_chunk(chunk, key.settings, self.dealer_turn_data, market, self.rooftop)
+        res_df.columns = [result_name(c) for c in res_df.columns]
+        # float32 columns (turn/market days, margin) as their shortest decimal, not 38.6399993896
+        for col in res_df.columns[res_df.dtypes == np.float32]:
+            res_df[col] = res_df[col].to_numpy().astype(str).astype(np.float64)
+        # one serialization for the whole batch; JSON lines split safely on the newlines
+        records = res_df.to_json(orient='records', lines=True).splitlines()
+        bodies, start = [], 0
+        for rows in row_lists:
+            bodies.append('[' + ','.join(records[start:start + len(rows)]) + ']')
+            start += len(rows)
+        return bodies
+
+    async def appraise(self, body):
+        try: payload = json.loads(body)
+        except (ValueError, UnicodeDecodeError) as e: raise BadRequest(f"invalid JSON: {e}") from None
+        key, rows, bulk = parse_request(payload, self.settings)
+        records = await self.batcher.submit(key, rows)
+        self.vehicles += len(rows)
+        METRICS.count("service_vehicles", len(rows))
+        return '{"results": ' + records + '}' if bulk else records[1:-1]
+
+    def stats(self):
+        latencies = sorted(self.latencies)
+
+        def percentile(q):
+            if not latencies: return None
+            return round(latencies[min(int(q * len(latencies)), len(latencies) - 1)] * 1000, 3)
+
+        batches = self.batcher.batches if self.batcher else 0
+        return {
+            "requests": self.requests, "vehicles": self.vehicles, "errors": self.errors,
+            "batches": batches, "mean_batch_vehicles": round(self.batcher.batch_rows / batches, 1) if batches else None,
+            "p50_ms": percentile(0.50), "p99_ms": percentile(0.99), "latency_window": len(latencies),
+            "caches": {name: {"hits": h, "misses": m, "entries": n} for name, (h, m, n) in METRICS.cache_stats().items()},
+        }
+
+    async def route(self, method, path, body):
+        """(status, content type, body text) for one request."""
+        routes = {"/appraise": "POST", "/stats": "GET", "/metrics": "GET", "/health": "GET"}
+        if path not in routes: return 404, "application/json", json.dumps({"error": f"no route {path}"})
+        if method != routes[path]: return 405, "application/json", json.dumps({"error": f"{path} takes {routes[path]}"})
+        if path == "/appraise":
+            self.requests += 1
+            METRICS.count("service_requests")
+            try:
+                return 200, "application/json", await self.appraise(body)
+            except BadRequest as e:
+                self.errors += 1
+                return 400, "application/json", json.dumps({"error": str(e)})
+        if path == "/stats": return 200, "application/json", json.dumps(self.stats())
+        if path == "/metrics": return 200, "text/plain; version=0.0.4; charset=utf-8", METRICS.prometheus_text()
+        return 200, "application/json", '{"status": "ok"}'
+
+    async def handle(self, reader, writer):
+        """One client connection; serves requests until the client closes or asks to."""
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b"\r\n\r\n")
+                except (asyncio.IncompleteReadError, ConnectionError):
+                    break
+                except asyncio.LimitOverrunError:
+                    await self._respond(writer, 431, "application/json", '{"error": "headers too large"}', False)
+                    break
+                start = time.perf_counter()
+                request_line, *header_lines = head.decode("latin-1").split("\r\n")
+                try:
+                    method, target, version = request_line.split(" ", 2)
+                    headers = {}
+                    for line in header_lines:
+                        if line:
+                            name, _, value = line.partition(":")
+                            headers[name.strip().lower()] = value.strip()
+                    length = int(headers.get("content-length") or 0)
+                except ValueError:
+                    await self._respond(writer, 400, "application/json", '{"error": "malformed request"}', False)
+                    break
+                if "transfer-encoding" in headers:
+                    await self._respond(writer, 411, "application/json", '{"error": "send a Content-Length"}', False)
+                    break
+                if length > MAX_BODY_BYTES:
+                    await self._respond(writer, 413, "application/json", '{"error": "body too large"}', False)
+                    break
+                body = await reader.readexactly(length) if length else b""
+                path = target.split("?", 1)[0]
+                try:
+                    status, content_type, text = await self.route(method, path, body)
+                except Exception:
+                    traceback.print_exc()
+                    self.errors += 1
+                    status, content_type, text = 500, "application/json", '{"error": "internal error"}'
+                keep_alive = version == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+                await self._respond(writer, status, content_type, text, keep_alive)
+                if path == "/appraise":
+                    elapsed = time.perf_counter() - start
+                    self.latencies.append(elapsed)
+                    METRICS.observe("service_request", elapsed)
+                if not keep_alive: break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    async def _respond(writer, status, content_type, text, keep_alive):
+        body = text.encode()
+        writer.write(f"HTTP/1.1 {status} {REASONS[status]}\r\nContent-Type: {content_type}\r\n"
+                     f"Content-Length: {len(body)}\r\nConnection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+                     .encode("latin-1") + body)
+        await writer.drain()
+
+    async def start(self, host=SERVICE_HOST, port=SERVICE_PORT):
+        """Starts listening and batching on the running loop; returns the asyncio Server."""
+        self.batcher = MicroBatcher(self.appraise_rows, self.executor, self.workers, self.max_rows, self.max_wait)
+        self._collector = asyncio.create_task(self.batcher.collect())
+        return await asyncio.start_server(self.handle, host, port, limit=MAX_HEADER_BYTES)
+
+    async def close(self):
+        self._collector.cancel()
+        await asyncio.gather(self._collector, return_exceptions=True)
+
+    async def serve(self, host=SERVICE_HOST, port=SERVICE_PORT):
+        server = await self.start(host, port)
+        print(f"Appraisal service on http://{host}:{server.sockets[0].getsockname()[1]}", file=sys.stderr)
+        try:
+            async with server: await server.serve_forever()
+        finally:
+            await self.close()
+
+
+def start_background(service, host="127.0.0.1", port=0):
+    """Runs `service` on its own event loop thread; returns (stop, base_url)."""
+    loop = asyncio.new_event_loop()
+    started = []
+    ready = threading.Event()
+
+    def run():
+        asyncio.set_event_loop(loop)
+        started.append(loop.run_until_complete(service.start(host, port)))
+        ready.set()
+        loop.run_forever()
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    ready.wait()
+
+    async def shutdown():
+        started[0].close()
+        await service.close()
+
+    def stop():
+        asyncio.run_coroutine_threadsafe(shutdown(), loop).result()
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+
+    return stop, f"http://{host}:{started[0].sockets[0].getsockname()[1]}"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve appraisals as JSON over HTTP.")
+    parser.add_argument("--host", default=SERVICE_HOST)
+    parser.add_argument("--port", type=int, default=SERVICE_PORT)
+    add_settings_args(parser)
+    parser.add_argument("--workers", type=int, default=2, help="micro-batches appraised concurrently")
+    parser.add_argument("--batch-rows", type=int, default=BATCH_MAX_ROWS, help="vehicles per micro-batch")
+    parser.add_argument("--batch-wait-ms", type=float, default=BATCH_MAX_WAIT * 1000,
+                        help="how long a micro-batch waits for more requests")
+    parser.add_argument("--vin-threads", type=int, default=4, help="concurrent NHTSA requests")
+    parser.add_argument("--nhtsa-url", help="vPIC base URL (e.g. the local stub in benchmarks/nhtsa_stub.py)")
+    args = parser.parse_args(argv)
+
+    from market_data import MarketData
+    from vin_cache import VinCache
+    from vin_decoder import NHTSA_BASE_URL, VinDecoder
+    from vin_offline import VinPrefixIndex
+
+    turn_data = load_turn_data(args.sales, args.store, window=args.turn_window)
+    print(f"Turn days: {'YOUR Data (%d models)' % len(turn_data) if turn_data else 'Industry Averages'}", file=sys.stderr)
+    cache = VinCache()
+    decoder = VinDecoder(base_url=args.nhtsa_url or NHTSA_BASE_URL, max_workers=args.vin_threads,
+                         cache=cache, index=VinPrefixIndex.from_decodes(cache.iter_decodes()))
+    service = AppraisalService(settings_from_args(args), turn_data, decoder, MarketData(), workers=args.workers,
+                               max_rows=args.batch_rows, max_wait=args.batch_wait_ms / 1000, rooftop=args.rooftop)
+    try:
+        asyncio.run(service.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        decoder.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,238 @@
+"""
+Overnight batch appraisals from the command line. Streams the input in chunks through
+`engine.appraise_batch` and appends each chunk's results to a CSV or Parquet file, so memory
+stays flat however many rows there are.
+
+    python batch_appraiser.py appraisals.csv results.parquet --sales dms_2024.csv --sales dms_2025.xlsx
+"""
+import argparse
+import os
+import sys
+import time
+from functools import partial
+
+from engine import (BATCH_MARKET_REQUIRED_COLS, BATCH_REQUIRED_COLS, TURN_WINDOWS, AppraisalSettings, appraise_batch,
+                    batch_usecols)
+from parallel import ordered_map
+
+BATCH_CHUNK_ROWS = 100_000
+
+
+def read_batch_chunks(path, chunksize=BATCH_CHUNK_ROWS):
+    """Yields the appraisal file `chunksize` rows at a time with normalized lower-case column names."""
+    import pandas as pd
+
+    ext = os.path.splitext(path)[1].lower()
+    if ext == '.parquet':
+        import pyarrow.parquet as pq
+        chunks = (batch.to_pandas() for batch in pq.ParquetFile(path).iter_batches(batch_size=chunksize))
+    elif ext in ('.xlsx', '.xls'):
+        # workbooks can't be read in chunks; parse the used columns once (or reuse the cached
+        # conversion, see excel_ingest), then slice
+        from excel_ingest import read_workbook
+        with open(path, 'rb') as f: df = read_workbook(f.read(), batch_usecols, "batch")
+        chunks = (df.iloc[start:start + chunksize] for start in range(0, len(df), chunksize))
+    else:
+        chunks = pd.read_csv(path, chunksize=chunksize)
+    for chunk in chunks:
+        chunk.columns = [str(c).lower().strip() for c in chunk.columns]
+        yield chunk
+
+
+# Sinks split output into `encode` (a pure function of one result chunk, so it can run in a
+# worker process) and `write` (appends encoded chunks in order)
+class CsvSink:
+    def __init__(self, path):
+        self.file = open(path, 'w', newline='', encoding='utf-8')
+
+    @staticmethod
+    def encode(df, first):
+        return df.to_csv(index=False, header=first)
+
+    def write(self, text):
+        self.file.write(text)
+
+    def close(self):
+        self.file.close()
+
+
+class ParquetSink:
+    """
+    One row group per chunk; later chunks are cast to the first chunk's schema. Categorical
+    columns are written as int32 dictionaries so every chunk has the same index width.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.writer = None
+
+    @staticmethod
+    def encode(df, first):
+        import pyarrow as pa
+
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        schema = pa.schema([field.with_type(pa.dictionary(pa.int32(), field.type.value_type))
+                            if pa.types.is_dictionary(field.type) else field for field in table.schema],
+                           metadata=table.schema.metadata)
+        return table.cast(schema)
+
+    def write(self, table):
+        import pyarrow.parquet as pq
+
+        if self.writer is None:
+            self.writer = pq.ParquetWriter(self.path, table.schema)
+        elif table.schema != self.writer.schema:
+            table = table.cast(self.writer.schema)
+        self.writer.write_table(table)
+
+    def close(self):
+        if self.writer is not None: self.writer.close()
+
+
+def open_sink(path):
+    return ParquetSink(path) if path.lower().endswith('.parquet') else CsvSink(path)
+
+
+def load_turn_data(sales_logs=(), store_path=None, workers=1, window='all'):
+    """
+    Dealer turn tables over `window` (see engine.TURN_WINDOWS) from a saved sales store and/or
+    DMS sales logs, merged with deal dedupe: engine.RooftopTables of the group and each rooftop.
+    """
+    from sales_ingest import RooftopSales, merge_upload
+
+    store = RooftopSales.load(store_path) if store_path else RooftopSales()
+    for log in sales_logs:
+        with open(log, 'rb') as f:
+            merge_upload(store, f.read(), os.path.basename(log), workers=workers)
+    return store.turn_table(window)
+
+
+def appraise_chunk(chunk, settings, dealer_turn_data=None, market=None, rooftop=None):
+    """`appraise_batch` on one input chunk, shaped for output: VIN first, VIN Check last when decoded."""
+    res_df = appraise_batch(chunk, settings, dealer_turn_data=dealer_turn_data, market=market, rooftop=rooftop)
+    res_df.insert(0, 'VIN', chunk['vin'].to_numpy())
+    if 'vin_check' in chunk.columns: res_df['VIN Check'] = chunk['vin_check'].to_numpy()
+    return res_df
+
+def _appraise_and_encode(task, settings, dealer_turn_data, encode, rooftop=None):
+    first, chunk, market = task
+    return len(chunk), encode(appraise_chunk(chunk, settings, dealer_turn_data, market, rooftop), first)
+
+
+def run_batch(input_path, output_path, settings, dealer_turn_data=None, chunksize=BATCH_CHUNK_ROWS,
+              decoder=None, market=None, progress=None, workers=1, rooftop=None):
+    """
+    Appraises `input_path` chunk by chunk into `output_path`. `decoder` (a VinDecoder) fills
+    and checks make/model/year per chunk; `market` is (MarketData, radius, zip_code) to price
+    off market comps; `rooftop` is whose turn days rows without a rooftop column use.
+    `progress(rows, seconds)` is called after every chunk.
+    With workers > 1, appraisal and output encoding run in a process pool while this process
+    reads, decodes and writes; chunks are written in input order, so the output is identical.
+    Returns (rows, seconds); raises sales_ingest.MissingColumnsError on a bad header.
+    """
+    from sales_ingest import MissingColumnsError
+
+    required = BATCH_MARKET_REQUIRED_COLS if market else BATCH_REQUIRED_COLS
+
+    def tasks():
+        for i, chunk in enumerate(read_batch_chunks(input_path, chunksize)):
+            missing = [c for c in required if c not in chunk.columns]
+            if missing: raise MissingColumnsError(f"Missing columns: {', '.join(missing)}")
+            if decoder is not None:
+                from vin_decoder import apply_decodes
+                chunk = apply_decodes(chunk, decoder.decode_many(chunk['vin']))
+            stats = None
+            if market:
+                from market_data import market_stats
+                stats = market_stats(chunk, *market)
+            yield i == 0, chunk, stats
+
+    sink = open_sink(output_path)
+    work = partial(_appraise_and_encode, settings=settings, dealer_turn_data=dealer_turn_data, encode=sink.encode,
+                   rooftop=rooftop)
+    rows, start = 0, time.perf_counter()
+    try:
+        for n, payload in ordered_map(work, tasks(), workers):
+            sink.write(payload)
+            rows += n
+            if progress: progress(rows, time.perf_counter() - start)
+    finally:
+        sink.close()
+    return rows, time.perf_counter() - start
+
+
+def report_progress(rows, seconds):
+    print(f"\r{rows:>12,} rows  {rows / max(seconds, 1e-9):>10,.0f} rows/s", end="", file=sys.stderr, flush=True)
+
+
+def add_settings_args(parser):
+    """The AppraisalSettings and turn data flags shared by the command-line tools."""
+    defaults = AppraisalSettings()
+    parser.add_argument("--margin", type=float, default=defaults.margin_target, help="margin target, e.g. 0.12")
+    parser.add_argument("--recon", type=float, default=defaults.recon_cost)
+    parser.add_argument("--below-line", type=float, default=defaults.below_line)
+    parser.add_argument("--manual-cpm", type=float, help="flat CPM instead of auto CPM by price")
+    parser.add_argument("--buy-fees", type=float, default=defaults.buy_fees)
+    parser.add_argument("--cpm-decay", type=float, default=defaults.cpm_decay, help="yearly CPM taper, e.g. 0.85")
+    parser.add_argument("--cpm-floor", type=float, default=defaults.cpm_floor, help="lowest CPM after the taper")
+    parser.add_argument("--sales", action="append", default=[], metavar="LOG",
+                        help="DMS sales log for turn days (repeatable; deals are deduped across logs)")
+    parser.add_argument("--store", default=os.environ.get("SALES_STORE_PATH"), help="saved sales store to start from")
+    parser.add_argument("--turn-window", choices=TURN_WINDOWS, default="all",
+                        help="sales history turn days come from: all deals, trailing 30/90/365 days, or recency-weighted")
+    parser.add_argument("--rooftop", help="store whose turn days to use for vehicles without a rooftop field "
+                                          "(default: the whole group's)")
+
+def settings_from_args(args):
+    defaults = AppraisalSettings()
+    return AppraisalSettings(
+        margin_target=args.margin, recon_cost=args.recon, below_line=args.below_line,
+        use_auto=args.manual_cpm is None,
+        manual_cpm=defaults.manual_cpm if args.manual_cpm is None else args.manual_cpm,
+        buy_fees=args.buy_fees, cpm_decay=args.cpm_decay, cpm_floor=args.cpm_floor,
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Appraise a batch file (CSV, Excel or Parquet) into CSV or Parquet.")
+    parser.add_argument("input", help="appraisals with columns: " + ", ".join(BATCH_REQUIRED_COLS))
+    parser.add_argument("output", help="results file; .parquet writes Parquet, anything else CSV")
+    add_settings_args(parser)
+    parser.add_argument("--decode-vins", action="store_true", help="fill/check make, model and year via NHTSA")
+    parser.add_argument("--market-zip", help="price off market comps around this zip code")
+    parser.add_argument("--market-radius", type=int, default=50)
+    parser.add_argument("--chunksize", type=int, default=BATCH_CHUNK_ROWS)
+    parser.add_argument("--workers", type=int, default=1, help="processes for appraisal and sales log parsing")
+    parser.add_argument("--vin-threads", type=int, default=4, help="concurrent NHTSA requests")
+    args = parser.parse_args(argv)
+
+    settings = settings_from_args(args)
+    turn_data = load_turn_data(args.sales, args.store, args.workers, args.turn_window)
+    print(f"Turn days: {'YOUR Data (%d models)' % len(turn_data) if turn_data else 'Industry Averages'}", file=sys.stderr)
+
+    decoder = None
+    if args.decode_vins:
+        from vin_cache import VinCache
+        from vin_decoder import VinDecoder
+        from vin_offline import VinPrefixIndex
+        cache = VinCache()
+        decoder = VinDecoder(max_workers=args.vin_threads, cache=cache, index=VinPrefixIndex.from_decodes(cache.iter_decodes()))
+    market = None
+    if args.market_zip:
+        from market_data import MarketData
+        market = (MarketData(), args.market_radius, args.market_zip)
+
+    from sales_ingest import MissingColumnsError
+    try:
+        rows, seconds = run_batch(args.input, args.output, settings, turn_data, args.chunksize,
+                                  decoder=decoder, market=market, progress=report_progress, workers=args.workers,
+                                  rooftop=args.rooftop)
+    except MissingColumnsError as e:
+        parser.error(str(e))
+    finally:
+        if decoder is not None: decoder.close()
+    print(f"\nWrote {rows:,} rows to {args.output} in {seconds:.1f}s ({rows / max(seconds, 1e-9):,.0f} rows/s)", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""
+Batch appraisal throughput: vectorized `appraise_batch` vs. the row-at-a-time loop.
+
+    python benchmarks/bench_batch.py [--sizes 10000 100000 1000000] [--scalar-rows 20000]
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from engine import CURRENT_YEAR, AppraisalSettings, appraise_batch, appraise_market, appraise_row  # noqa: E402
+
+MODELS = [("Hyundai", "Tucson"), ("Hyundai", "Santa Fe"), ("Toyota", "Camry"), ("Toyota", "RAV4"),
+          ("Honda", "Accord"), ("Kia", "Sportage"), ("Nissan", "Rogue"), ("Genesis", "GV70"),
+          ("Ford", "F-150"), ("Chevrolet", "Equinox"), ("Jeep", "Wrangler"), ("Subaru", "Outback")]
+
+SETTINGS = AppraisalSettings(margin_target=0.12, recon_cost=1500.0, below_line=1200, use_auto=True, manual_cpm=0.15)
+
+
+def make_appraisals(n, seed=7):
+    rng = np.random.default_rng(seed)
+    pick = rng.integers(0, len(MODELS), n)
+    year = rng.integers(CURRENT_YEAR - 15, CURRENT_YEAR + 1, n)
+    retail = rng.uniform(6000, 95000, n).round(0)
+    return pd.DataFrame({
+        "vin": [f"BENCH{i:012d}" for i in range(n)],
+        "year": year,
+        "make": np.array([m for m, _ in MODELS], dtype=object)[pick],
+        "model": np.array([m for _, m in MODELS], dtype=object)[pick],
+        "mileage": rng.integers(0, 180000, n),
+        "retail": retail,
+        "appraisal": (retail * rng.uniform(0.55, 0.95, n)).round(0),
+    })
+
+
+def with_missing(df):
+    """`df` with a blank retail, a blank year and a blank mileage row appended, as uploads have them."""
+    blanks = df.iloc[:3].copy()
+    blanks.iloc[0, blanks.columns.get_loc("retail")] = np.nan
+    blanks.iloc[1, blanks.columns.get_loc("year")] = np.nan
+    blanks.iloc[2, blanks.columns.get_loc("mileage")] = np.nan
+    return pd.concat([df, blanks], ignore_index=True)
+
+
+def scalar_batch(df, dealer_turn_data):
+    return pd.DataFrame([appraise_row(row, SETTINGS, dealer_turn_data=dealer_turn_data) for _, row in df.iterrows()])
+
+
+def check_parity(df, dealer_turn_data):
+    expected = scalar_batch(df, dealer_turn_data)
+    actual = appraise_batch(df, SETTINGS, dealer_turn_data=dealer_turn_data)
+    assert list(expected.columns) == list(actual.columns), "column mismatch"
+    for col in expected.columns:
+        if pd.api.types.is_numeric_dtype(expected[col]):
+            # compared at the result's precision (float32 columns round the float64 reference)
+            np.testing.assert_array_equal(expected[col].to_numpy(dtype=actual[col].dtype), actual[col].to_numpy(), err_msg=col)
+        else:
+            assert (expected[col].to_numpy() == actual[col].to_numpy()).all(), f"mismatch in {col}"
+
+
+def check_market(df, seed=5):
+    """Market mode against `appraise_market` row by row; every fifth row has no comps and must not read as a buy."""
+    rng = np.random.default_rng(seed)
+    market = pd.DataFrame({"market_price": rng.uniform(6000, 95000, len(df)).round(0),
+                           "market_odometer": rng.integers(0, 180000, len(df)).astype(float),
+                           "market_days": rng.uniform(10, 90, len(df))}, index=df.index)
+    market.iloc[::5] = np.nan
+    actual = appraise_batch(df, SETTINGS, market=market)
+    expected = [appraise_market(m.market_price, m.market_odometer, row.mileage, row.year, SETTINGS)[3]
+                for row, m in zip(df.itertuples(), market.itertuples())]
+    np.testing.assert_allclose(actual["Max Buy"].to_numpy(), expected, rtol=1e-12, err_msg="market Max Buy")
+    assert (actual["Status"].to_numpy()[::5] == "OVER BUDGET").all(), "rows without comps priced as buys"
+
+
+def timed(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--scalar-rows", type=int, default=20_000, help="rows to time through the iterrows path")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    dealer_turn_data = {"toyota_camry": 21.5, "honda_accord": 64.0, "kia_sportage": 48.25}
+    check_parity(with_missing(make_appraisals(2_000, seed=1)), dealer_turn_data)
+    print("parity: vectorized output matches appraise_row on 2,000 rows plus rows with blanks")
+    check_market(make_appraisals(500, seed=2).drop(columns="retail"))
+    print("parity: market mode matches appraise_market; rows without comps are OVER BUDGET")
+
+    df = make_appraisals(args.scalar_rows)
+    secs = timed(lambda: scalar_batch(df, dealer_turn_data), 1)
+    print(f"{'iterrows':>10} {args.scalar_rows:>10,} rows {secs:8.3f}s {args.scalar_rows / secs:>14,.0f} rows/s")
+
+    for n in args.sizes:
+        df = make_appraisals(n)
+        secs = timed(lambda: appraise_batch(df, SETTINGS, dealer_turn_data=dealer_turn_data), args.repeat)
+        print(f"{'columnar':>10} {n:>10,} rows {secs:8.3f}s {n / secs:>14,.0f} rows/s")
+
+
+if __name__ == "__main__":
+    main()
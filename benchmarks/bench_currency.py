@@ -0,0 +1,70 @@
+"""
+Currency parsing: `parse_currency_column` vs. `Series.apply(parse_currency)` on DMS-style columns.
+
+    python benchmarks/bench_currency.py [--rows 400000]
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from sales_ingest import parse_currency, parse_currency_column  # noqa: E402
+
+EDGE_CASES = ["(1,234.56)", "-$500", "-", "", "  $ 12 ", None, "N/A", "1.2.3", "$.5", "(  )", "--5", "USD 1,000"]
+
+
+def make_currency_column(n, seed=3):
+    rng = np.random.default_rng(seed)
+    amounts = rng.normal(1500, 3000, n).round(2)
+    shape = rng.integers(0, 6, n)
+    cells = np.empty(n, dtype=object)
+    for i, (v, k) in enumerate(zip(amounts, shape)):
+        if k == 0: cells[i] = f"${v:,.2f}"
+        elif k == 1: cells[i] = f"({abs(v):,.2f})" if v < 0 else f"{v:,.2f}"
+        elif k == 2: cells[i] = f"-${abs(v):,.2f}" if v < 0 else f"${v:.2f}"
+        elif k == 3: cells[i] = str(v)
+        elif k == 4: cells[i] = "-" if v < 0 else ""
+        else: cells[i] = None
+    cells[:len(EDGE_CASES)] = EDGE_CASES
+    return pd.Series(cells).astype("str"), pd.Series(cells, dtype=object)
+
+
+def same(a, b):
+    a, b = np.asarray(a, dtype=float), np.asarray(b, dtype=float)
+    return np.array_equal(a, b) and np.array_equal(np.signbit(a), np.signbit(b))
+
+
+def best_of(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=400_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    text_col, object_col = make_currency_column(args.rows)
+    numeric_col = pd.Series(np.random.default_rng(5).normal(1500, 3000, args.rows).round(2))
+    numeric_col.iloc[:4] = [np.nan, -0.0, 1e-05, 3e17]
+
+    for label, col in [("text", text_col), ("object", object_col), ("numeric", numeric_col)]:
+        expected = col.apply(parse_currency)
+        assert same(parse_currency_column(col), expected), f"{label}: results differ from parse_currency"
+        slow = best_of(lambda: col.apply(parse_currency), 1)
+        fast = best_of(lambda: parse_currency_column(col), args.repeat)
+        print(f"{label:>8} {args.rows:>9,} cells  apply {slow:7.3f}s  column {fast:7.3f}s  "
+              f"{args.rows / fast:>13,.0f} cells/s  x{slow / fast:.1f}")
+
+
+if __name__ == "__main__":
+    main()
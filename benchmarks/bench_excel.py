@@ -0,0 +1,115 @@
+"""
+Excel ingestion: the old `pd.read_excel` path against excel_ingest on a DMS-style sales log
+and an appraisal workbook, each padded with columns the appraisal never reads. Times the
+first (streaming) parse, a reload from the Parquet cache in a fresh process-like cache, and a
+memory hit, and checks every result against `pd.read_excel(usecols=..., dtype=...)`.
+
+    python benchmarks/bench_excel.py [--rows 100000] [--extra-cols 20] [--keep DIR]
+"""
+import argparse
+import io
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from bench_batch import make_appraisals  # noqa: E402
+from bench_parallel import make_sales_log  # noqa: E402
+from engine import batch_usecols  # noqa: E402
+from excel_ingest import WorkbookCache, parse_workbook  # noqa: E402
+from sales_ingest import DEAL_ID_COLS, SALES_DTYPES, ingest_sales, sales_usecols  # noqa: E402
+
+SALES_READ_DTYPES = {**SALES_DTYPES, **dict.fromkeys(DEAL_ID_COLS, str)}
+
+
+def pad_columns(df, n, seed=3):
+    """`df` plus `n` columns of the kind DMS exports carry (names, stock numbers, notes, amounts)."""
+    rng = np.random.default_rng(seed)
+    extra = {}
+    for i in range(n):
+        kind = i % 3
+        if kind == 0: extra[f"Note {i}"] = rng.choice(["Clean Carfax", "1 owner", "Needs tires", ""], len(df))
+        elif kind == 1: extra[f"Amount {i}"] = rng.normal(500, 200, len(df)).round(2)
+        else: extra[f"Ref {i}"] = rng.integers(10_000, 99_999, len(df))
+    return pd.concat([df, pd.DataFrame(extra, index=df.index)], axis=1)
+
+
+def write_workbook(df, path):
+    """Writes `df` the way openpyxl-based DMS exporters do (streamed, one sheet)."""
+    from openpyxl import Workbook
+
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("Export")
+    ws.append(list(df.columns))
+    for row in df.itertuples(index=False):
+        ws.append([None if isinstance(v, float) and v != v else v.item() if hasattr(v, "item") else v for v in row])
+    wb.save(path)
+
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - start
+
+
+def compare(label, data, select, dtype, tmp):
+    """Times each path on one workbook and checks them all against pd.read_excel."""
+    def old():
+        header = list(pd.read_excel(io.BytesIO(data), nrows=0).columns)
+        return pd.read_excel(io.BytesIO(data), usecols=select(header), dtype=dtype)
+
+    expected, t_old = timed(old)
+    parsed, t_parse = timed(lambda: parse_workbook(data, select, dtype))
+    cache_dir = os.path.join(tmp, f"cache_{label}")
+    WorkbookCache(directory=cache_dir).get_or_parse(data, select, label, dtype)  # first load writes Parquet
+    fresh = WorkbookCache(directory=cache_dir)
+    from_disk, t_disk = timed(lambda: fresh.get_or_parse(data, select, label, dtype))
+    from_memory, t_memory = timed(lambda: fresh.get_or_parse(data, select, label, dtype))
+    for result in (parsed, from_disk, from_memory):
+        pd.testing.assert_frame_equal(expected, result)
+
+    rows = len(expected)
+    print(f"{label}: {rows:,} rows, {len(expected.columns)} of {len(pd.read_excel(io.BytesIO(data), nrows=0).columns)} "
+          f"columns read, {len(data) / 2**20:.1f} MB")
+    for name, secs in [("pd.read_excel", t_old), ("streamed parse", t_parse),
+                       ("Parquet cache", t_disk), ("memory cache", t_memory)]:
+        print(f"  {name:<15} {secs:8.3f}s  {rows / secs:>12,.0f} rows/s  x{t_old / secs:,.1f}")
+    return t_old
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--extra-cols", type=int, default=20, help="unused columns added to each workbook")
+    parser.add_argument("--keep", metavar="DIR", help="write the workbooks here and reuse them on later runs")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        directory = args.keep or tmp
+        os.makedirs(directory, exist_ok=True)
+        paths = {}
+        for label, make in [("sales", make_sales_log), ("batch", make_appraisals)]:
+            path = paths[label] = os.path.join(directory, f"{label}_{args.rows}x{args.extra_cols}.xlsx")
+            if not os.path.exists(path):
+                _, secs = timed(lambda: write_workbook(pad_columns(make(args.rows), args.extra_cols), path))
+                print(f"wrote {path} in {secs:.1f}s")
+
+        with open(paths["sales"], "rb") as f: sales = f.read()
+        with open(paths["batch"], "rb") as f: batch = f.read()
+        compare("sales", sales, sales_usecols, SALES_READ_DTYPES, tmp)
+        compare("batch", batch, batch_usecols, None, tmp)
+
+        # end to end: the whole sales ingest, where the read used to dominate
+        for run in ("first load", "same file again"):
+            _, secs = timed(lambda: ingest_sales(io.BytesIO(sales), "sales.xlsx"))
+            print(f"ingest_sales, {run}: {secs:.3f}s")
+    print("parity: every path matches pd.read_excel")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+Parallel batch appraisal and sales ingest: throughput at several worker counts, checking
+that every run writes exactly what the single-process run writes.
+
+    python benchmarks/bench_parallel.py [--rows 1000000] [--workers 1 4 16]
+"""
+import argparse
+import filecmp
+import io
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from batch_appraiser import run_batch  # noqa: E402
+from bench_batch import SETTINGS, make_appraisals  # noqa: E402
+from sales_ingest import ingest_sales  # noqa: E402
+
+
+def make_sales_log(n, seed=11):
+    rng = np.random.default_rng(seed)
+    received = pd.Timestamp("2024-01-01") + pd.to_timedelta(rng.integers(0, 365, n), unit="D")
+    sold = received + pd.to_timedelta(rng.integers(-5, 120, n), unit="D")
+    gross = rng.normal(1500, 2500, n).round(2)
+    return pd.DataFrame({
+        "Deal #": np.arange(n),
+        "Sold Date": sold.strftime("%m/%d/%Y"), "Received Date": received.strftime("%m/%d/%Y"),
+        "Make": rng.choice(["Hyundai", "Toyota", "Kia", "Honda"], n), "Model": rng.choice(["Tucson", "Camry", "Sportage", "Accord"], n),
+        "Front Gross": [f"(${-g:,.2f})" if g < 0 else f"${g:,.2f}" for g in gross],
+        "Total Gross": [f"${g + 900:,.2f}" for g in gross],
+        "Deal Type": rng.choice(["Retail", "Wholesale"], n, p=[0.8, 0.2]),
+        "Sold Price": "$20,000",
+    })
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--sales-rows", type=int, default=500_000)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--chunksize", type=int, default=50_000)
+    args = parser.parse_args()
+    print(f"{os.cpu_count()} CPUs available")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        source = os.path.join(tmp, "appraisals.csv")
+        make_appraisals(args.rows).to_csv(source, index=False)
+        for ext in ["parquet", "csv"]:
+            baseline = None
+            for workers in args.workers:
+                out = os.path.join(tmp, f"out_{workers}.{ext}")
+                rows, secs = run_batch(source, out, SETTINGS, chunksize=args.chunksize, workers=workers)
+                if baseline is None:
+                    baseline = (out, secs)
+                elif ext == "csv":
+                    assert filecmp.cmp(baseline[0], out, shallow=False), f"{workers} workers: CSV differs"
+                else:
+                    pd.testing.assert_frame_equal(pd.read_parquet(baseline[0]), pd.read_parquet(out))
+                print(f"appraise->{ext:<8} {workers:>3} workers {rows:>10,} rows  {secs:7.2f}s  "
+                      f"{rows / secs:>10,.0f} rows/s  x{baseline[1] / secs:.2f}")
+
+        log = make_sales_log(args.sales_rows).to_csv(index=False).encode()
+        baseline = None
+        for workers in args.workers:
+            start = time.perf_counter()
+            agg = ingest_sales(io.BytesIO(log), "sales.csv", chunksize=args.chunksize, workers=workers)
+            secs = time.perf_counter() - start
+            if baseline is None:
+                baseline = (agg, secs)
+            else:
+                expected, got = baseline[0].summary, agg.summary
+                pd.testing.assert_frame_equal(expected['breakdown'], got['breakdown'])
+                assert (expected['total_sales'], expected['t_front']) == (got['total_sales'], got['t_front'])
+            print(f"sales ingest     {workers:>3} workers {args.sales_rows:>10,} rows  {secs:7.2f}s  "
+                  f"{args.sales_rows / secs:>10,.0f} rows/s  x{baseline[1] / secs:.2f}")
+    print("parity: every worker count matches the single-process output")
+
+
+if __name__ == "__main__":
+    main()
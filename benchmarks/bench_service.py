@@ -0,0 +1,132 @@
+"""
+Appraisal service under load: concurrent keep-alive clients against appraisal_service.py
+on this machine, with VIN decodes going to the local NHTSA stub (nhtsa_stub.py) and market
+comps to MockMarketProvider. Reports requests/s, vehicles/s, client-side p50/p99 and the
+service's micro-batch sizes, then checks every response against `appraise_batch`.
+
+    python benchmarks/bench_service.py [--requests 20000] [--clients 64] [--bulk 1] [--decode]
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from urllib.parse import urlparse
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import nhtsa_stub  # noqa: E402
+from appraisal_service import AppraisalService, start_background  # noqa: E402
+from bench_batch import SETTINGS, make_appraisals  # noqa: E402
+from engine import appraise_batch  # noqa: E402
+from market_data import MarketData  # noqa: E402
+from suite import make_vins  # noqa: E402
+from vin_decoder import VinDecoder  # noqa: E402
+from vin_offline import VinPrefixIndex  # noqa: E402
+
+CHECKED_COLUMNS = ["Max Buy", "Room", "Adjusted Retail", "Front Gross", "Turn Days", "Priority", "Status"]
+
+
+def make_bodies(df, bulk, decode):
+    """One /appraise body per `bulk` rows of `df`."""
+    vehicles = df.to_dict(orient="records")
+    bodies = []
+    for start in range(0, len(vehicles), bulk):
+        group = vehicles[start:start + bulk]
+        payload = {"vehicles": group} if bulk > 1 else dict(group[0])
+        if decode: payload["decode_vins"] = True
+        bodies.append(json.dumps(payload, default=int).encode())
+    return bodies
+
+
+async def client(host, port, bodies, latencies, responses):
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        for i, body in bodies:
+            start = time.perf_counter()
+            writer.write(b"POST /appraise HTTP/1.1\r\nHost: bench\r\nContent-Type: application/json\r\n"
+                         b"Content-Length: %d\r\n\r\n" % len(body) + body)
+            head = await reader.readuntil(b"\r\n\r\n")
+            length = int(head.lower().split(b"content-length:")[1].split(b"\r\n")[0])
+            payload = await reader.readexactly(length)
+            latencies.append(time.perf_counter() - start)
+            if not head.startswith(b"HTTP/1.1 200"): raise RuntimeError(payload.decode())
+            responses[i] = payload
+    finally:
+        writer.close()
+
+
+async def load(base_url, bodies, clients):
+    url = urlparse(base_url)
+    latencies, responses = [], [None] * len(bodies)
+    numbered = list(enumerate(bodies))
+    start = time.perf_counter()
+    await asyncio.gather(*(client(url.hostname, url.port, numbered[c::clients], latencies, responses)
+                           for c in range(clients)))
+    return time.perf_counter() - start, np.array(latencies), responses
+
+
+def check_parity(df, responses, bulk, decoder):
+    results = []
+    for payload in responses:
+        data = json.loads(payload)
+        results.extend(data["results"] if bulk > 1 else [data])
+    actual = pd.DataFrame(results)
+    expected_input = df
+    if decoder is not None:
+        from vin_decoder import apply_decodes
+        expected_input = apply_decodes(df, decoder.decode_many(df["vin"]))
+    expected = appraise_batch(expected_input, SETTINGS)
+    for col in CHECKED_COLUMNS:
+        name = col.lower().replace(" ", "_")
+        if pd.api.types.is_numeric_dtype(expected[col]):
+            np.testing.assert_allclose(actual[name].to_numpy(dtype=float), expected[col].to_numpy(dtype=float),
+                                       rtol=1e-9, err_msg=col)
+        else:
+            assert (actual[name].to_numpy() == expected[col].astype(str).to_numpy()).all(), f"mismatch in {col}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=20_000)
+    parser.add_argument("--clients", type=int, default=64, help="concurrent keep-alive connections")
+    parser.add_argument("--bulk", type=int, default=1, help="vehicles per request")
+    parser.add_argument("--decode", action="store_true", help="decode every VIN through the NHTSA stub")
+    parser.add_argument("--workers", type=int, default=2, help="service micro-batches in flight")
+    args = parser.parse_args()
+
+    df = make_appraisals(args.requests * args.bulk)
+    if args.decode:
+        vins = make_vins(min(len(df), 2_000))
+        df["vin"] = [vins[i % len(vins)] for i in range(len(df))]
+    bodies = make_bodies(df, args.bulk, args.decode)
+
+    stub, nhtsa_url = nhtsa_stub.start()
+    decoder = VinDecoder(base_url=nhtsa_url, index=VinPrefixIndex(), backoff=0)
+    service = AppraisalService(SETTINGS, decoder=decoder, market_data=MarketData(), workers=args.workers)
+    stop, base_url = start_background(service)
+    try:
+        asyncio.run(load(base_url, bodies[:args.clients * 4], args.clients))  # warm-up
+        seconds, latencies, responses = asyncio.run(load(base_url, bodies, args.clients))
+        stats = service.stats()
+    finally:
+        stop()
+        stub.shutdown()
+
+    p50, p99 = np.percentile(latencies, [50, 99]) * 1000
+    print(f"{len(bodies):,} requests x {args.bulk} vehicles from {args.clients} clients in {seconds:.2f}s")
+    print(f"{len(bodies) / seconds:>12,.0f} req/s  {len(df) / seconds:>12,.0f} vehicles/s  "
+          f"p50 {p50:.2f} ms  p99 {p99:.2f} ms")
+    print(f"service: {stats['batches']:,} micro-batches, mean {stats['mean_batch_vehicles']} vehicles, "
+          f"p50 {stats['p50_ms']} ms, p99 {stats['p99_ms']} ms")
+    check_parity(df, responses, args.bulk, decoder if args.decode else None)
+    decoder.close()
+    print("parity: every response matches appraise_batch")
+
+
+if __name__ == "__main__":
+    main()
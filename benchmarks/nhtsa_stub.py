@@ -0,0 +1,49 @@
+"""
+Local stand-in for the NHTSA vPIC endpoints VinDecoder calls (DecodeVinValues and
+DecodeVINValuesBatch), so the decode path can be timed without the network.
+
+    server, base_url = start()   # VinDecoder(base_url=base_url)
+    ...
+    server.shutdown()
+"""
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+MAKES = [("TOYOTA", "Camry"), ("HONDA", "Accord"), ("HYUNDAI", "Tucson"), ("KIA", "Sportage"), ("FORD", "F-150")]
+
+
+def vpic_result(vin):
+    make, model = MAKES[sum(map(ord, vin)) % len(MAKES)]
+    return {"VIN": vin, "Make": make, "Model": model, "ModelYear": "2021", "ErrorCode": "0", "ErrorText": ""}
+
+
+class VpicHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, like the real API behind the decoder's pooled session
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, results):
+        body = json.dumps({"Count": len(results), "Results": results}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        self._send([vpic_result(urlparse(self.path).path.rstrip('/').rsplit('/', 1)[-1])])
+
+    def do_POST(self):
+        form = parse_qs(self.rfile.read(int(self.headers["Content-Length"])).decode())
+        self._send([vpic_result(entry.split(',')[0]) for entry in form["data"][0].split(';')])
+
+
+def start(host="127.0.0.1", port=0):
+    """Serves on a background thread; returns (server, base_url)."""
+    server = ThreadingHTTPServer((host, port), VpicHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}/api/vehicles"
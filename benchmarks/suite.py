@@ -0,0 +1,248 @@
+"""
+Benchmark suite for the hot paths, on synthetic data at a fixed scale. Every case reports
+throughput, per-call latency percentiles and peak traced memory; `--save` writes them to a
+JSON baseline and `--baseline` fails (exit 1) when throughput drops or peak memory grows by
+more than the threshold against it.
+
+    python benchmarks/suite.py --scale small --save baseline.json
+    python benchmarks/suite.py --scale small --baseline baseline.json [--threshold 0.2]
+    python benchmarks/suite.py --scale medium --write-data data/   # just the synthetic files
+
+Cases: currency (parse_currency_column), sales_ingest (DMS log -> turn/gross tables),
+turn_window (trailing/EWMA per-model sums from the month buckets),
+batch_appraise (Tab 3 appraise_batch), batch_reprice (price_batch after a sidebar change),
+market_search (mock vAuto listings), html_render (one results page with theme badges) and
+vin_decode (VinDecoder against the local NHTSA stub in nhtsa_stub.py).
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+from itertools import cycle
+from typing import Callable, NamedTuple, Optional
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import nhtsa_stub  # noqa: E402
+from bench_batch import MODELS, SETTINGS, make_appraisals  # noqa: E402
+from bench_currency import make_currency_column  # noqa: E402
+from bench_parallel import make_sales_log  # noqa: E402
+from engine import CURRENT_YEAR, TURN_WINDOWS, appraise_batch, prepare_batch, price_batch  # noqa: E402
+from market_data import MockMarketProvider, make_query  # noqa: E402
+from results_view import format_page  # noqa: E402
+from sales_ingest import SalesAggregate, ingest_sales, parse_currency_column  # noqa: E402
+from vin_decoder import VinDecoder  # noqa: E402
+from vin_offline import CHECK_WEIGHTS, TRANSLITERATION, YEAR_CODES, VinPrefixIndex  # noqa: E402
+
+
+class Scale(NamedTuple):
+    appraisals: int
+    sales: int
+    vins: int
+
+SCALES = {
+    "small": Scale(appraisals=10_000, sales=20_000, vins=1_000),
+    "medium": Scale(appraisals=100_000, sales=200_000, vins=5_000),
+    "large": Scale(appraisals=1_000_000, sales=1_000_000, vins=20_000),
+}
+PAGE_ROWS = 100
+MEMORY_SLACK_MB = 1.0  # below this, peak-memory changes are allocator noise
+
+
+class Case(NamedTuple):
+    name: str
+    unit: str
+    items: int                   # units of work per call
+    run: Callable[[], object]
+    calls: Optional[int] = None  # timed calls; None means --repeat
+
+# ---------------------------------------------------------
+# SYNTHETIC DATA
+# ---------------------------------------------------------
+VIN_CHARS = np.array(list("0123456789ABCDEFGHJKLMNPRSTUVWXYZ"))
+
+def make_vins(n, seed=17):
+    """`n` distinct VINs that pass every offline check, so each one needs a decode."""
+    rng = np.random.default_rng(seed)
+    year_codes = [code for code, year in YEAR_CODES.items() if year + 30 <= CURRENT_YEAR]
+    vins = set()
+    while len(vins) < n:
+        chars = list(VIN_CHARS[rng.integers(0, len(VIN_CHARS), 17)])
+        chars[6] = 'A'  # letter in position 7 puts the year code in the 2010+ cycle
+        chars[9] = year_codes[rng.integers(0, len(year_codes))]
+        total = sum(TRANSLITERATION[c] * w for c, w in zip(chars, CHECK_WEIGHTS))
+        chars[8] = 'X' if total % 11 == 10 else str(total % 11)
+        vins.add("".join(chars))
+    return sorted(vins)
+
+
+def write_data(directory, scale):
+    os.makedirs(directory, exist_ok=True)
+    paths = {"appraisals": os.path.join(directory, f"appraisals_{scale.appraisals}.csv"),
+             "sales": os.path.join(directory, f"sales_log_{scale.sales}.csv")}
+    make_appraisals(scale.appraisals).to_csv(paths["appraisals"], index=False)
+    make_sales_log(scale.sales).to_csv(paths["sales"], index=False)
+    return paths
+
+# ---------------------------------------------------------
+# CASES
+# ---------------------------------------------------------
+def build_cases(scale, base_url):
+    currency = make_currency_column(scale.appraisals)[0]
+    log = make_sales_log(scale.sales).to_csv(index=False).encode()
+    appraisals = make_appraisals(scale.appraisals)
+    store = ingest_sales(io.BytesIO(log), "sales.csv")
+    turn_data = store.turn_data
+    windows = cycle(TURN_WINDOWS[1:])
+    prepared = prepare_batch(appraisals, dealer_turn_data=turn_data)
+    res_df = appraise_batch(appraisals, SETTINGS, dealer_turn_data=turn_data)
+
+    def ingest():
+        agg = SalesAggregate()
+        ingest_sales(io.BytesIO(log), "sales.csv", into=agg)
+        return agg.results()
+
+    queries = cycle([make_query(make, model, year, "50 miles", zip_code)
+                     for make, model in MODELS for year in range(CURRENT_YEAR - 10, CURRENT_YEAR + 1)
+                     for zip_code in ("32801", "10001")])
+    provider = MockMarketProvider()
+
+    pages = cycle(range(0, max(len(res_df) - PAGE_ROWS, 0) + 1, PAGE_ROWS))
+
+    vins = make_vins(scale.vins)
+
+    def decode():
+        # a fresh index each call, so every VIN goes to the stub rather than the learned prefixes
+        decoder = VinDecoder(base_url=base_url, index=VinPrefixIndex(), backoff=0)
+        try: return decoder.decode_many(vins)
+        finally: decoder.close()
+
+    return [
+        Case("currency", "cells", len(currency), lambda: parse_currency_column(currency)),
+        Case("sales_ingest", "deals", scale.sales, ingest),
+        Case("turn_window", "windows", 1, lambda: store.window_sums(next(windows)), calls=200),
+        Case("batch_appraise", "rows", len(appraisals),
+             lambda: appraise_batch(appraisals, SETTINGS, dealer_turn_data=turn_data)),
+        Case("batch_reprice", "rows", len(appraisals), lambda: price_batch(prepared, SETTINGS)),
+        Case("market_search", "searches", 1, lambda: provider.search(next(queries)), calls=200),
+        Case("html_render", "rows", PAGE_ROWS,
+             lambda: format_page(res_df.iloc[(start := next(pages)):start + PAGE_ROWS]).to_html(escape=False, index=False),
+             calls=100),
+        Case("vin_decode", "vins", len(vins), decode),
+    ]
+
+# ---------------------------------------------------------
+# MEASUREMENT
+# ---------------------------------------------------------
+def measure(case, repeat):
+    """One warm-up call, then timed calls; peak memory comes from one extra traced call."""
+    case.run()
+    times = []
+    for _ in range(case.calls or repeat):
+        start = time.perf_counter()
+        case.run()
+        times.append(time.perf_counter() - start)
+    tracemalloc.start()
+    try:
+        case.run()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    times = np.array(times)
+    p50, p95, p99 = np.percentile(times, [50, 95, 99]) * 1000
+    return {
+        "unit": case.unit, "items": case.items, "calls": len(times),
+        "throughput": case.items * len(times) / times.sum(),
+        "p50_ms": p50, "p95_ms": p95, "p99_ms": p99,
+        "peak_mb": peak / 2**20,
+    }
+
+
+def regressions(results, baseline, threshold, memory_threshold):
+    """Human-readable lines for every case slower or hungrier than `baseline` allows."""
+    problems = []
+    for name, now in results.items():
+        base = baseline.get(name)
+        if base is None: continue
+        if base["items"] != now["items"]:
+            problems.append(f"{name}: baseline measured {base['items']:,} {base['unit']}, this run {now['items']:,}")
+            continue
+        floor = base["throughput"] * (1 - threshold)
+        if now["throughput"] < floor:
+            problems.append(f"{name}: {now['throughput']:,.0f} {now['unit']}/s is below {floor:,.0f} "
+                            f"(baseline {base['throughput']:,.0f} - {threshold:.0%})")
+        ceiling = base["peak_mb"] * (1 + memory_threshold) + MEMORY_SLACK_MB
+        if now["peak_mb"] > ceiling:
+            problems.append(f"{name}: peak {now['peak_mb']:,.1f} MB is above {ceiling:,.1f} MB "
+                            f"(baseline {base['peak_mb']:,.1f} MB + {memory_threshold:.0%})")
+    return problems
+
+
+def environment(scale_name):
+    return {
+        "scale": scale_name, "recorded": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(), "numpy": np.__version__, "pandas": pd.__version__,
+        "machine": platform.machine(), "cpus": os.cpu_count(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scale", choices=list(SCALES), default="small")
+    parser.add_argument("--repeat", type=int, default=5, help="timed calls for the whole-dataset cases")
+    parser.add_argument("--only", nargs="+", metavar="CASE", help="run just these cases")
+    parser.add_argument("--save", metavar="JSON", help="write the results as a baseline")
+    parser.add_argument("--baseline", metavar="JSON", help="fail on regressions against this baseline")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed throughput drop (default 0.2 = 20%%)")
+    parser.add_argument("--memory-threshold", type=float, default=0.2, help="allowed peak memory growth")
+    parser.add_argument("--write-data", metavar="DIR", help="write the synthetic appraisal file and sales log, then exit")
+    args = parser.parse_args()
+    scale = SCALES[args.scale]
+
+    if args.write_data:
+        for label, path in write_data(args.write_data, scale).items():
+            print(f"{label:>10}: {path}")
+        return
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f: baseline = json.load(f)
+        if baseline["environment"]["scale"] != args.scale:
+            parser.error(f"baseline was recorded at --scale {baseline['environment']['scale']}")
+
+    server, base_url = nhtsa_stub.start()
+    try:
+        cases = build_cases(scale, base_url)
+        unknown = set(args.only or ()) - {case.name for case in cases}
+        if unknown: parser.error(f"unknown cases: {', '.join(sorted(unknown))}")
+        results = {}
+        print(f"{'case':<15} {'items':>10} {'throughput':>22} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'peak MB':>9}")
+        for case in cases:
+            if args.only and case.name not in args.only: continue
+            r = results[case.name] = measure(case, args.repeat)
+            print(f"{case.name:<15} {r['items']:>10,} {r['throughput']:>14,.0f} {r['unit'] + '/s':<7} "
+                  f"{r['p50_ms']:>9.2f} {r['p95_ms']:>9.2f} {r['p99_ms']:>9.2f} {r['peak_mb']:>9.1f}")
+    finally:
+        server.shutdown()
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump({"environment": environment(args.scale), "cases": results}, f, indent=2)
+        print(f"baseline written to {args.save}")
+    if baseline is not None:
+        problems = regressions(results, baseline["cases"], args.threshold, args.memory_threshold)
+        for line in problems: print(f"REGRESSION {line}")
+        if problems: sys.exit(1)
+        print(f"no regressions against {args.baseline} (threshold {args.threshold:.0%})")
+
+
+if __name__ == "__main__":
+    main()
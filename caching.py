@@ -0,0 +1,150 @@
+import hashlib
+import os
+import pickle
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+_MISSING = object()
+
+
+def content_hash(data):
+    """Hex digest identifying a blob of bytes, e.g. an uploaded file."""
+    return hashlib.blake2b(data, digest_size=20).hexdigest()
+
+
+class TTLCache:
+    """
+    Thread-safe in-memory LRU cache whose entries also expire `ttl` seconds after they were stored.
+    Keeps hit/miss counters so callers can report how well it is doing.
+    """
+
+    def __init__(self, max_entries=1024, ttl=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is not _MISSING and self.ttl is not None and time.monotonic() - entry[0] > self.ttl:
+                del self._data[key]
+                entry = _MISSING
+            if entry is _MISSING:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic(), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def get_or_compute(self, key, compute):
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            value = compute()
+            self.put(key, value)
+        return value
+
+    def __contains__(self, key):
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            return entry is not _MISSING and (self.ttl is None or time.monotonic() - entry[0] <= self.ttl)
+
+    def __len__(self):
+        return len(self._data)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {"entries": len(self._data), "hits": self.hits, "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0}
+
+
+class DiskCache:
+    """
+    Pickle-per-entry store in `directory`, keyed by a filename-safe string such as `content_hash`.
+    Hits refresh the file's mtime; past `max_bytes` the least recently used files are deleted.
+    Writes go through a temp file + rename, so concurrent readers never see partial entries.
+    Subclasses change the file format by overriding `suffix`, `_load` and `_dump`.
+    """
+
+    suffix = ".pkl"
+
+    def __init__(self, directory, max_bytes=512 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}{self.suffix}")
+
+    def _load(self, f):
+        return pickle.load(f)
+
+    def _dump(self, value, f):
+        pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    def get(self, key, default=None):
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f: value = self._load(f)
+            os.utime(path)
+            return value
+        except (OSError, pickle.UnpicklingError, EOFError, ValueError):
+            return default
+
+    def put(self, key, value):
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f: self._dump(value, f)
+        except BaseException:
+            os.remove(tmp)
+            raise
+        os.replace(tmp, self._path(key))
+        self._evict()
+
+    def _evict(self):
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(self.suffix):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes: break
+            try: os.remove(path)
+            except OSError: pass
+            total -= size
+
+
+def parquet_available():
+    """Whether pandas can read and write Parquet here (pyarrow is installed)."""
+    try: import pyarrow  # noqa: F401
+    except ImportError: return False
+    return True
+
+
+class ParquetCache(DiskCache):
+    """DiskCache of DataFrames stored as Parquet, so they load column-wise and any Arrow tool can read them."""
+
+    suffix = ".parquet"
+
+    def _load(self, f):
+        import pandas as pd
+        return pd.read_parquet(f)
+
+    def _dump(self, df, f):
+        df.to_parquet(f, index=False)
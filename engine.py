@@ -0,0 +1,706 @@
+"""
+Headless appraisal core: pricing rules with no Streamlit dependency. Pass an AppraisalSettings
+and, optionally, the dealer's turn table. numpy and pandas are imported by the vectorized
+functions on first use, so importing this module stays cheap for CLIs and workers.
+"""
+import re
+from bisect import bisect_right
+from collections.abc import Mapping
+from datetime import datetime
+from functools import lru_cache
+from typing import NamedTuple
+
+from instrumentation import timed
+
+# ---------------------------------------------------------
+# CONSTANTS & DEFAULTS
+# ---------------------------------------------------------
+BUY_FEES = 865
+CURRENT_YEAR = datetime.now().year
+FALLBACK_TURN_DAYS = 38
+
+# Mileage taper: the CPM rate is picked by retail price tier, then shrinks by CPM_DECAY per
+# model year of age down to CPM_FLOOR. Dealers can override the decay and floor.
+CPM_TIER_BOUNDS = [15000, 45000, 80000]  # prices below each bound fall in that tier
+CPM_TIER_RATES = [0.10, 0.15, 0.20, 0.30]
+CPM_DECAY = 0.85
+CPM_FLOOR = 0.03
+MODEL_YEAR_MIN, MODEL_YEAR_MAX = 1980, 2030  # the Year input's range; the taper tables cover it
+
+# Windows of the dealer's sales history turn days can come from (see sales_ingest.SalesAggregate):
+# every deal, deals sold in the trailing 30/90/365 days, or every deal weighted by recency
+TURN_WINDOWS = ['all', '30d', '90d', '365d', 'ewma']
+
+DEFAULT_INDUSTRY_TURN = {
+    'hyundai_tucson': 30, 'hyundai_elantra': 32, 'hyundai_sonata': 32,
+    'hyundai_kona': 25, 'hyundai_palisade': 28, 'hyundai_santa_fe': 42,
+    'nissan_rogue': 36, 'nissan_altima': 40, 'nissan_kicks': 33,
+    'toyota_camry': 26, 'toyota_rav4': 35, 'honda_accord': 32,
+    'kia_sportage': 56, 'genesis_gv70': 36, 'genesis_g70': 42
+}
+
+# Category order of the batch result's categorical columns
+PRIORITY_LEVELS = ["HIGH", "MEDIUM", "LOW"]
+STATUS_LEVELS = ["UNDER BUDGET", "OVER BUDGET"]
+MILEAGE_ALERTS = ["", "NEAR 100K", "100K+ CLIFF"]
+DATA_SOURCES = ["YOUR Data", "Industry Averages", "Group Data"]  # Group Data: a rooftop's miss filled from the group
+
+BATCH_REQUIRED_COLS = ['vin', 'year', 'make', 'model', 'mileage', 'retail', 'appraisal']
+# With market comps the base retail comes from the market, so `retail` is optional
+BATCH_MARKET_REQUIRED_COLS = [c for c in BATCH_REQUIRED_COLS if c != 'retail']
+# per-row market zip code (see market_data.market_stats) and rooftop whose turn days to use
+BATCH_OPTIONAL_COLS = ['zip', 'rooftop']
+
+
+class AppraisalSettings(NamedTuple):
+    """The sidebar knobs. Defaults match the app's initial settings."""
+    margin_target: float = 0.12
+    recon_cost: float = 1500.0
+    below_line: float = 1200.0
+    use_auto: bool = True  # CPM by price tier; False uses manual_cpm
+    manual_cpm: float = 0.15
+    buy_fees: float = BUY_FEES
+    current_year: int = CURRENT_YEAR
+    cpm_decay: float = CPM_DECAY  # dealer override of the taper curve
+    cpm_floor: float = CPM_FLOOR
+
+# ---------------------------------------------------------
+# CPM TAPER TABLES
+# ---------------------------------------------------------
+def price_tier(price):
+    """Index into CPM_TIER_RATES for one retail price."""
+    return bisect_right(CPM_TIER_BOUNDS, price)
+
+def price_tiers(price):
+    """`price_tier` over an array, as int8 codes (NaN prices land in the top tier, like the scalar rule)."""
+    import numpy as np
+    return np.searchsorted(CPM_TIER_BOUNDS, np.asarray(price, dtype=float), side='right').astype(np.int8)
+
+class CpmTable:
+    """
+    The taper for one current year and curve, precomputed for every whole age a MODEL_YEAR_MIN..
+    MODEL_YEAR_MAX vehicle can have: `depreciation[age]` = decay ** age and `cpm[tier][age]` =
+    max(CPM_TIER_RATES[tier] * decay ** age, floor). Entries are built with the same scalar
+    arithmetic as the formula, so a lookup returns exactly what computing it would; ages the
+    table doesn't hold (pre-MODEL_YEAR_MIN, fractional or missing years) are computed directly.
+    """
+
+    def __init__(self, current_year=CURRENT_YEAR, decay=CPM_DECAY, floor=CPM_FLOOR):
+        self.current_year, self.decay, self.floor = current_year, decay, floor
+        self.max_age = max(current_year - MODEL_YEAR_MIN, 0)
+        self.depreciation = tuple(decay ** age for age in range(self.max_age + 1))
+        self.cpm = tuple(tuple(max(rate * d, floor) for d in self.depreciation) for rate in CPM_TIER_RATES)
+        self._arrays = None
+
+    def _covers(self, age):
+        return 0 <= age <= self.max_age and age % 1 == 0
+
+    def factor(self, age):
+        """decay ** age."""
+        return self.depreciation[int(age)] if self._covers(age) else self.decay ** age
+
+    def rate(self, price, age, use_auto=True, manual_cpm=0.15):
+        """CPM for one vehicle: its price tier's rate (or `manual_cpm`) tapered by age, floored."""
+        if use_auto and self._covers(age): return self.cpm[price_tier(price)][int(age)]
+        base = CPM_TIER_RATES[price_tier(price)] if use_auto else manual_cpm
+        return max(base * self.factor(age), self.floor)
+
+    def arrays(self):
+        """(depreciation, cpm) as float64 arrays shaped (ages,) and (tiers, ages)."""
+        if self._arrays is None:
+            import numpy as np
+            self._arrays = (np.array(self.depreciation), np.array(self.cpm))
+        return self._arrays
+
+    def rates(self, age, tier=None, manual_cpm=0.15):
+        """
+        `rate` over arrays by gathering from the table: `tier` holds `price_tiers` codes, or is
+        None for a flat `manual_cpm`. Rows outside the table fall back to the scalar formula.
+        """
+        import numpy as np
+
+        depreciation, cpm = self.arrays()
+        age = np.asarray(age)
+        inside = age <= self.max_age
+        if age.dtype.kind == 'f': inside &= age % 1 == 0  # NaN compares False
+        index = age if age.dtype.kind in 'iu' and inside.all() else np.where(inside, age, 0).astype(np.intp)
+        if tier is None: out = np.take(np.maximum(float(manual_cpm) * depreciation, self.floor), index)
+        else: out = np.take(cpm.ravel(), np.asarray(tier, dtype=np.int32) * cpm.shape[1] + index)
+        if not inside.all():
+            far = np.flatnonzero(~inside)
+            bases = [manual_cpm] * len(far) if tier is None else [CPM_TIER_RATES[t] for t in tier[far].tolist()]
+            out[far] = [max(base * self.decay ** a, self.floor) for base, a in zip(bases, age[far].tolist())]
+        return out
+
+@lru_cache(maxsize=64)
+def cpm_table(current_year=CURRENT_YEAR, decay=CPM_DECAY, floor=CPM_FLOOR):
+    """Shared CpmTable per (current year, decay, floor); the scalar, batch and market paths all use it."""
+    return CpmTable(current_year, decay, floor)
+
+# ---------------------------------------------------------
+# SCALAR PRICING LOGIC
+# ---------------------------------------------------------
+def vehicle_key(make, model):
+    return f"{str(make).lower()}_{str(model).lower().replace(' ', '_')}"
+
+def get_base_cpm(price):
+    return CPM_TIER_RATES[price_tier(price)]
+
+def calculate_cpm(price, vehicle_year, current_year, use_auto, manual_cpm, decay=CPM_DECAY, floor=CPM_FLOOR):
+    age = max(current_year - vehicle_year, 0)
+    return cpm_table(current_year, decay, floor).rate(price, age, use_auto, manual_cpm)
+
+def dealer_turn_table(dealer_turn_data, window=None):
+    """
+    The turn days to price with: a {vehicle_key: turn days} mapping, or RooftopTables for a
+    dealer group. A windowed source such as sales_ingest.SalesAggregate or RooftopSales gives
+    its table for `window` (None: all deals, else one of TURN_WINDOWS); a plain mapping holds
+    a single window and is used as is.
+    """
+    if hasattr(dealer_turn_data, 'turn_table'): return dealer_turn_data.turn_table(window or 'all')
+    return dealer_turn_data
+
+def rooftop_name(value):
+    """A rooftop as the sales store keys it: trimmed text, whole numbers without '.0'; None when blank."""
+    if value is None or value != value: return None
+    if isinstance(value, float) and value.is_integer(): value = int(value)
+    return str(value).strip() or None
+
+def lookup_turn_days(make, model, dealer_turn_data, window=None, rooftop=None):
+    """
+    Turn days and source for one vehicle; spellings are matched through VehicleIndex. With
+    RooftopTables the `rooftop`'s own table comes first, then the group's.
+    """
+    tables = dealer_turn_table(dealer_turn_data, window)
+    rooftop = rooftop_name(rooftop)
+    group, source = tables, "YOUR Data"
+    if isinstance(tables, RooftopTables):
+        group = tables.group
+        if rooftop is not None:
+            days = _lookup_one(tables.stores.get(rooftop), make, model)
+            if days is not None: return days, "YOUR Data"
+            source = "Group Data"
+    days = _lookup_one(group, make, model)
+    if days is not None: return days, source
+    key = industry_index().resolve(make, model)
+    return DEFAULT_INDUSTRY_TURN.get(key, FALLBACK_TURN_DAYS), "Industry Averages"
+
+def _lookup_one(table, make, model):
+    if not table: return None
+    key = vehicle_index(table).resolve(make, model)
+    return None if key is None else table[key]
+
+def get_priority(turn_days, margin):
+    """Buy priority; pass turn days from the window being priced (see `lookup_turn_days`)."""
+    if turn_days <= 30 and margin >= 0.12: return "HIGH"
+    if turn_days >= 60 and margin < 0.08: return "LOW"
+    return "MEDIUM"
+
+def appraise_market(market_avg_price, market_median_mileage, mileage, vehicle_year, settings):
+    """Single VIN pricing off market comps. Returns (cpm, mileage_impact, adjusted_retail, max_buy)."""
+    s = settings
+    cpm = calculate_cpm(market_avg_price, vehicle_year, s.current_year, s.use_auto, s.manual_cpm,
+                        s.cpm_decay, s.cpm_floor)
+    mileage_impact = (market_median_mileage - mileage) * cpm
+    adjusted_retail = market_avg_price + mileage_impact
+    max_buy = (adjusted_retail * (1 - s.margin_target)) - s.recon_cost - s.buy_fees
+    return cpm, mileage_impact, adjusted_retail, max_buy
+
+def appraise_row(row, settings, dealer_turn_data=None, window=None, rooftop=None):
+    """Row-at-a-time appraisal. Reference implementation for `appraise_batch`."""
+    s = settings
+    expected_miles = max(s.current_year - row['year'], 1) * 12000
+    cpm = calculate_cpm(row['retail'], row['year'], s.current_year, s.use_auto, s.manual_cpm,
+                        s.cpm_decay, s.cpm_floor)
+
+    mileage_impact = (expected_miles - row['mileage']) * cpm
+    adj_retail = row['retail'] + mileage_impact
+
+    max_buy = (adj_retail * (1 - s.margin_target)) - s.recon_cost - s.buy_fees
+    room = max_buy - row['appraisal']
+
+    front_gross = adj_retail - row['appraisal'] - s.recon_cost - s.buy_fees
+    front_margin = front_gross / adj_retail if adj_retail > 0 else 0
+    total_deal = front_gross + s.below_line
+
+    rooftop = rooftop_name(row.get('rooftop')) or rooftop
+    turn_days, source = lookup_turn_days(row['make'], row['model'], dealer_turn_data or {}, window, rooftop)
+    priority = get_priority(turn_days, front_margin)
+    alert = "100K+ CLIFF" if row['mileage'] >= 100000 else "NEAR 100K" if row['mileage'] >= 95000 else ""
+    status = "UNDER BUDGET" if room >= 0 else "OVER BUDGET"
+
+    return {
+        "Priority": priority, "Alert": alert,
+        "Year": row['year'], "Make": row['make'], "Model": row['model'], "Mileage": row['mileage'],
+        "Base Retail": row['retail'], "Mileage Impact": mileage_impact,
+        "Adjusted Retail": adj_retail, "Max Buy": max_buy, "Room": room,
+        "Front Gross": front_gross, "Front Margin": front_margin, "Total Deal": total_deal,
+        "Turn Days": turn_days, "Data Source": source, "Status": status
+    }
+
+# ---------------------------------------------------------
+# DEALER TABLES
+# ---------------------------------------------------------
+class ModelTable(Mapping):
+    """
+    Read-only {vehicle_key: value} mapping kept as a sorted key array plus a parallel value array
+    (float, or a structured array for several fields), so a dealer's per-model table costs a few
+    bytes per model, pickles small and resolves many keys in one `lookup`. A model's code is its
+    position in `vehicle_keys`. As with a dict, the last of duplicate keys wins.
+    """
+
+    def __init__(self, keys, values):
+        import numpy as np
+
+        self._index = None
+        keys, values = np.asarray(keys, dtype=str), np.asarray(values)
+        last_first = np.arange(len(keys))[::-1]
+        order = last_first[np.argsort(keys[last_first], kind='stable')]
+        keys = keys[order]
+        first = np.ones(len(keys), dtype=bool)
+        first[1:] = keys[1:] != keys[:-1]
+        self.vehicle_keys = keys[first]
+        self.data = values[order][first]
+
+    @classmethod
+    def from_mapping(cls, mapping):
+        return mapping if isinstance(mapping, cls) else cls(list(mapping.keys()), [float(v) for v in mapping.values()])
+
+    def codes(self, keys):
+        """Position of each key in `vehicle_keys`, -1 where absent."""
+        import numpy as np
+
+        keys = np.asarray(keys, dtype=str)
+        if not len(self.vehicle_keys): return np.full(len(keys), -1)
+        pos = np.minimum(np.searchsorted(self.vehicle_keys, keys), len(self.vehicle_keys) - 1)
+        return np.where(self.vehicle_keys[pos] == keys, pos, -1)
+
+    def lookup(self, keys, default):
+        """(values, found) for many keys at once; `default` (scalar or per-key array) fills the misses."""
+        import numpy as np
+
+        pos = self.codes(keys)
+        found = pos >= 0
+        values = np.array(np.broadcast_to(default, found.shape), dtype=self.data.dtype)
+        values[found] = self.data[pos[found]]
+        return values, found
+
+    def __getitem__(self, key):
+        pos = self.codes([key])[0]
+        if pos < 0: raise KeyError(key)
+        return self.data[pos]
+
+    def __contains__(self, key):
+        return self.codes([key])[0] >= 0
+
+    def __iter__(self):
+        return iter(self.vehicle_keys.tolist())
+
+    def __len__(self):
+        return len(self.vehicle_keys)
+
+    def __repr__(self):
+        return f"ModelTable({len(self)} models)"
+
+    @property
+    def index(self):
+        """VehicleIndex over this table's keys, built on first use."""
+        if getattr(self, "_index", None) is None: self._index = VehicleIndex(self.vehicle_keys.tolist())
+        return self._index
+
+
+class RooftopTables:
+    """
+    A dealer group's turn days for one window: `group` pools every rooftop's deals and `stores`
+    maps each rooftop to its own {vehicle_key: turn days} table. Rows priced for a rooftop use
+    its table first and fall back to the group's, then to industry averages. Sized (and truthy)
+    like the group table, so it stands in for a single dealer table.
+    """
+
+    def __init__(self, group, stores):
+        self.group = group
+        self.stores = stores
+
+    def __len__(self):
+        return len(self.group)
+
+    def __repr__(self):
+        return f"RooftopTables({len(self.group)} models, {len(self.stores)} rooftops)"
+
+# ---------------------------------------------------------
+# MAKE/MODEL SPELLING INDEX
+# ---------------------------------------------------------
+# Keys are match forms: lower-case letters and digits only ("CR-V", "Cr-V", "crv" -> "crv")
+MAKE_ALIASES = {
+    "chevy": "chevrolet", "vw": "volkswagen", "volkswagon": "volkswagen", "mercedes": "mercedesbenz",
+    "benz": "mercedesbenz", "mb": "mercedesbenz", "rangerover": "landrover",
+    "hyundaimotor": "hyundai", "kiamotors": "kia", "genesismotor": "genesis", "toyotamotor": "toyota",
+    "americanhonda": "honda", "nissannorthamerica": "nissan", "ramtrucks": "ram",
+}
+MODEL_ALIASES = {
+    ("chevrolet", "silverado"): "silverado1500", ("gmc", "sierra"): "sierra1500",
+    ("ford", "f150pickup"): "f150", ("toyota", "rav"): "rav4", ("kia", "optimak5"): "k5",
+    ("volkswagen", "gti"): "golfgti", ("hyundai", "santafexl"): "santafe",
+}
+# difflib ratio a misspelling needs against the make's models ("Acord" -> "Accord"); typos only,
+# so the lengths may differ by one character at most
+FUZZY_CUTOFF = 0.9
+# Trailing words that name a different model class or vehicle, never dropped as trim
+# ("2500HD", "3500", "HD", "F-150 Lightning", "Prius Prime", "Niro EV", "Wrangler 4xe")
+CLASS_WORD = re.compile(r'\d+(?:hd|shd)?|s?hd|p?hev|ev|electric|hybrid|prime|lightning|4xe|plug-?in|energi|e-?tron',
+                        re.IGNORECASE)
+SPELLING_CACHE_MAX = 100_000  # resolved spellings kept per index
+
+_NOT_ALNUM = re.compile(r'[^0-9a-z]+')
+_NOT_DIGIT = re.compile(r'\D+')
+_TOKEN = re.compile(r'[a-z]+|[0-9]+')
+_UNRESOLVED = object()
+
+def match_form(text):
+    return _NOT_ALNUM.sub('', str(text).lower())
+
+def make_form(make):
+    form = match_form(make)
+    return MAKE_ALIASES.get(form, form)
+
+def model_form(make_f, model):
+    form = match_form(model)
+    return MODEL_ALIASES.get((make_f, form), form)
+
+def close_form(form, forms):
+    """
+    The closest of `forms` to a misspelled `form`: same digits, length within one and at least
+    FUZZY_CUTOFF alike; or None. Model codes (digits and at most three letters: "GV70",
+    "CX-50") only ever match exactly.
+    """
+    from difflib import get_close_matches
+
+    digits = _NOT_DIGIT.sub('', form)
+    if digits and len(form) - len(digits) <= 3: return None
+    candidates = [f for f in forms if abs(len(f) - len(form)) <= 1 and _NOT_DIGIT.sub('', f) == digits]
+    close = get_close_matches(form, candidates, n=1, cutoff=FUZZY_CUTOFF)
+    return close[0] if close else None
+
+def single_token_apart(a, b):
+    """Whether two spellings differ by a one-letter or one-digit word ("Model S" vs "Model Y"): different models, not a typo."""
+    from difflib import SequenceMatcher
+
+    ta, tb = _TOKEN.findall(str(a).lower()), _TOKEN.findall(str(b).lower())
+    for tag, i1, i2, j1, j2 in SequenceMatcher(None, ta, tb, autojunk=False).get_opcodes():
+        if tag != 'equal' and all(len(t) == 1 for t in ta[i1:i2] + tb[j1:j2]): return True
+    return False
+
+
+class VehicleIndex:
+    """
+    Resolves free-form make/model spellings (DMS exports, NHTSA's "Cr-V", VEHICLE_DB) to the keys
+    of one vehicle_key table. Keys and queries are compared in match form with make and model
+    aliases applied to the whole name; a model with trailing trim words ("Camry LE AWD") falls
+    back to its longest leading words that match, as long as no class word (CLASS_WORD) is
+    dropped, and what's left to a typo-close spelling within the make (see `close_form`).
+    Every distinct spelling is resolved once and cached.
+    """
+
+    def __init__(self, keys):
+        self.models = {}  # make form -> {model form: key}; the first key of a form wins
+        for key in keys:
+            make, _, model = str(key).partition('_')  # vehicle_key keeps spaces in the make only
+            make_f = make_form(make)
+            self.models.setdefault(make_f, {}).setdefault(model_form(make_f, model), key)
+        self._resolved = {}
+
+    def resolve(self, make, model):
+        """The table key for one make/model spelling, or None."""
+        spelling = (make, model)
+        key = self._resolved.get(spelling, _UNRESOLVED)
+        if key is _UNRESOLVED:
+            if len(self._resolved) >= SPELLING_CACHE_MAX: self._resolved.clear()
+            key = self._resolved[spelling] = self._resolve(make, model)
+        return key
+
+    def _resolve(self, make, model):
+        make_f = make_form(make)
+        if make_f not in self.models:
+            make_f = close_form(make_f, self.models)
+            if make_f is None: return None
+        forms = self.models[make_f]
+        raw = [w for w in str(model).split() if match_form(w)]
+        words = [match_form(w) for w in raw]
+        full = model_form(make_f, ''.join(words))
+        if full in forms: return forms[full]
+        for n in range(len(words) - 1, 0, -1):
+            if CLASS_WORD.fullmatch(raw[n]): break  # words[n:] would drop a class word
+            key = forms.get(''.join(words[:n]))
+            if key is not None: return key
+        close = close_form(full, forms)
+        if close is None or single_token_apart(model, forms[close].partition('_')[2]): return None
+        return forms[close]
+
+    def resolve_many(self, make, model):
+        """Table key (None where unmatched) for every row of two columns, resolving each distinct pair once."""
+        import numpy as np
+        import pandas as pd
+
+        make, model = pd.Categorical(make), pd.Categorical(model)
+        n_models = len(model.categories) + 1  # code -1 (missing) shifts to 0
+        pair_codes, pairs = pd.factorize((make.codes.astype(np.int64) + 1) * n_models + (model.codes + 1))
+        makes = np.append(np.nan, np.asarray(make.categories, dtype=object))
+        models = np.append(np.nan, np.asarray(model.categories, dtype=object))
+        keys = np.array([self.resolve(makes[pair // n_models], models[pair % n_models]) for pair in pairs], dtype=object)
+        return keys[pair_codes]
+
+
+def vehicle_index(table):
+    """VehicleIndex for a turn/gross table; cached on ModelTables, rebuilt for plain dicts."""
+    return table.index if isinstance(table, ModelTable) else VehicleIndex(table)
+
+@lru_cache(maxsize=1)
+def industry_index():
+    return VehicleIndex(DEFAULT_INDUSTRY_TURN)
+
+# ---------------------------------------------------------
+# VECTORIZED PRICING LOGIC
+# ---------------------------------------------------------
+def priority_codes(turn_days, margin):
+    """Priority as int8 codes into PRIORITY_LEVELS."""
+    import numpy as np
+    turn_days, margin = np.asarray(turn_days, dtype=float), np.asarray(margin, dtype=float)
+    return np.select(
+        [(turn_days <= 30) & (margin >= 0.12), (turn_days >= 60) & (margin < 0.08)], [0, 2], 1
+    ).astype(np.int8)
+
+def turn_days_array(make, model, dealer_turn_data=None, window=None, rooftop=None):
+    """
+    Resolves turn days once per unique make/model pair and gathers them back to every row.
+    `dealer_turn_data` may be a windowed source, see `dealer_turn_table`. With RooftopTables,
+    `rooftop` (one name, or one per row as from `rooftop_array`) picks each row's store table
+    first, falling back to the group's; once per unique rooftop and pair.
+    Returns (days, source codes into DATA_SOURCES).
+    """
+    import numpy as np
+    import pandas as pd
+
+    make, model = pd.Categorical(make), pd.Categorical(model)
+    n_models = len(model.categories) + 1  # code -1 (missing) shifts to 0
+    pair_codes, pairs = pd.factorize((make.codes.astype(np.int64) + 1) * n_models + (model.codes + 1))
+    makes = np.append(np.nan, np.asarray(make.categories, dtype=object))
+    models = np.append(np.nan, np.asarray(model.categories, dtype=object))
+    makes, models = makes[pairs // n_models], models[pairs % n_models]
+
+    def resolve(table, default):
+        table = ModelTable.from_mapping(table or {})
+        keys = table.index.resolve_many(makes, models) if len(table) else [None] * len(pairs)
+        return table.lookup([key or "" for key in keys], default)
+
+    tables = dealer_turn_table(dealer_turn_data, window)
+    stores = isinstance(tables, RooftopTables)
+    industry = industry_index().resolve_many(makes, models)
+    industry_days = [DEFAULT_INDUSTRY_TURN.get(key, FALLBACK_TURN_DAYS) for key in industry]
+    days, found = resolve(tables.group if stores else tables, np.asarray(industry_days, dtype=float))
+    source = np.where(found, 0, 1).astype(np.int8)
+    if np.ndim(rooftop) == 0: rooftop = rooftop_name(rooftop)
+    if not stores or rooftop is None: return days[pair_codes], source[pair_codes]
+
+    # rows for a rooftop: its own table, then the group's (as Group Data); rows without one keep the group's
+    rooftop = np.broadcast_to(np.asarray(rooftop, dtype=object), pair_codes.shape)
+    rooftop_codes, rooftops = pd.factorize(rooftop)
+    group_source = np.where(found, 2, 1).astype(np.int8)
+    row_days = days[pair_codes]
+    row_source = np.where(rooftop_codes >= 0, group_source[pair_codes], source[pair_codes])
+    for code, name in enumerate(rooftops):
+        table = tables.stores.get(name)
+        if not table: continue
+        store_days, store_found = resolve(table, days)
+        rows = rooftop_codes == code
+        row_days[rows] = store_days[pair_codes[rows]]
+        row_source[rows] = np.where(store_found, 0, group_source)[pair_codes[rows]]
+    return row_days, row_source
+
+def rooftop_array(values, default=None):
+    """Per-row `rooftop_name`s (object array, None where blank), blanks taking `default`."""
+    import numpy as np
+    import pandas as pd
+
+    codes, uniques = pd.factorize(pd.Series(values, dtype=object))
+    names = np.array([rooftop_name(v) for v in uniques] + [rooftop_name(default)], dtype=object)
+    out = names[codes]  # code -1 (missing) takes the last entry, the default
+    out[pd.isna(out)] = rooftop_name(default)
+    return out
+
+def taper_ages(year, current_year=CURRENT_YEAR):
+    """max(current_year - year, 0) as ints when every year is whole, so they index the taper tables."""
+    import numpy as np
+    age = np.maximum(current_year - np.asarray(year, dtype=float), 0)
+    return age.astype(np.int64) if np.all(age % 1 == 0) else age
+
+def compact_ints(values):
+    """Integer `values` in the smallest of int16/int32 that holds them; anything else unchanged."""
+    import numpy as np
+    values = np.asarray(values)
+    if values.dtype.kind in "iu" and len(values):
+        for dtype in (np.int16, np.int32):
+            info = np.iinfo(dtype)
+            if info.min <= values.min() and values.max() <= info.max: return values.astype(dtype)
+    return values
+
+def output_ints(values):
+    """
+    `compact_ints` values back at one fixed width (int32) for results, so every chunk of a
+    file shares an output schema whatever range its values span.
+    """
+    import numpy as np
+    return values.astype(np.int32) if values.dtype.kind in "iu" else values.astype(np.float64)
+
+def batch_usecols(header):
+    """Header cells of an appraisal file that a batch appraisal reads, matched lower-cased and stripped."""
+    wanted = set(BATCH_REQUIRED_COLS + BATCH_OPTIONAL_COLS)
+    return [c for c in header if str(c).lower().strip() in wanted]
+
+class PreparedBatch(NamedTuple):
+    """
+    The settings-independent half of a batch appraisal (see `prepare_batch`); one array per field.
+    Text fields are pandas Categoricals and whole numbers use the narrowest int that fits.
+    """
+    year: object
+    make: object
+    model: object
+    mileage: object
+    base_retail: object  # as displayed: the file's retail column, or the market price
+    retail: object
+    appraisal: object
+    reference_miles: object
+    age: object  # taper age in model years (whole ages as ints)
+    price_tier: object  # int8 auto CPM tier, see price_tiers
+    turn_days: object
+    source: object
+    alert: object
+    market_days: object = None  # market mode only
+
+@timed("batch_prepare")
+def prepare_batch(df, dealer_turn_data=None, market=None, current_year=CURRENT_YEAR, window=None, rooftop=None):
+    """
+    Per-row invariants of a normalized batch frame: ages, reference miles, CPM tiers, turn days
+    and mileage alerts. Depends on the file, dealer data and market only, so it can be cached
+    while the sidebar settings change; `price_batch` finishes the appraisal. Rows with a
+    `rooftop` column use their own rooftop's turn days, blanks the `rooftop` argument's.
+    """
+    import numpy as np
+    import pandas as pd
+
+    year = df['year'].to_numpy(dtype=float)
+    mileage = df['mileage'].to_numpy(dtype=float)
+    if market is None:
+        retail = df['retail'].to_numpy(dtype=float)
+        reference_miles = np.maximum(current_year - year, 1) * 12000
+    else:
+        retail = market['market_price'].to_numpy(dtype=float)
+        reference_miles = market['market_odometer'].to_numpy(dtype=float)
+    make, model = pd.Categorical(df['make']), pd.Categorical(df['model'])
+    if 'rooftop' in df.columns: rooftop = rooftop_array(df['rooftop'], rooftop)
+    turn_days, source = turn_days_array(make, model, dealer_turn_data, window, rooftop)
+    alert = np.select([mileage >= 100000, mileage >= 95000], [2, 1], 0).astype(np.int8)
+    return PreparedBatch(
+        year=compact_ints(df['year'].to_numpy()), make=make, model=model,
+        mileage=compact_ints(df['mileage'].to_numpy()),
+        base_retail=df['retail'].to_numpy() if market is None else retail,
+        retail=retail, appraisal=df['appraisal'].to_numpy(dtype=float), reference_miles=reference_miles,
+        age=compact_ints(taper_ages(year, current_year)), price_tier=price_tiers(retail),
+        turn_days=turn_days, source=pd.Categorical.from_codes(source, DATA_SOURCES),
+        alert=pd.Categorical.from_codes(alert, MILEAGE_ALERTS),
+        market_days=None if market is None else market['market_days'].to_numpy(dtype=float),
+    )
+
+@timed("batch_price")
+def price_batch(prepared, settings):
+    """
+    Applies AppraisalSettings to a PreparedBatch. Returns the same frame as `appraise_batch`:
+    money columns in float64, Front Margin and Turn Days in float32 (shown to 0.1% and whole days),
+    whole Year/Mileage in int32 (float64 when missing values made them float),
+    Priority/Alert/Make/Model/Data Source/Status as Categoricals.
+    """
+    import numpy as np
+    import pandas as pd
+
+    s, p = settings, prepared
+    mileage = p.mileage.astype(float)
+    table = cpm_table(s.current_year, s.cpm_decay, s.cpm_floor)
+    cpm = table.rates(p.age, p.price_tier if s.use_auto else None, s.manual_cpm)
+
+    mileage_impact = (p.reference_miles - mileage) * cpm
+    adj_retail = p.retail + mileage_impact
+
+    max_buy = (adj_retail * (1 - s.margin_target)) - s.recon_cost - s.buy_fees
+    room = max_buy - p.appraisal
+
+    front_gross = adj_retail - p.appraisal - s.recon_cost - s.buy_fees
+    front_margin = np.divide(front_gross, adj_retail, out=np.zeros_like(front_gross), where=adj_retail > 0)
+    total_deal = front_gross + s.below_line
+
+    priority = pd.Categorical.from_codes(priority_codes(p.turn_days, front_margin), PRIORITY_LEVELS)
+    # NaN room (missing retail/year/comps) fails closed as OVER BUDGET, like appraise_row
+    status = pd.Categorical.from_codes((~(room >= 0)).astype(np.int8), STATUS_LEVELS)
+
+    res_df = pd.DataFrame({
+        "Priority": priority, "Alert": p.alert,
+        "Year": output_ints(p.year), "Make": p.make, "Model": p.model, "Mileage": output_ints(p.mileage),
+        "Base Retail": p.base_retail, "Mileage Impact": mileage_impact,
+        "Adjusted Retail": adj_retail, "Max Buy": max_buy, "Room": room,
+        "Front Gross": front_gross, "Front Margin": front_margin.astype(np.float32), "Total Deal": total_deal,
+        "Turn Days": p.turn_days.astype(np.float32), "Data Source": p.source, "Status": status,
+    }, copy=False)
+    if p.market_days is not None:
+        res_df.insert(res_df.columns.get_loc("Base Retail") + 1, "Market Odometer", p.reference_miles.astype(np.float32))
+        res_df.insert(res_df.columns.get_loc("Market Odometer") + 1, "Market Days", p.market_days.astype(np.float32))
+    return res_df
+
+def appraise_batch(df, settings, dealer_turn_data=None, market=None, window=None, rooftop=None):
+    """
+    Columnar equivalent of running `appraise_row` over every row of `df`.
+    Expects the normalized lower-case batch columns in BATCH_REQUIRED_COLS.
+    With `market` (see market_data.market_stats) each row is priced like the single VIN
+    lookup instead: market average price as base retail, adjusted against the market median odometer.
+    Rows without comps (NaN market stats) get no Max Buy and come out OVER BUDGET, never as buys.
+    `window` picks the turn window of a windowed `dealer_turn_data` (see `dealer_turn_table`)
+    and `rooftop` the store of a dealer group's RooftopTables, as in `prepare_batch`.
+    """
+    return price_batch(prepare_batch(df, dealer_turn_data, market, settings.current_year, window, rooftop), settings)
+
+# ---------------------------------------------------------
+# WHAT-IF SENSITIVITY
+# ---------------------------------------------------------
+class SensitivityGrid(NamedTuple):
+    """Batch results over every margin x recon x CPM mode combination (see `sensitivity_grid`)."""
+    margins: object  # (M,)
+    recons: object  # (R,)
+    cpm_modes: list  # C (use_auto, manual_cpm) pairs
+    max_buy: object  # (C, M, R, N)
+    room: object  # (C, M, R, N)
+    front_gross: object  # (C, R, N); doesn't depend on the margin target
+    break_even_margin: object  # (C, R, N) margin target where room is zero; NaN without positive adjusted retail
+
+@timed("sensitivity_grid")
+def sensitivity_grid(prepared, margins, recons, cpm_modes, buy_fees=BUY_FEES, cpm_decay=CPM_DECAY,
+                     cpm_floor=CPM_FLOOR, current_year=CURRENT_YEAR):
+    """
+    Max buy, room and front gross of a PreparedBatch across the full margins x recons x cpm_modes
+    grid in one broadcast pass. Each cell matches `price_batch` with those settings exactly;
+    `current_year` must be the one `prepared` was built with.
+    Room is zero where adj_retail * (1 - margin) = appraisal + recon + fees, so the break-even
+    margin is front gross over adjusted retail: the front margin at that recon and CPM mode.
+    """
+    import numpy as np
+
+    margins = np.asarray(margins, dtype=float)
+    recons = np.asarray(recons, dtype=float)
+    mileage = prepared.mileage.astype(float)
+    table = cpm_table(current_year, cpm_decay, cpm_floor)
+    cpm = np.stack([table.rates(prepared.age, prepared.price_tier if use_auto else None, manual_cpm)
+                    for use_auto, manual_cpm in cpm_modes])
+    adj_retail = prepared.retail + (prepared.reference_miles - mileage) * cpm  # (C, N)
+
+    max_buy = (adj_retail[:, None, None, :] * (1 - margins)[None, :, None, None]) - recons[None, None, :, None] - buy_fees
+    room = max_buy - prepared.appraisal
+    front_gross = adj_retail[:, None, :] - prepared.appraisal - recons[None, :, None] - buy_fees
+    adj = np.broadcast_to(adj_retail[:, None, :], front_gross.shape)
+    break_even = np.divide(front_gross, adj, out=np.full_like(front_gross, np.nan), where=adj > 0)
+    return SensitivityGrid(margins, recons, list(cpm_modes), max_buy, room, front_gross, break_even)
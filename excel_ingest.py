@@ -0,0 +1,284 @@
+"""
+Fast .xlsx reading for DMS exports and appraisal uploads. `read_workbook` streams the first
+sheet's XML straight out of the zip with expat, keeps only the columns the caller picks from
+the header row, and hands those cells to pandas' TextParser the way `pd.read_excel` does, so
+the frame matches `pd.read_excel(usecols=..., dtype=...)` without building a cell object for
+every value in the sheet. Converted sheets are cached by content hash in memory and, with
+EXCEL_CACHE_DIR set, as Parquet on disk, so a workbook seen before isn't parsed again.
+"""
+import io
+import os
+import posixpath
+import zipfile
+from xml.parsers import expat
+
+from caching import ParquetCache, TTLCache, content_hash, parquet_available
+from instrumentation import METRICS, timed
+
+# ---------------------------------------------------------
+# SETTINGS
+# ---------------------------------------------------------
+# Bump EXCEL_CACHE_VERSION whenever the conversion changes what read_workbook returns
+EXCEL_CACHE_VERSION = 1
+EXCEL_CACHE_DIR = os.environ.get("EXCEL_CACHE_DIR")  # unset (or no pyarrow): memory only
+EXCEL_CACHE_MAX_BYTES = 1024 * 1024 * 1024
+
+_DIGITS = "0123456789"
+
+# ---------------------------------------------------------
+# WORKBOOK PARTS
+# ---------------------------------------------------------
+def _local(tag):
+    """Element name without its namespace ('{ns}sheet' or 'x:sheet' -> 'sheet')."""
+    return tag.rpartition('}')[2].rpartition(':')[2]
+
+def _part_path(base, target):
+    return target.lstrip('/') if target.startswith('/') else posixpath.normpath(posixpath.join(posixpath.dirname(base), target))
+
+def _relationships(archive, part):
+    """{relationship id: (type suffix, part path)} for one part of the package."""
+    import xml.etree.ElementTree as ET
+
+    rels = posixpath.join(posixpath.dirname(part), '_rels', posixpath.basename(part) + '.rels')
+    if rels not in archive.namelist(): return {}
+    root = ET.fromstring(archive.read(rels))
+    return {rel.get('Id'): (rel.get('Type', '').rpartition('/')[2], _part_path(part, rel.get('Target', '')))
+            for rel in root if _local(rel.tag) == 'Relationship' and rel.get('TargetMode') != 'External'}
+
+def _workbook_parts(archive):
+    """(first sheet path, shared strings path or None, styles path or None, 1904 date system?)."""
+    import xml.etree.ElementTree as ET
+
+    package = _relationships(archive, '')
+    book = next((path for kind, path in package.values() if kind == 'officeDocument'), 'xl/workbook.xml')
+    rels = _relationships(archive, book)
+    root = ET.fromstring(archive.read(book))
+    sheet = None
+    date1904 = False
+    for el in root.iter():
+        name = _local(el.tag)
+        if name == 'workbookPr':
+            date1904 = el.get('date1904', '').lower() in ('1', 'true')
+        elif name == 'sheet' and sheet is None:
+            rid = next((v for k, v in el.attrib.items() if _local(k) == 'id'), None)
+            if rid in rels and rels[rid][0] == 'worksheet': sheet = rels[rid][1]
+    if sheet is None: raise ValueError("workbook has no worksheets")
+    by_kind = {kind: path for kind, path in rels.values()}
+    return sheet, by_kind.get('sharedStrings'), by_kind.get('styles'), date1904
+
+def _shared_strings(archive, path):
+    """The shared string table, joined the way openpyxl reads it (plain text + rich text runs)."""
+    import xml.etree.ElementTree as ET
+
+    strings = []
+    if path is None or path not in archive.namelist(): return strings
+    for _, node in ET.iterparse(archive.open(path)):
+        if _local(node.tag) != 'si': continue
+        parts = [el.text or '' for el in node if _local(el.tag) == 't']
+        parts += [t.text or '' for run in node if _local(run.tag) == 'r' for t in run if _local(t.tag) == 't']
+        strings.append(''.join(parts).replace('x005F_', ''))
+        node.clear()
+    return strings
+
+def _date_styles(archive, path):
+    """(style ids formatted as dates, style ids formatted as durations), as openpyxl decides them."""
+    import xml.etree.ElementTree as ET
+    from openpyxl.styles.numbers import BUILTIN_FORMATS, is_date_format, is_timedelta_format
+
+    dates, durations = set(), set()
+    if path is None or path not in archive.namelist(): return dates, durations
+    root = ET.fromstring(archive.read(path))
+    custom, xfs = {}, []
+    for el in root:
+        if _local(el.tag) == 'numFmts':
+            custom = {int(f.get('numFmtId')): f.get('formatCode', '') for f in el}
+        elif _local(el.tag) == 'cellXfs':
+            xfs = [int(xf.get('numFmtId', 0)) for xf in el]
+    for style, fmt_id in enumerate(xfs):
+        fmt = custom[fmt_id] if fmt_id in custom else BUILTIN_FORMATS.get(fmt_id, 'General')
+        if is_date_format(fmt): dates.add(style)
+        if is_timedelta_format(fmt): durations.add(style)
+    return dates, durations
+
+# ---------------------------------------------------------
+# SHEET STREAMING
+# ---------------------------------------------------------
+def _sheet_rows(stream, select, shared, dates, durations, epoch):
+    """
+    Header row (as `select` picked it) followed by every data row, restricted to the selected
+    columns. Cells are converted like pandas' openpyxl reader: blank -> "", errors -> NaN,
+    whole numbers -> int, date-formatted numbers -> datetime. Trailing blank rows are dropped.
+    """
+    from openpyxl.utils.cell import column_index_from_string
+    from openpyxl.utils.datetime import from_ISO8601, from_excel
+
+    rows = []
+    width = 0
+    wanted = None       # column index -> output position, once the header has been read
+    header = {}
+    columns = {}        # column letters -> index
+    names = {}          # raw element name -> local name
+    row = None
+    row_number = 0
+    last_data_row = 0
+    col = -1
+    slot = None
+    cell_type = cell_style = None
+    text = []
+    collecting = False
+    phonetic = 0
+
+    def choose_columns():
+        nonlocal wanted, width
+        cells = [header.get(i, "") for i in range(max(header, default=-1) + 1)]
+        chosen = select(cells)
+        positions = sorted({cells.index(name) for name in chosen if name in cells})
+        wanted = {pos: i for i, pos in enumerate(positions)}
+        width = len(positions)
+        rows.append([cells[pos] for pos in positions])
+
+    def convert():
+        raw = ''.join(text)
+        if not raw: return ""
+        if cell_type == 'n':
+            value = float(raw) if ('.' in raw or 'E' in raw or 'e' in raw) else int(raw)
+            if cell_style in dates:
+                try: return from_excel(value, epoch, timedelta=cell_style in durations)
+                except (OverflowError, ValueError): return float('nan')
+            whole = int(value)
+            return whole if whole == value else float(value)
+        if cell_type == 's': return shared[int(raw)]
+        if cell_type == 'b': return bool(int(raw))
+        if cell_type == 'e': return float('nan')
+        if cell_type == 'd': return from_ISO8601(raw)
+        return raw  # inlineStr, str (formula result)
+
+    def start(tag, attrs):
+        nonlocal row, row_number, col, slot, cell_type, cell_style, text, collecting, phonetic, last_data_row
+        name = names.get(tag)
+        if name is None: name = names[tag] = _local(tag)
+        if name == 'c':
+            ref = attrs.get('r')
+            if ref:
+                letters = ref.rstrip(_DIGITS)
+                col = columns.get(letters)
+                if col is None: col = columns[letters] = column_index_from_string(letters) - 1
+            else:
+                col += 1
+            slot = col if wanted is None else wanted.get(col)
+            if slot is not None:
+                cell_type = attrs.get('t', 'n')
+                style = attrs.get('s')
+                cell_style = int(style) if style else 0
+                text = []
+        elif name == 'v' or name == 't':
+            collecting = slot is not None and not phonetic
+            if name == 'v': last_data_row = row_number
+        elif name == 'is':
+            last_data_row = row_number
+        elif name == 'rPh':
+            phonetic += 1
+        elif name == 'row':
+            number = attrs.get('r')
+            number = int(number) if number else row_number + 1
+            if wanted is None and number > 1:
+                choose_columns()
+                row_number = max(row_number, 1)  # a missing first row is a blank header
+            if wanted is not None:
+                rows.extend([""] * width for _ in range(row_number + 1, number))
+                row = [""] * width
+                rows.append(row)
+            row_number = number
+            col = -1
+
+    def end(tag):
+        nonlocal slot, collecting, phonetic
+        name = names[tag]
+        if name == 'c':
+            if slot is not None:
+                value = convert()
+                if wanted is None: header[slot] = value
+                else: row[slot] = value
+            slot = None
+        elif name == 'v' or name == 't':
+            collecting = False
+        elif name == 'rPh':
+            phonetic -= 1
+
+    def chars(data):
+        if collecting: text.append(data)
+
+    parser = expat.ParserCreate()
+    parser.buffer_text = True
+    parser.StartElementHandler = start
+    parser.EndElementHandler = end
+    parser.CharacterDataHandler = chars
+    parser.ParseFile(stream)
+    if wanted is None: choose_columns()
+    # rows[n] is sheet row n + 1; rows[0] the header
+    return rows[:max(last_data_row, 1)]
+
+
+@timed("excel_read")
+def parse_workbook(data, select, dtype=None):
+    """
+    The first sheet of .xlsx bytes `data` as a DataFrame of just the columns `select(header)`
+    names, in file order. `header` is the first row's cell values ("" for blanks); `select`
+    may raise to reject the file. Anything that isn't an .xlsx zip goes through `pd.read_excel`.
+    """
+    from openpyxl.utils.datetime import CALENDAR_MAC_1904, CALENDAR_WINDOWS_1900
+    from pandas.io.parsers import TextParser
+
+    try:
+        archive = zipfile.ZipFile(io.BytesIO(data))
+    except zipfile.BadZipFile:
+        import pandas as pd
+        usecols = select(list(pd.read_excel(io.BytesIO(data), nrows=0).columns))
+        return pd.read_excel(io.BytesIO(data), usecols=usecols, dtype=dtype)
+    with archive:
+        sheet, strings_path, styles_path, date1904 = _workbook_parts(archive)
+        dates, durations = _date_styles(archive, styles_path)
+        with archive.open(sheet) as stream:
+            rows = _sheet_rows(stream, select, _shared_strings(archive, strings_path), dates, durations,
+                               CALENDAR_MAC_1904 if date1904 else CALENDAR_WINDOWS_1900)
+    if dtype: dtype = {k: v for k, v in dtype.items() if k in rows[0]}
+    return TextParser(rows, header=0, dtype=dtype or None, skip_blank_lines=False).read()
+
+# ---------------------------------------------------------
+# CONVERTED-SHEET CACHE
+# ---------------------------------------------------------
+class WorkbookCache:
+    """
+    Converted sheets keyed by `tag` (which columns and dtypes the caller reads) and a content
+    hash of the workbook bytes. Recent frames live in memory; with a `directory` they are also
+    written as Parquet, so later loads of the same file, in any process, skip the XML entirely.
+    Without pyarrow the cache stays in memory.
+    """
+
+    def __init__(self, max_entries=4, directory=EXCEL_CACHE_DIR, max_bytes=EXCEL_CACHE_MAX_BYTES):
+        self.memory = TTLCache(max_entries=max_entries)
+        self.disk = ParquetCache(directory, max_bytes=max_bytes) if directory and parquet_available() else None
+
+    def get_or_parse(self, data, select, tag, dtype=None):
+        key = f"xlsx-v{EXCEL_CACHE_VERSION}-{tag}-{content_hash(data)}"
+        df = self.memory.get(key)
+        if df is None and self.disk is not None:
+            df = self.disk.get(key)
+        if df is None:
+            df = parse_workbook(data, select, dtype)
+            if self.disk is not None:
+                # mixed-type object columns have no Parquet type; those frames stay in memory only
+                try: self.disk.put(key, df)
+                except (TypeError, ValueError): pass
+        self.memory.put(key, df)
+        # shallow copy: callers may rename or add columns without touching the cached frame
+        return df.copy(deep=False)
+
+
+WORKBOOK_CACHE = WorkbookCache()
+METRICS.watch_cache("workbook", WORKBOOK_CACHE.memory)
+
+def read_workbook(data, select, tag, dtype=None, cache=WORKBOOK_CACHE):
+    """`parse_workbook` through `cache` (None parses every time)."""
+    if cache is None: return parse_workbook(data, select, dtype)
+    return cache.get_or_parse(data, select, tag, dtype)
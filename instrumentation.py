@@ -0,0 +1,154 @@
+"""
+Lightweight timing spans and counters for the hot paths. Spans feed a process-wide histogram
+per stage (exported as Prometheus text, optionally served on METRICS_PORT) and, between
+`METRICS.begin_run()` and `end_run()`, a per-thread list of timings for the diagnostics panel.
+Standard library only, so engine and the other headless modules can import it freely.
+"""
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+# ---------------------------------------------------------
+# SETTINGS
+# ---------------------------------------------------------
+METRICS_PORT = int(os.environ.get("METRICS_PORT") or 0)  # unset: no /metrics endpoint
+METRICS_LOG_PATH = os.environ.get("METRICS_LOG_PATH")    # unset: no JSON-lines run log
+SPAN_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+METRIC_PREFIX = "profitlogic"
+
+
+class Metrics:
+    """
+    Span histograms, named counters and watched caches. A watched cache is anything with
+    `hits`/`misses` attributes (TTLCache, VinCache, VinPrefixIndex), read at export time.
+    """
+
+    def __init__(self, buckets=SPAN_BUCKETS):
+        self.buckets = buckets
+        self.spans = {}     # stage -> [count, total seconds, per-bucket counts]
+        self.counters = {}
+        self.caches = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def observe(self, stage, seconds):
+        with self._lock:
+            entry = self.spans.get(stage)
+            if entry is None:
+                entry = self.spans[stage] = [0, 0.0, [0] * len(self.buckets)]
+            entry[0] += 1
+            entry[1] += seconds
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    entry[2][i] += 1
+                    break
+        run = getattr(self._local, "run", None)
+        if run is not None: run.append((stage, seconds))
+
+    @contextmanager
+    def span(self, stage):
+        start = time.perf_counter()
+        try: yield
+        finally: self.observe(stage, time.perf_counter() - start)
+
+    def timed(self, stage):
+        """Decorator form of `span`."""
+        def wrap(fn):
+            @wraps(fn)
+            def inner(*args, **kwargs):
+                with self.span(stage): return fn(*args, **kwargs)
+            return inner
+        return wrap
+
+    def count(self, name, n=1):
+        with self._lock: self.counters[name] = self.counters.get(name, 0) + n
+
+    def watch_cache(self, name, cache):
+        self.caches[name] = cache
+
+    def begin_run(self):
+        """From here until `end_run`, also collects (stage, seconds) for every span this thread finishes."""
+        self._local.run = run = []
+        return run
+
+    def end_run(self):
+        self._local.run = None
+
+    def cache_stats(self):
+        """{name: (hits, misses, entries or None)} for every watched cache."""
+        stats = {}
+        for name, cache in list(self.caches.items()):
+            try: entries = len(cache)
+            except TypeError: entries = None
+            stats[name] = (cache.hits, cache.misses, entries)
+        return stats
+
+    def prometheus_text(self):
+        """Everything in the Prometheus text exposition format."""
+        p = METRIC_PREFIX
+        lines = [f"# HELP {p}_stage_seconds Time spent in each instrumented stage.",
+                 f"# TYPE {p}_stage_seconds histogram"]
+        with self._lock:
+            spans = {stage: (n, total, list(hist)) for stage, (n, total, hist) in self.spans.items()}
+            counters = dict(self.counters)
+        for stage, (n, total, hist) in sorted(spans.items()):
+            cumulative = 0
+            for bound, hits in zip(self.buckets, hist):
+                cumulative += hits
+                lines.append(f'{p}_stage_seconds_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+            lines.append(f'{p}_stage_seconds_bucket{{stage="{stage}",le="+Inf"}} {n}')
+            lines.append(f'{p}_stage_seconds_sum{{stage="{stage}"}} {total:.6f}')
+            lines.append(f'{p}_stage_seconds_count{{stage="{stage}"}} {n}')
+        lines += [f"# HELP {p}_events_total Named event counters.", f"# TYPE {p}_events_total counter"]
+        lines += [f'{p}_events_total{{name="{name}"}} {n}' for name, n in sorted(counters.items())]
+        stats = self.cache_stats()
+        for kind, i in [("hits", 0), ("misses", 1)]:
+            lines += [f"# HELP {p}_cache_{kind}_total Cache lookups that {'found' if i == 0 else 'missed'} an entry.",
+                      f"# TYPE {p}_cache_{kind}_total counter"]
+            lines += [f'{p}_cache_{kind}_total{{cache="{name}"}} {s[i]}' for name, s in sorted(stats.items())]
+        lines += [f"# HELP {p}_cache_entries Entries currently held.", f"# TYPE {p}_cache_entries gauge"]
+        lines += [f'{p}_cache_entries{{cache="{name}"}} {s[2]}' for name, s in sorted(stats.items()) if s[2] is not None]
+        return "\n".join(lines) + "\n"
+
+    def log_run(self, path, run, **fields):
+        """Appends one JSON line with a recorded run's stage timings (ms) and cache counters."""
+        record = {"ts": time.time(), **fields,
+                  "stages": [{"stage": stage, "ms": round(seconds * 1000, 3)} for stage, seconds in run],
+                  "caches": {name: {"hits": h, "misses": m} for name, (h, m, _) in self.cache_stats().items()}}
+        with self._lock, open(path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record) + "\n")
+
+
+METRICS = Metrics()
+span = METRICS.span
+timed = METRICS.timed
+
+# ---------------------------------------------------------
+# PROMETHEUS ENDPOINT
+# ---------------------------------------------------------
+def serve_metrics(port=METRICS_PORT, host="0.0.0.0", metrics=METRICS):
+    """Serves `metrics` at http://host:port/metrics on a daemon thread; returns the server."""
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = metrics.prometheus_text().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
@@ -0,0 +1,195 @@
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import NamedTuple, Optional
+
+from caching import TTLCache
+from engine import CURRENT_YEAR, cpm_table, vehicle_key
+from instrumentation import timed
+
+# ---------------------------------------------------------
+# CONSTANTS & DEFAULTS
+# ---------------------------------------------------------
+BASE_MSRP = {
+    'hyundai_tucson': 26000, 'hyundai_elantra': 21000, 'hyundai_sonata': 25000,
+    'nissan_rogue': 28000, 'nissan_altima': 25000, 'toyota_camry': 27000,
+    'toyota_rav4': 29000, 'honda_accord': 28000, 'kia_sportage': 27000,
+    'genesis_gv70': 45000, 'chevrolet_equinox': 26000, 'ford_escape': 27000
+}
+
+MARKET_CACHE_TTL = 15 * 60
+MARKET_CACHE_MAX_ENTRIES = 4096
+
+SELLERS = ["SUN STATE FORD", "MAZDA OF WESLEY...", "GETTEL STADIUM...", "Prime Leasing and Sales",
+           "CAR SELECT LLC", "Universal Nissan", "OFFLEASE ORLANDO", "C & L MOTORS"]
+COLORS = ["Blue", "Black", "Gray", "Silver", "White", "Red"]
+INTERIORS = ["Black Cloth", "Gray Cloth", "Black Leather", "Beige Leather"]
+
+LISTING_COLUMNS = ["Rank", "vRank", "Vehicle", "Color", "Interior", "List Price", "Odometer (mi)",
+                   "Age", "Distance (mi)", "Seller", "VDP"]
+
+
+class MarketQuery(NamedTuple):
+    make: str
+    model: str
+    year: int
+    radius: int
+    zip_code: str
+    target_mileage: Optional[int] = None
+
+
+def radius_miles(radius):
+    return int(str(radius).replace(" miles", ""))
+
+def make_query(make, model, year, radius, zip_code, target_mileage=None):
+    return MarketQuery(str(make), str(model), int(year), radius_miles(radius), str(zip_code),
+                       None if target_mileage is None else int(target_mileage))
+
+# ---------------------------------------------------------
+# PROVIDERS
+# ---------------------------------------------------------
+class MarketProvider:
+    """
+    Source of competitive listings. `search` returns a DataFrame with LISTING_COLUMNS,
+    ranked by List Price. FUTURE API PLUG-IN: a MarketCheck provider subclasses this and calls
+    e.g. requests.get(f"https://api.marketcheck.com/v2/search/car/active?api_key=YOUR_KEY...").
+    """
+
+    network_bound = True  # fetch cache misses concurrently
+
+    def search(self, query):
+        raise NotImplementedError
+
+
+class MockMarketProvider(MarketProvider):
+    """
+    Simulated vAuto-style listings, 18 to 35 per search, drawn in one shot from a NumPy
+    generator seeded by make/model/year/zip so the same vehicle always gets the same market.
+    Odometers center on `target_mileage` when given, otherwise on 12k miles per year of age.
+    """
+
+    network_bound = False
+
+    def search(self, query):
+        import numpy as np
+        import pandas as pd
+
+        make, model, year, radius, zip_code, target_mileage = query
+        base_price = BASE_MSRP.get(vehicle_key(make, model), 25000) * cpm_table().factor(max(0, CURRENT_YEAR - year))
+        center = target_mileage if target_mileage is not None else max(CURRENT_YEAR - year, 1) * 12000
+
+        seed = int.from_bytes(hashlib.sha256(f"{make}{model}{year}{zip_code}".encode()).digest()[:8], "little")
+        rng = np.random.default_rng(seed)
+        n = int(rng.integers(18, 36))
+        price_var = rng.normal(0, 1500, n)
+        mileage_var = rng.normal(0, 15000, n)
+
+        df = pd.DataFrame({
+            "Vehicle": f"{year} {make} {model}",
+            "Color": np.array(COLORS, dtype=object)[rng.integers(0, len(COLORS), n)],
+            "Interior": np.array(INTERIORS, dtype=object)[rng.integers(0, len(INTERIORS), n)],
+            "List Price": np.maximum(4000, np.trunc(base_price - mileage_var * 0.08 + price_var)).astype(int),
+            "Odometer (mi)": np.maximum(1000, np.trunc(center + mileage_var)).astype(int),
+            "Age": np.abs(rng.normal(45, 30, n)).astype(int),
+            "Distance (mi)": rng.integers(0, radius + 1, n),
+            "Seller": np.array(SELLERS, dtype=object)[rng.integers(0, len(SELLERS), n)],
+            "VDP": "🔗 Link"
+        })
+        # Sort by price ascending to match vAuto default Rank
+        df = df.sort_values(by="List Price", kind="stable").reset_index(drop=True)
+        df.insert(0, "Rank", np.arange(1, n + 1))
+        # Randomize vRank (vAuto's proprietary value rank)
+        df.insert(1, "vRank", rng.permutation(n) + 1)
+        return df
+
+# ---------------------------------------------------------
+# CACHED ACCESS
+# ---------------------------------------------------------
+class MarketData:
+    """
+    Keyed LRU/TTL cache in front of a MarketProvider. Repeat searches for the same
+    MarketQuery return the cached frame (shared, so copy before mutating it);
+    `search_many` dedupes queries and fetches the misses concurrently.
+    """
+
+    def __init__(self, provider=None, ttl=MARKET_CACHE_TTL, max_entries=MARKET_CACHE_MAX_ENTRIES, max_workers=4):
+        self.provider = provider or MockMarketProvider()
+        self.cache = TTLCache(max_entries=max_entries, ttl=ttl)
+        self.max_workers = max_workers
+
+    @timed("market_fetch")
+    def search(self, make, model, year, radius, zip_code, target_mileage=None):
+        query = make_query(make, model, year, radius, zip_code, target_mileage)
+        return self.cache.get_or_compute(query, lambda: self.provider.search(query))
+
+    @timed("market_fetch")
+    def search_many(self, queries):
+        """Returns {query: listings} for an iterable of MarketQuery."""
+        results, misses = {}, []
+        for query in dict.fromkeys(queries):
+            cached = self.cache.get(query)
+            if cached is None: misses.append(query)
+            else: results[query] = cached
+        if len(misses) > 1 and self.max_workers > 1 and self.provider.network_bound:
+            with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+                fetched = list(pool.map(self.provider.search, misses))
+        else:
+            fetched = [self.provider.search(q) for q in misses]
+        for query, listings in zip(misses, fetched):
+            self.cache.put(query, listings)
+            results[query] = listings
+        return results
+
+# ---------------------------------------------------------
+# BATCH ENRICHMENT
+# ---------------------------------------------------------
+MARKET_STAT_COLUMNS = ["market_price", "market_odometer", "market_days"]
+
+def listing_stats(listings):
+    return (listings["List Price"].mean(), listings["Odometer (mi)"].median(), listings["Age"].mean())
+
+def normalize_zip(value, default=None):
+    """
+    Zip code as a zero-padded 5-digit string (32801.0 -> "32801", 2134 -> "02134", ZIP+4 ->
+    its first five); blanks and NaN give `default`. Anything else non-numeric is kept stripped.
+    """
+    if value is None: return default
+    if isinstance(value, float):
+        if value != value: return default
+        if value.is_integer(): value = int(value)
+    text = str(value).strip()
+    if text.lower() in ("", "nan", "none", "<na>"): return default
+    if text.endswith(".0") and text[:-2].isdigit(): text = text[:-2]
+    head = text.split("-")[0].strip()
+    return head.zfill(5) if head.isdigit() and len(head) <= 5 else text
+
+def zip_codes(values, default):
+    """`normalize_zip` over a column, once per distinct value."""
+    import pandas as pd
+
+    codes, uniques = pd.factorize(pd.Series(values, dtype=object), use_na_sentinel=False)
+    return pd.Series([normalize_zip(v, default) for v in uniques], dtype=object).to_numpy()[codes]
+
+def market_stats(df, market_data, radius, zip_code):
+    """
+    Market average price, median odometer and average days on market for every row of a
+    normalized batch frame. Comps are fetched once per unique (make, model, year, zip, radius)
+    group and gathered back to the rows; a `zip` column, if present, overrides `zip_code`
+    except where blank (see `normalize_zip`). Rows without make/model/year get NaN.
+    """
+    import numpy as np
+    import pandas as pd
+
+    zip_code = normalize_zip(zip_code, str(zip_code))
+    keys = pd.DataFrame({
+        "make": df['make'], "model": df['model'],
+        "year": pd.to_numeric(df['year'], errors='coerce'),
+        "zip": zip_codes(df['zip'], zip_code) if 'zip' in df.columns else zip_code,
+    }, index=df.index)
+    codes = keys.groupby(list(keys.columns), sort=False, dropna=True).ngroup().fillna(-1).to_numpy(dtype=np.int64)
+    groups = keys.assign(code=codes)[codes >= 0].drop_duplicates("code").sort_values("code")
+    queries = [make_query(r.make, r.model, r.year, radius, r.zip) for r in groups.itertuples(index=False)]
+
+    listings = market_data.search_many(queries)
+    stats = np.array([listing_stats(listings[q]) for q in queries], dtype=float).reshape(-1, 3)
+    stats = np.vstack([stats, np.full((1, 3), np.nan)])  # code -1 (missing key) gathers the NaN row
+    return pd.DataFrame(stats[codes], columns=MARKET_STAT_COLUMNS, index=df.index)
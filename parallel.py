@@ -0,0 +1,22 @@
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+
+def ordered_map(fn, items, workers=1, window=None):
+    """
+    Lazily yields fn(item) for every item, in input order. With workers > 1 the calls run in a
+    process pool with at most `window` (default 2 * workers) items in flight, so a generator of
+    chunks is consumed no faster than results are taken; workers <= 1 is a plain map in-process.
+    `fn` and the items must be picklable.
+    """
+    if workers <= 1:
+        yield from map(fn, items)
+        return
+    window = window or 2 * workers
+    items = iter(items)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = [pool.submit(fn, item) for item in islice(items, window)]
+        while pending:
+            result = pending.pop(0).result()
+            pending.extend(pool.submit(fn, item) for item in islice(items, 1))
+            yield result
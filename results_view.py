@@ -0,0 +1,62 @@
+import numpy as np
+import pandas as pd
+
+import theme_analog_warmth as theme
+from engine import PRIORITY_LEVELS, STATUS_LEVELS
+from instrumentation import timed
+
+# ---------------------------------------------------------
+# BATCH RESULTS TABLE: filter/sort server-side, format one page
+# ---------------------------------------------------------
+ALERT_LEVELS = ["100K+ CLIFF", "NEAR 100K", "No Alert"]  # "No Alert" is the blank Alert
+SORT_COLUMNS = ["Priority", "Max Buy", "Room", "Front Gross", "Front Margin", "Turn Days",
+                "Mileage", "Adjusted Retail", "Year", "Make", "Model"]
+PAGE_SIZES = [25, 50, 100, 250]
+MONEY_COLS = ['Base Retail', 'Mileage Impact', 'Adjusted Retail', 'Max Buy', 'Room', 'Front Gross']
+
+
+def select_rows(res_df, priorities=(), statuses=(), alerts=(), sort_by=None, ascending=True):
+    """
+    Positions of the rows passing the Priority/Status/Alert filters (an empty filter keeps
+    everything), in display order. Categorical columns sort in category order (Priority HIGH >
+    MEDIUM > LOW, Make/Model alphabetically); ties keep input order.
+    """
+    keep = np.ones(len(res_df), dtype=bool)
+    if priorities: keep &= res_df['Priority'].isin(priorities).to_numpy()
+    if statuses: keep &= res_df['Status'].isin(statuses).to_numpy()
+    if alerts: keep &= res_df['Alert'].isin(["" if a == "No Alert" else a for a in alerts]).to_numpy()
+    rows = np.flatnonzero(keep)
+    if sort_by:
+        key = res_df[sort_by].iloc[rows]
+        if isinstance(key.dtype, pd.CategoricalDtype): key = key.cat.codes.where(key.cat.codes >= 0)
+        order = key.reset_index(drop=True).sort_values(ascending=ascending, kind='stable').index.to_numpy()
+        rows = rows[order]
+    return rows
+
+
+@timed("format_page")
+def format_page(page_df, market=False):
+    """Display strings and HTML badges for the rows on screen only."""
+    disp_df = page_df.drop(columns=['Total Deal'])
+    disp_df['Priority'] = disp_df['Priority'].map(theme.priority_badge)
+    disp_df['Alert'] = disp_df['Alert'].map(theme.alert_badge)
+    disp_df['Status'] = disp_df['Status'].map(theme.status_indicator)
+
+    disp_df['Mileage'] = disp_df['Mileage'].map(lambda x: f"{x:,.0f}")
+    if market:
+        disp_df['Market Odometer'] = disp_df['Market Odometer'].map(lambda x: f"{x:,.0f}")
+        disp_df['Market Days'] = disp_df['Market Days'].map(lambda x: f"{x:.0f}d")
+    for col in MONEY_COLS:
+        disp_df[col] = disp_df[col].map(lambda x: f"${x:,.2f}")
+
+    disp_df['Front Margin'] = disp_df['Front Margin'].map(lambda x: f"{x*100:.1f}%")
+    disp_df['Turn Days'] = disp_df['Turn Days'].map(lambda x: f"{x:.0f}d")
+    return disp_df
+
+
+def results_csv(res_df):
+    """The full results as the downloadable CSV."""
+    csv_df = res_df.copy(deep=False)
+    csv_df['Turn Days'] = csv_df['Turn Days'].map(lambda x: f"{x:.0f}d")
+    csv_df['Front Margin'] = csv_df['Front Margin'].map(lambda x: f"{x*100:.1f}%")
+    return csv_df.to_csv(index=False).encode('utf-8')
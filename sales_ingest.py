@@ -0,0 +1,767 @@
+import io
+import os
+import pickle
+import re
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import NamedTuple
+
+import numpy as np
+import pandas as pd
+
+from caching import DiskCache, TTLCache, content_hash
+from engine import TURN_WINDOWS, ModelTable, RooftopTables, make_form, model_form, rooftop_array, vehicle_key
+from excel_ingest import read_workbook
+from instrumentation import timed
+from parallel import ordered_map
+
+# ---------------------------------------------------------
+# DMS SALES LOG COLUMNS
+# ---------------------------------------------------------
+SALES_REQUIRED_COLS = ['Sold Date', 'Received Date', 'Make', 'Model', 'Front Gross', 'Total Gross', 'Deal Type', 'Sold Price']
+CURRENCY_COLS = ['Front Gross', 'F&I Products Gross', 'Back Gross', 'Total Gross', 'Sold Price']
+
+# Only these feed the turn/gross aggregates; everything else is skipped at read time
+SALES_USE_COLS = ['Sold Date', 'Received Date', 'Make', 'Model', 'Front Gross', 'Total Gross', 'Deal Type']
+SALES_DTYPES = {'Make': 'category', 'Model': 'category', 'Deal Type': 'category'}
+SALES_CHUNK_ROWS = 100_000
+GROSS_DTYPE = [('front', 'f8'), ('total', 'f8')]  # per-model average gross, see SalesAggregate.results
+
+# Deal number headers seen in DMS exports, first match wins; read in as DEAL_ID for deduping
+DEAL_ID_COLS = ['Deal #', 'Deal No', 'Deal No.', 'Deal Number', 'Deal ID', 'Stock #']
+DEAL_ID = 'Deal_Number'
+# What identifies a deal without a deal number: its parsed values (plus Make/Model), with fixed dtypes
+FINGERPRINT_COLS = {'Days_To_Sell': 'int64', 'Sold_Day': 'int64', 'Front Gross': 'float64', 'Total Gross': 'float64'}
+
+# Store headers of combined dealer-group exports, first match wins; read in as ROOFTOP
+ROOFTOP_COLS = ['Rooftop', 'Store', 'Store Name', 'Store #', 'Store No', 'Store Number', 'Location', 'Dealership']
+ROOFTOP = 'Rooftop'
+UNASSIGNED_ROOFTOP = ''  # deals from exports without a store column; they count toward the group only
+
+# Processed-summary cache. Bump SALES_CACHE_VERSION whenever the ingest logic changes results.
+SALES_CACHE_VERSION = 6
+SALES_CACHE_DIR = os.environ.get("SALES_CACHE_DIR")  # unset: memory only
+# Where the dealer's merged RooftopSales is kept between sessions; unset: per session only
+SALES_STORE_PATH = os.environ.get("SALES_STORE_PATH")
+
+# How the engine.TURN_WINDOWS are computed, see SalesAggregate.window_sums
+TRAILING_DAYS = {'30d': 30, '90d': 90, '365d': 365}
+EWMA_HALFLIFE_DAYS = 90
+ROOFTOP_WORKERS = min(8, os.cpu_count() or 1)  # threads building per-rooftop turn tables
+
+
+class MissingColumnsError(ValueError):
+    pass
+
+# What float() accepts once everything but digits and dots is stripped
+_NUMBER = r'[0-9]+\.?[0-9]*|\.[0-9]+'
+_STRIPPED_CHARS = '$,()-'
+
+# ---------------------------------------------------------
+# CURRENCY PARSING
+# ---------------------------------------------------------
+def parse_currency(val):
+    if pd.isna(val): return 0.0
+    val_str = str(val).strip()
+    if not val_str or val_str == '-': return 0.0
+    is_neg = False
+    if val_str.startswith('(') and val_str.endswith(')'):
+        is_neg, val_str = True, val_str[1:-1]
+    elif val_str.startswith('-'):
+        is_neg, val_str = True, val_str[1:]
+    val_str = re.sub(r'[^\d.]', '', val_str)
+    try: return -float(val_str) if is_neg else float(val_str)
+    except ValueError: return 0.0
+
+def _parse_numeric_column(col):
+    if pd.api.types.is_bool_dtype(col): return pd.Series(0.0, index=col.index)
+    values = col.to_numpy(dtype=float, na_value=np.nan)
+    out = np.where(np.isfinite(values), values, 0.0)
+    if pd.api.types.is_float_dtype(col):
+        # str() switches to scientific notation outside [1e-4, 1e16) and parse_currency reads
+        # those digit by digit; hand the (rare) cells to it so the results stay identical
+        magnitude = np.abs(out)
+        odd = (magnitude != 0) & ((magnitude < 1e-4) | (magnitude >= 1e16))
+        if odd.any(): out[odd] = [parse_currency(v) for v in values[odd]]
+    return pd.Series(out, index=col.index)
+
+def parse_currency_column(col):
+    """
+    Column-level `parse_currency`, with identical results, handling `(1,234.56)`, `-$500`, `-`
+    and blanks with pandas string kernels. Numeric columns skip string parsing altogether.
+    """
+    if pd.api.types.is_numeric_dtype(col): return _parse_numeric_column(col)
+
+    text = col.astype(str).str.strip()
+    negative = ((text.str.startswith('(', na=False) & text.str.endswith(')', na=False))
+                | text.str.startswith('-', na=False)).to_numpy()
+
+    # Plain literal removal covers the usual "$1,234.56" / "(1,234.56)" / "-500" shapes;
+    # anything it leaves malformed goes through the full regex like parse_currency does
+    digits = text
+    for ch in _STRIPPED_CHARS: digits = digits.str.replace(ch, '', regex=False)
+    valid = digits.str.fullmatch(_NUMBER, na=False)
+    redo = ~valid & text.notna()
+    if redo.any():
+        digits = digits.copy()
+        digits[redo] = text[redo].str.replace(r'[^0-9.]', '', regex=True)
+        valid = digits.str.fullmatch(_NUMBER, na=False)
+
+    valid = valid.to_numpy()
+    amount = digits.where(valid).astype(float).to_numpy()
+    out = np.where(valid, np.where(negative, -amount, amount), 0.0)
+    # parse_currency's \d also keeps non-ASCII digits (which float() reads); the string
+    # kernels' character classes may not, so those (rare) cells go through it directly
+    unicode = (redo & text.str.contains(r'[^\x00-\x7f]', regex=True, na=False)).to_numpy()
+    if unicode.any(): out[unicode] = [parse_currency(v) for v in col[unicode]]
+    return pd.Series(out, index=col.index)
+
+# ---------------------------------------------------------
+# STREAMING INGESTION
+# ---------------------------------------------------------
+def sales_usecols(header):
+    """The header cells an ingest reads; raises MissingColumnsError when required columns are missing."""
+    missing = [c for c in SALES_REQUIRED_COLS if c not in header]
+    if missing: raise MissingColumnsError(f"Missing expected columns: {', '.join(missing)}")
+    id_col = next((c for c in DEAL_ID_COLS if c in header), None)
+    rooftop_col = next((c for c in ROOFTOP_COLS if c in header), None)
+    return SALES_USE_COLS + [c for c in (id_col, rooftop_col) if c]
+
+def read_sales_chunks(file, name, chunksize=SALES_CHUNK_ROWS):
+    """
+    Yields the DMS log `chunksize` rows at a time, restricted to SALES_USE_COLS (plus the deal
+    number and store columns, renamed to DEAL_ID and ROOFTOP, when the export has them) with
+    compact dtypes.
+    CSVs are streamed; workbooks go through excel_ingest, which parses only the used columns
+    (and reuses the converted sheet when the same file was read before), and are then sliced.
+    Raises MissingColumnsError when required columns are missing.
+    """
+    dtypes = {**SALES_DTYPES, **dict.fromkeys(DEAL_ID_COLS + ROOFTOP_COLS, str)}
+    if name.endswith('.csv'):
+        usecols = sales_usecols(pd.read_csv(file, nrows=0).columns)
+        file.seek(0)
+        chunks = pd.read_csv(file, usecols=usecols, dtype={c: dtypes[c] for c in usecols if c in dtypes},
+                             chunksize=chunksize)
+    else:
+        df = read_workbook(file.read(), sales_usecols, "sales", dtype=dtypes)
+        usecols = list(df.columns)
+        chunks = (df.iloc[start:start + chunksize] for start in range(0, len(df), chunksize))
+    id_col = next((c for c in DEAL_ID_COLS if c in usecols), None)
+    rooftop_col = next((c for c in ROOFTOP_COLS if c in usecols), None)
+    renames = {col: name for col, name in ((id_col, DEAL_ID), (rooftop_col, ROOFTOP)) if col}
+    for chunk in chunks:
+        yield chunk.rename(columns=renames) if renames else chunk
+
+def deal_ids(df, deals):
+    """
+    (64-bit hash per row identifying the deal, which rows have no deal number). Numbered deals
+    hash their number; the rest hash their parsed make, model, dates and gross from `deals`, so
+    CSV and Excel exports of the same deal agree. Fingerprints can repeat for distinct deals;
+    see `repeat_ranks`. The rooftop is left out, so an export with a store column and one
+    without agree; `RooftopSales` scopes ids to their store.
+    """
+    def fingerprint(rows):
+        keys = rows[list(FINGERPRINT_COLS)].astype(FINGERPRINT_COLS).assign(
+            Make=rows['Make'].astype(str).str.strip(), Model=rows['Model'].astype(str).str.strip())
+        return pd.util.hash_pandas_object(keys, index=False).to_numpy()
+
+    unnumbered = np.ones(len(df), dtype=bool)
+    if DEAL_ID in df.columns:
+        numbers = df[DEAL_ID].astype(str).str.strip()
+        unnumbered = (numbers.isna() | numbers.isin(['', 'nan'])).to_numpy()
+    ids = np.zeros(len(df), dtype=np.uint64)
+    if not unnumbered.all(): ids = pd.util.hash_pandas_object(numbers, index=False).to_numpy()
+    if unnumbered.any(): ids[unnumbered] = fingerprint(deals[unnumbered])
+    return ids, unnumbered
+
+def repeat_ranks(ids, unnumbered, prior=None):
+    """
+    Per deal, how many earlier deals of the same file share its fingerprint (-1 for numbered
+    deals). `prior` (a Series of counts by fingerprint) carries them across a file's chunks.
+    """
+    ranks = np.full(len(ids), -1, dtype=np.int64)
+    fingerprints = pd.Series(ids[unnumbered])
+    ranks[unnumbered] = fingerprints.groupby(fingerprints).cumcount().to_numpy()
+    if prior is not None and len(prior):
+        ranks[unnumbered] += prior.reindex(fingerprints.to_numpy(), fill_value=0).to_numpy()
+    return ranks
+
+def filter_retail_deals(df):
+    """
+    Retail deals with both dates, a 0-365 day turn, parsed gross columns, a Deal_ID hash and
+    its Repeat rank (see `repeat_ranks`), plus their ROOFTOP (blank: UNASSIGNED_ROOFTOP) when
+    the export has a store column.
+    """
+    df = df[df['Deal Type'].astype(str).str.upper() == 'RETAIL']
+    df = df.dropna(subset=['Sold Date', 'Received Date'])
+    sold = pd.to_datetime(df['Sold Date'], errors='coerce')
+    days = (sold - pd.to_datetime(df['Received Date'], errors='coerce')).dt.days
+    keep = ((days >= 0) & (days <= 365)).to_numpy()
+    df = df[keep]
+    deals = pd.DataFrame({
+        'Make': df['Make'].to_numpy(), 'Model': df['Model'].to_numpy(),
+        'Days_To_Sell': days.to_numpy()[keep],
+        'Sold_Day': day_numbers(sold.to_numpy()[keep]),
+        'Front Gross': parse_currency_column(df['Front Gross']).to_numpy(),
+        'Total Gross': parse_currency_column(df['Total Gross']).to_numpy(),
+    })
+    ids, unnumbered = deal_ids(df, deals)
+    deals.insert(0, 'Deal_ID', ids)
+    deals.insert(1, 'Repeat', repeat_ranks(ids, unnumbered))
+    if ROOFTOP in df.columns:
+        rooftops = rooftop_array(df[ROOFTOP].to_numpy())
+        deals[ROOFTOP] = pd.Categorical(np.where(pd.isna(rooftops), UNASSIGNED_ROOFTOP, rooftops))
+    return deals
+
+def day_numbers(dates):
+    """Days since 1970-01-01 (int32) of datetime64 values."""
+    return np.asarray(dates).astype('datetime64[D]').astype(np.int32)
+
+def _month_numbers(days):
+    return days.astype('datetime64[D]').astype('datetime64[M]').astype(np.int32)
+
+def _numbered_ids(deals):
+    """Deal_IDs with each repeated fingerprint's rank mixed in, so every unnumbered deal of a file is distinct."""
+    ids = deals['Deal_ID'].to_numpy(dtype=np.uint64)
+    if 'Repeat' not in deals.columns: return ids
+    ranks = deals['Repeat'].to_numpy()
+    repeats = ranks > 0
+    if not repeats.any(): return ids
+    ids = ids.copy()
+    ids[repeats] ^= ranks[repeats].astype(np.uint64) * np.uint64(0x9E3779B97F4A7C15)
+    return ids
+
+def _sorted_contains(sorted_ids, ids):
+    if not len(sorted_ids): return np.zeros(len(ids), dtype=bool)
+    pos = np.minimum(np.searchsorted(sorted_ids, ids), len(sorted_ids) - 1)
+    return sorted_ids[pos] == ids
+
+
+class DealBuckets(NamedTuple):
+    """Every month bucket of a SalesAggregate flattened into day-sorted arrays (see `SalesAggregate.buckets`)."""
+    pairs: object  # (Make, Model) MultiIndex; a bucket's code indexes it
+    code: object  # (B,) int
+    day: object  # (B,) int32 days since 1970-01-01, ascending
+    sums: object  # (B, 4) float64 in SUM_COLS order
+
+
+class SalesAggregate:
+    """
+    Incremental store of running sums over retail deals: overall totals plus count and sums of
+    Days_To_Sell, Front Gross and Total Gross per make/model, and the same sums per make/model
+    and sale day in one bucket per month for the turn windows. Deals are deduped by Deal_ID,
+    so overlapping exports can be folded in repeatedly; beyond the sums the only per-deal state
+    kept is one sorted 64-bit id. `files` records the uploads already folded in.
+    """
+
+    SUM_COLS = ['Units_Sold', 'Turn_Sum', 'Front_Sum', 'Total_Sum']
+    BUCKET_KEYS = ['Make', 'Model', 'Sold_Day']
+    version = 0  # bumped on every change, so callers can key caches on it
+
+    def __init__(self):
+        self.total_sales = 0
+        self.turn_sum = 0.0
+        self.t_front = 0.0
+        self.t_gross = 0.0
+        self.by_model = pd.DataFrame(columns=['Make', 'Model', *self.SUM_COLS]).set_index(['Make', 'Model'])
+        self.months = {}  # month number (since 1970-01) -> frame of Make, Model, Sold_Day and SUM_COLS
+        self._pending = {}  # month number -> bucket parts not yet folded into `months`
+        self.seen_ids = np.empty(0, dtype=np.uint64)
+        self.files = set()
+        self._results = None
+        self._buckets = None
+        self._windows = {}
+
+    def add(self, deals):
+        """
+        Folds in a frame from `filter_retail_deals`, skipping deals already counted. A deal
+        number seen twice in one file counts once; look-alike deals without one all count.
+        Returns the number added.
+        """
+        ids = _numbered_ids(deals)
+        fresh = ~pd.Series(ids).duplicated().to_numpy() & ~_sorted_contains(self.seen_ids, ids)
+        deals = deals[fresh]
+        if deals.empty: return 0
+        self._remember(ids[fresh])
+        self.total_sales += len(deals)
+        self.turn_sum += deals['Days_To_Sell'].sum()
+        self.t_front += deals['Front Gross'].sum()
+        self.t_gross += deals['Total Gross'].sum()
+        named = deals.dropna(subset=['Make', 'Model']).astype({'Make': str, 'Model': str})
+        sums = dict(
+            Units_Sold=('Days_To_Sell', 'count'),
+            Turn_Sum=('Days_To_Sell', 'sum'),
+            Front_Sum=('Front Gross', 'sum'),
+            Total_Sum=('Total Gross', 'sum')
+        )
+        by_day = named.assign(Month=_month_numbers(named['Sold_Day'].to_numpy())).groupby(
+            ['Month', *self.BUCKET_KEYS], as_index=False).agg(**sums)
+        for month, bucket in by_day.groupby('Month'):
+            self._fold_month(int(month), bucket.drop(columns='Month'))
+        self._fold_sums(named.groupby(['Make', 'Model']).agg(**sums))
+        return len(deals)
+
+    def merge(self, other):
+        """
+        Folds in another aggregate's sums (every partition of a RooftopSales) without touching
+        its deals. Only possible when the two share no Deal_ID; returns False (and changes
+        nothing) otherwise.
+        """
+        parts = list(other.stores.values()) if isinstance(other, RooftopSales) else [other]
+        if any(_sorted_contains(self.seen_ids, part.seen_ids).any() for part in parts): return False
+        # two rooftops' partitions can share a deal number, which counts once here
+        if len(parts) > 1 and pd.Series(np.concatenate([part.seen_ids for part in parts])).duplicated().any():
+            return False
+        for part in parts:
+            if not part.total_sales: continue
+            self._remember(part.seen_ids)
+            self.total_sales += part.total_sales
+            self.turn_sum += part.turn_sum
+            self.t_front += part.t_front
+            self.t_gross += part.t_gross
+            for month, bucket in part.month_buckets().items():
+                self._fold_month(month, bucket)
+            self._fold_sums(part.by_model)
+        return True
+
+    @classmethod
+    def pooled(cls, parts):
+        """
+        Read-only SalesAggregate of several that share no deals (one per rooftop), built from
+        their sums alone; it keeps no deal ids, so nothing can be deduped against it.
+        """
+        agg = cls()
+        for part in parts:
+            agg.total_sales += part.total_sales
+            agg.turn_sum += part.turn_sum
+            agg.t_front += part.t_front
+            agg.t_gross += part.t_gross
+            for month, bucket in part.month_buckets().items():
+                agg._fold_month(month, bucket)
+        if parts: agg._fold_sums(pd.concat([part.by_model for part in parts]).groupby(level=[0, 1]).sum())
+        return agg
+
+    def _remember(self, new_ids):
+        # new_ids are disjoint from seen_ids; a stable (radix) sort of the concatenation stays linear
+        self.seen_ids = np.sort(np.concatenate([self.seen_ids, new_ids]), kind='stable')
+
+    def _fold_month(self, month, bucket):
+        self._pending.setdefault(month, []).append(bucket)
+
+    def month_buckets(self):
+        """`months` with every deal added so far; only the months new deals were sold in are rebuilt."""
+        for month, parts in self._pending.items():
+            old = self.months.get(month)
+            parts = parts if old is None else [old, *parts]
+            if len(parts) > 1:
+                parts = [pd.concat(parts, ignore_index=True).groupby(self.BUCKET_KEYS, as_index=False).sum()]
+            self.months[month] = parts[0]
+        self._pending = {}
+        return self.months
+
+    def _fold_sums(self, part):
+        self.by_model = part if self.by_model.empty else pd.concat([self.by_model, part]).groupby(level=[0, 1]).sum()
+        self._results = self._buckets = None
+        self._windows = {}
+        self.version += 1
+
+    def breakdown(self):
+        bm = self.by_model.sort_index()
+        return pd.DataFrame({
+            'Make': bm.index.get_level_values(0), 'Model': bm.index.get_level_values(1),
+            'Units_Sold': bm['Units_Sold'].to_numpy(dtype=int),
+            'Avg_Turn': bm['Turn_Sum'].to_numpy() / bm['Units_Sold'].to_numpy(),
+            'Avg_Front_Gross': bm['Front_Sum'].to_numpy() / bm['Units_Sold'].to_numpy(),
+            'Avg_Total_Gross': bm['Total_Sum'].to_numpy() / bm['Units_Sold'].to_numpy(),
+        })
+
+    def results(self):
+        """
+        Returns (turn_data, gross_data, summary): engine.ModelTables of average turn days and of
+        (front, total) average gross per vehicle_key, and the totals; summary is None with no deals.
+        Spellings of one vehicle ("CR-V", "CRV") are pooled in the tables under the best-selling
+        spelling's key. Recomputed only after a change.
+        """
+        if self._results is None:
+            self._results = self._compute_results()
+        return self._results
+
+    @timed("sales_aggregate")
+    def _compute_results(self):
+        breakdown = self.breakdown()
+        turn_data, gross_data = _model_tables(self.by_model)
+        if not self.total_sales: return turn_data, gross_data, None
+        summary = {
+            "total_sales": self.total_sales, "t_front": self.t_front, "t_gross": self.t_gross,
+            "avg_turn": self.turn_sum / self.total_sales, "avg_front": self.t_front / self.total_sales,
+            "breakdown": breakdown
+        }
+        return turn_data, gross_data, summary
+
+    def buckets(self):
+        """The month buckets as DealBuckets arrays; rebuilt only after a change."""
+        if self._buckets is None:
+            months = self.month_buckets()
+            frames = [months[month] for month in sorted(months)]
+            if frames:
+                flat = pd.concat(frames, ignore_index=True)
+                code, pairs = pd.factorize(pd.MultiIndex.from_frame(flat[['Make', 'Model']]))
+                day = flat['Sold_Day'].to_numpy(dtype=np.int32)
+                order = np.argsort(day, kind='stable')
+                sums = flat[self.SUM_COLS].to_numpy(dtype=float)[order]
+                self._buckets = DealBuckets(pd.MultiIndex.from_tuples(pairs, names=['Make', 'Model']),
+                                            code[order], day[order], sums)
+            else:
+                self._buckets = DealBuckets(self.by_model.index[:0], np.empty(0, dtype=np.intp),
+                                            np.empty(0, dtype=np.int32), np.empty((0, len(self.SUM_COLS))))
+        return self._buckets
+
+    def latest_sale(self):
+        """Day number of the latest sale in the month buckets, or None without any."""
+        day = self.buckets().day
+        return int(day[-1]) if len(day) else None
+
+    def window_sums(self, window='all', as_of=None):
+        """
+        Per make/model SUM_COLS like `by_model`, over one of TURN_WINDOWS: 'all' is every deal,
+        '30d'/'90d'/'365d' the deals sold in the trailing days up to `as_of`, and 'ewma' every
+        deal sold by `as_of`, weighted by 0.5 ** (days before `as_of` / EWMA_HALFLIFE_DAYS).
+        `as_of` is a date and defaults to the latest sale. Models without deals in the window
+        are left out.
+        """
+        if window in (None, 'all'): return self.by_model
+        if window not in TURN_WINDOWS:
+            raise ValueError(f"Unknown turn window {window!r}; expected one of {', '.join(TURN_WINDOWS)}")
+        b = self.buckets()
+        end = self.latest_sale() if as_of is None else int(day_numbers(np.datetime64(pd.Timestamp(as_of), 'D')))
+        if end is None: return self.by_model.iloc[:0]
+        stop = np.searchsorted(b.day, end, side='right')
+        if window == 'ewma':
+            start = 0
+            sums = b.sums[:stop] * (0.5 ** ((end - b.day[:stop]) / EWMA_HALFLIFE_DAYS))[:, None]
+        else:
+            start = np.searchsorted(b.day, end - TRAILING_DAYS[window] + 1)
+            sums = b.sums[start:stop]
+        code = b.code[start:stop]
+        totals = np.column_stack([np.bincount(code, sums[:, i], minlength=len(b.pairs)) for i in range(sums.shape[1])])
+        present = np.bincount(code, minlength=len(b.pairs)) > 0
+        return pd.DataFrame(totals[present], index=b.pairs[present], columns=self.SUM_COLS)
+
+    def window_tables(self, window='all', as_of=None):
+        """(turn_data, gross_data) ModelTables like `results`, over a turn window (see `window_sums`)."""
+        if window in (None, 'all') and as_of is None: return self.results()[:2]
+        key = (window, as_of)
+        if key not in self._windows:
+            self._windows[key] = _model_tables(self.window_sums(window, as_of))
+        return self._windows[key]
+
+    def turn_table(self, window='all'):
+        """Average turn days per vehicle_key over `window`; engine's turn lookups call this."""
+        return self.window_tables(window)[0]
+
+    def monthly_breakdown(self):
+        """Units, average turn and gross per make/model and month of sale (Month is its first day)."""
+        b = self.buckets()
+        month = b.day.astype('datetime64[D]').astype('datetime64[M]').astype('datetime64[s]')
+        sums = pd.DataFrame(b.sums, columns=self.SUM_COLS).assign(code=b.code, Month=month)
+        sums = sums.groupby(['code', 'Month']).sum().reset_index()
+        pairs = b.pairs[sums['code'].to_numpy()]
+        units = sums['Units_Sold'].to_numpy()
+        return pd.DataFrame({
+            'Make': pairs.get_level_values(0), 'Model': pairs.get_level_values(1), 'Month': sums['Month'].to_numpy(),
+            'Units_Sold': units.astype(int),
+            'Avg_Turn': sums['Turn_Sum'].to_numpy() / units,
+            'Avg_Front_Gross': sums['Front_Sum'].to_numpy() / units,
+            'Avg_Total_Gross': sums['Total_Sum'].to_numpy() / units,
+        }).sort_values(['Make', 'Model', 'Month'], ignore_index=True)
+
+    def __getstate__(self):
+        # the cached results are derived from the sums; recomputed after unpickling
+        self.month_buckets()
+        return {**self.__dict__, '_results': None, '_buckets': None, '_windows': {}}
+
+    def __setstate__(self, state):
+        # stores saved before the month buckets existed load with empty windows
+        self.__dict__.update({'months': {}, '_pending': {}, '_buckets': None, '_windows': {}, **state})
+
+    @property
+    def turn_data(self): return self.results()[0]
+
+    @property
+    def gross_data(self): return self.results()[1]
+
+    @property
+    def summary(self): return self.results()[2]
+
+    def save(self, path):
+        """Atomically pickles the store to `path`."""
+        directory = os.path.dirname(path) or "."
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f: pickle.dump(self, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path):
+        """The store saved at `path`, or an empty one when there is none."""
+        try:
+            with open(path, "rb") as f: return pickle.load(f)
+        except FileNotFoundError:
+            return cls()
+
+
+@lru_cache(maxsize=1 << 16)
+def _pair_form(make, model):
+    """(spelling-pooling form, vehicle_key) of one make/model; every window's tables share them."""
+    make_f = make_form(make)
+    return f"{make_f}|{model_form(make_f, model)}", vehicle_key(make, model)
+
+def _model_tables(sums):
+    """
+    (turn_data, gross_data) ModelTables of per make/model SUM_COLS, pooling the spellings of
+    one vehicle under the key of the spelling with the most units.
+    """
+    pairs = [_pair_form(make, model) for make, model in
+             zip(sums.index.get_level_values(0).tolist(), sums.index.get_level_values(1).tolist())]
+    sums = sums.reset_index(drop=True).assign(form=[form for form, _ in pairs], key=[key for _, key in pairs])
+    merged = sums.sort_values('Units_Sold', ascending=False, kind='stable').groupby('form', sort=False).agg(
+        key=('key', 'first'), units=('Units_Sold', 'sum'), turn=('Turn_Sum', 'sum'),
+        front=('Front_Sum', 'sum'), total=('Total_Sum', 'sum'))
+    units = merged['units'].to_numpy(dtype=float)
+    gross = np.empty(len(merged), dtype=GROSS_DTYPE)
+    gross['front'] = merged['front'].to_numpy(dtype=float) / units
+    gross['total'] = merged['total'].to_numpy(dtype=float) / units
+    keys = merged['key'].to_numpy(dtype=str)
+    return ModelTable(keys, merged['turn'].to_numpy(dtype=float) / units), ModelTable(keys, gross)
+
+
+class RooftopSales:
+    """
+    A dealer group's sales partitioned by rooftop: one SalesAggregate per store in the exports'
+    store column (exports without one land in UNASSIGNED_ROOFTOP) and a group view pooled from
+    their sums. New deals only touch their own rooftops' partitions; the group view and turn
+    tables are rebuilt from the partitions' sums after a change. Reads like a SalesAggregate of
+    the whole group (summary, turn_data, window tables, ...), so it stands in for one.
+
+    Deal ids are scoped to their rooftop, since each store numbers its own deals, except that
+    an unassigned deal is the same deal as a rooftop's with its id: an export without a store
+    column never double-counts one with it.
+    """
+
+    def __init__(self):
+        self.stores = {}  # rooftop -> SalesAggregate
+        self.scoped_ids = True  # False: loaded from a store saved with rooftop-salted ids
+        self.files = set()
+        self._group = None
+        self._tables = {}
+
+    @property
+    def version(self):
+        # every change bumps one partition's version
+        return sum(agg.version for agg in self.stores.values())
+
+    @property
+    def rooftops(self):
+        """Named rooftops with deals, sorted."""
+        return sorted(name for name, agg in self.stores.items() if name != UNASSIGNED_ROOFTOP and agg.total_sales)
+
+    def partition(self, rooftop):
+        """The rooftop's SalesAggregate, created empty on first use."""
+        agg = self.stores.get(rooftop)
+        if agg is None: agg = self.stores[rooftop] = SalesAggregate()
+        return agg
+
+    def add(self, deals, workers=1):
+        """
+        Folds in a frame from `filter_retail_deals`, each deal into its rooftop's partition; with
+        workers > 1 the partitions aggregate concurrently. Returns the number of deals added.
+        """
+        if ROOFTOP not in deals.columns: deals = deals.assign(**{ROOFTOP: UNASSIGNED_ROOFTOP})
+        parts = {name: part.drop(columns=ROOFTOP) for name, part in deals.groupby(ROOFTOP, observed=True, sort=False)}
+        # named rooftops first, so the unassigned deals are checked against this frame's too
+        unassigned = parts.pop(UNASSIGNED_ROOFTOP, None)
+        parts = [(self.partition(name), part[~self._known_elsewhere(name, _numbered_ids(part))])
+                 for name, part in parts.items()]
+        added = sum(_map_partitions(lambda item: item[0].add(item[1]), parts, workers))
+        if unassigned is not None:
+            unassigned = unassigned[~self._known_elsewhere(UNASSIGNED_ROOFTOP, _numbered_ids(unassigned))]
+            added += self.partition(UNASSIGNED_ROOFTOP).add(unassigned)
+        return added
+
+    def _known_elsewhere(self, rooftop, ids):
+        """Which ids another partition already counts: the unassigned one's, or any rooftop's for unassigned deals."""
+        known = np.zeros(len(ids), dtype=bool)
+        for name, agg in self.stores.items():
+            if name != rooftop and UNASSIGNED_ROOFTOP in (name, rooftop):
+                known |= _sorted_contains(agg.seen_ids, ids)
+        return known
+
+    def merge(self, other):
+        """
+        Folds in another RooftopSales (or a single-store SalesAggregate) partition by partition,
+        see `SalesAggregate.merge`. Returns False, changing nothing, if any deal is in both.
+        """
+        parts = other.stores.items() if isinstance(other, RooftopSales) else [(UNASSIGNED_ROOFTOP, other)]
+        parts = [(name, agg) for name, agg in parts if agg.total_sales]
+        if any(_sorted_contains(self.stores[name].seen_ids, agg.seen_ids).any() for name, agg in parts if name in self.stores):
+            return False
+        if any(self._known_elsewhere(name, agg.seen_ids).any() for name, agg in parts): return False
+        for name, agg in parts: self.partition(name).merge(agg)
+        return True
+
+    def group(self):
+        """SalesAggregate of every rooftop's deals (the one partition when there's only one)."""
+        version = self.version
+        if self._group is None or self._group[0] != version:
+            parts = [agg for agg in self.stores.values() if agg.total_sales]
+            self._group = (version, parts[0] if len(parts) == 1 else SalesAggregate.pooled(parts))
+            self._tables = {}
+        return self._group[1]
+
+    def turn_table(self, window='all', workers=ROOFTOP_WORKERS):
+        """
+        RooftopTables over `window` (see SalesAggregate.window_sums): the group's average turn
+        days and every named rooftop's, whose trailing windows end at the group's latest sale.
+        The rooftops' tables are built concurrently; engine's turn lookups call this.
+        """
+        group = self.group()
+        if window not in self._tables:
+            as_of = None
+            if window not in (None, 'all') and group.latest_sale() is not None:
+                as_of = np.datetime64(group.latest_sale(), 'D')
+            stores = [self.stores[name] for name in self.rooftops]
+            tables = _map_partitions(lambda agg: agg.window_tables(window, as_of)[0], stores, workers)
+            self._tables[window] = RooftopTables(group.window_tables(window, as_of)[0], dict(zip(self.rooftops, tables)))
+        return self._tables[window]
+
+    def rooftop_breakdown(self):
+        """Units, average turn and gross per named rooftop."""
+        rows = []
+        for name in self.rooftops:
+            agg = self.stores[name]
+            n = agg.total_sales
+            rows.append((name, n, agg.turn_sum / n, agg.t_front / n, agg.t_gross / n))
+        return pd.DataFrame(rows, columns=['Rooftop', 'Units_Sold', 'Avg_Turn', 'Avg_Front_Gross', 'Avg_Total_Gross'])
+
+    @property
+    def total_sales(self): return sum(agg.total_sales for agg in self.stores.values())
+
+    def results(self): return self.group().results()
+
+    @property
+    def turn_data(self): return self.group().turn_data
+
+    @property
+    def gross_data(self): return self.group().gross_data
+
+    @property
+    def summary(self): return self.group().summary
+
+    def window_sums(self, window='all', as_of=None): return self.group().window_sums(window, as_of)
+
+    def window_tables(self, window='all', as_of=None): return self.group().window_tables(window, as_of)
+
+    def monthly_breakdown(self): return self.group().monthly_breakdown()
+
+    def __getstate__(self):
+        return {**self.__dict__, '_group': None, '_tables': {}}
+
+    def __setstate__(self, state):
+        self.__dict__.update({'scoped_ids': False, **state})
+        if self.scoped_ids: return
+        # stores saved before ids were scoped had each rooftop's hashed into its deals' ids
+        for name, agg in self.stores.items():
+            if name == UNASSIGNED_ROOFTOP or not len(agg.seen_ids): continue
+            salt = pd.util.hash_pandas_object(pd.Series([name]), index=False).to_numpy()[0]
+            agg.seen_ids = np.sort(agg.seen_ids ^ salt)
+        self.scoped_ids = True
+
+    save = SalesAggregate.save
+
+    @classmethod
+    def load(cls, path):
+        """
+        The store saved at `path`, or an empty one when there is none. A SalesAggregate saved
+        before rooftops existed becomes the unassigned partition.
+        """
+        loaded = SalesAggregate.load(path)
+        if isinstance(loaded, cls): return loaded
+        store = cls()
+        store.files, loaded.files = loaded.files, set()
+        if loaded.total_sales: store.stores[UNASSIGNED_ROOFTOP] = loaded
+        return store
+
+
+def _map_partitions(fn, items, workers):
+    """fn over per-rooftop items in order, on a thread pool when workers > 1 and there are several."""
+    if workers <= 1 or len(items) <= 1: return [fn(item) for item in items]
+    with ThreadPoolExecutor(max_workers=min(workers, len(items))) as pool:
+        return list(pool.map(fn, items))
+
+
+@timed("sales_ingest")
+def ingest_sales(file, name, chunksize=SALES_CHUNK_ROWS, into=None, workers=1):
+    """
+    Streams a DMS sales log through `filter_retail_deals` into `into` (a new RooftopSales by
+    default, or a SalesAggregate). With workers > 1 chunks are parsed in a process pool and
+    folded in file order, each chunk's rooftops aggregating concurrently.
+    """
+    agg = RooftopSales() if into is None else into
+    seen = pd.Series(dtype=np.int64)  # unnumbered deals so far, by fingerprint
+    for deals in ordered_map(filter_retail_deals, read_sales_chunks(file, name, chunksize), workers):
+        unnumbered = deals['Repeat'].to_numpy() >= 0
+        if unnumbered.any():
+            fingerprints = deals['Deal_ID'].to_numpy()[unnumbered]
+            if len(seen): deals['Repeat'] = repeat_ranks(deals['Deal_ID'].to_numpy(), unnumbered, seen)
+            seen = seen.add(pd.Series(fingerprints).value_counts(), fill_value=0).astype(np.int64)
+        if isinstance(agg, RooftopSales): agg.add(deals, workers)
+        else: agg.add(deals)
+    return agg
+
+def upload_key(data, name):
+    """Identifies an upload by extension and content hash."""
+    ext = os.path.splitext(name)[1].lower().lstrip('.') or 'csv'
+    return f"sales-v{SALES_CACHE_VERSION}-{ext}-{content_hash(data)}"
+
+
+class SalesSummaryCache:
+    """
+    Per-file RooftopSales keyed by a content hash of the uploaded bytes, so a given file is
+    ingested once no matter how many reruns, sessions or replicas see it. Recent results live in
+    memory; with a `directory` they are also pickled to disk and survive restarts.
+    """
+
+    def __init__(self, max_entries=16, directory=SALES_CACHE_DIR, max_bytes=512 * 1024 * 1024):
+        self.memory = TTLCache(max_entries=max_entries)
+        self.disk = DiskCache(directory, max_bytes=max_bytes) if directory else None
+
+    def get_or_ingest(self, data, name, workers=1):
+        """Returns the RooftopSales of the raw file bytes `data` on their own. Treat it as read-only."""
+        key = upload_key(data, name)
+        agg = self.memory.get(key)
+        if agg is None and self.disk is not None:
+            agg = self.disk.get(key)
+        if agg is None:
+            agg = ingest_sales(io.BytesIO(data), name, workers=workers)
+            if self.disk is not None: self.disk.put(key, agg)
+        self.memory.put(key, agg)
+        return agg
+
+
+def merge_upload(store, data, name, cache=None, workers=1):
+    """
+    Folds an uploaded sales log into `store`, deduping deals against everything already there.
+    Files seen before are skipped; a file sharing no deals with the store is merged from its
+    (cached) per-file sums, and only an overlapping one is re-streamed deal by deal.
+    Returns the number of new deals added.
+    """
+    key = upload_key(data, name)
+    if key in store.files: return 0
+    before = store.total_sales
+    if cache is not None: file_agg = cache.get_or_ingest(data, name, workers=workers)
+    else: file_agg = ingest_sales(io.BytesIO(data), name, workers=workers)
+    if not store.merge(file_agg):
+        ingest_sales(io.BytesIO(data), name, into=store, workers=workers)
+    store.files.add(key)
+    return store.total_sales - before
@@ -0,0 +1,130 @@
+import argparse
+import os
+import sqlite3
+import threading
+import time
+
+# ---------------------------------------------------------
+# CACHE SETTINGS
+# ---------------------------------------------------------
+VIN_CACHE_PATH = os.environ.get("VIN_CACHE_PATH", os.path.join(".cache", "vin_decodes.sqlite"))
+VIN_CACHE_TTL = 90 * 24 * 3600
+VIN_CACHE_MAX_ENTRIES = 500_000
+SQLITE_MAX_VARS = 900  # stay under SQLITE_MAX_VARIABLE_NUMBER on older builds
+
+
+class VinCache:
+    """
+    Persistent VIN -> (make, model, year) cache in a SQLite file, so decodes survive
+    restarts and are shared by every app replica pointed at the same path.
+    Entries expire after `ttl` seconds; past `max_entries` the least recently used go first.
+    """
+
+    def __init__(self, path=VIN_CACHE_PATH, ttl=VIN_CACHE_TTL, max_entries=VIN_CACHE_MAX_ENTRIES):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        if os.path.dirname(path): os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS vin_decodes ("
+            " vin TEXT PRIMARY KEY, make TEXT, model TEXT, year INTEGER,"
+            " decoded_at REAL, last_used REAL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS vin_decodes_lru ON vin_decodes (last_used)")
+        self._conn.commit()
+
+    def get_many(self, vins):
+        """Returns {vin: (make, model, year)} for the fresh entries among `vins`."""
+        vins = list(dict.fromkeys(vins))
+        now = time.time()
+        found = {}
+        with self._lock:
+            for i in range(0, len(vins), SQLITE_MAX_VARS):
+                chunk = vins[i:i + SQLITE_MAX_VARS]
+                rows = self._conn.execute(
+                    f"SELECT vin, make, model, year FROM vin_decodes"
+                    f" WHERE decoded_at >= ? AND vin IN ({','.join('?' * len(chunk))})",
+                    [now - self.ttl, *chunk]
+                ).fetchall()
+                found.update((vin, (make, model, year)) for vin, make, model, year in rows)
+            if found:
+                self._conn.executemany("UPDATE vin_decodes SET last_used = ? WHERE vin = ?",
+                                       [(now, vin) for vin in found])
+                self._conn.commit()
+            self.hits += len(found)
+            self.misses += len(vins) - len(found)
+        return found
+
+    def get(self, vin):
+        return self.get_many([vin]).get(vin)
+
+    def put_many(self, entries):
+        """Stores (vin, make, model, year) tuples and evicts down to `max_entries`."""
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO vin_decodes VALUES (?, ?, ?, ?, ?, ?)",
+                [(vin, make, model, int(year), now, now) for vin, make, model, year in entries]
+            )
+            self._conn.execute("DELETE FROM vin_decodes WHERE decoded_at < ?", (now - self.ttl,))
+            overflow = self._conn.execute("SELECT COUNT(*) FROM vin_decodes").fetchone()[0] - self.max_entries
+            if overflow > 0:
+                self._conn.execute(
+                    "DELETE FROM vin_decodes WHERE vin IN"
+                    " (SELECT vin FROM vin_decodes ORDER BY last_used LIMIT ?)", (overflow,)
+                )
+            self._conn.commit()
+
+    def put(self, vin, make, model, year):
+        self.put_many([(vin, make, model, year)])
+
+    def iter_decodes(self):
+        """Yields (vin, make, model) for every fresh entry, e.g. to seed vin_offline.VinPrefixIndex."""
+        with self._lock:
+            rows = self._conn.execute("SELECT vin, make, model FROM vin_decodes WHERE decoded_at >= ?",
+                                      (time.time() - self.ttl,)).fetchall()
+        yield from rows
+
+    def stats(self):
+        with self._lock:
+            size = self._conn.execute("SELECT COUNT(*) FROM vin_decodes").fetchone()[0]
+        lookups = self.hits + self.misses
+        return {"entries": size, "hits": self.hits, "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0}
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM vin_decodes")
+            self._conn.commit()
+
+    def close(self):
+        self._conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect or pre-load the persistent VIN decode cache.")
+    parser.add_argument("command", choices=["warm", "stats", "clear"])
+    parser.add_argument("vin_file", nargs="?", help="warm: text file with one VIN per line")
+    parser.add_argument("--path", default=VIN_CACHE_PATH)
+    args = parser.parse_args()
+
+    cache = VinCache(args.path)
+    if args.command == "warm":
+        from vin_decoder import VinDecoder
+        with open(args.vin_file) as f:
+            vins = [line.strip() for line in f if line.strip()]
+        decoded = VinDecoder(cache=cache).warm_up(vins)
+        print(f"Decoded {decoded:,} new VINs out of {len(vins):,}")
+    elif args.command == "clear":
+        cache.clear()
+    print(cache.stats())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import NamedTuple
+
+from engine import CURRENT_YEAR
+from instrumentation import timed
+from vin_offline import VinPrefixIndex, model_year, vin_error
+
+# ---------------------------------------------------------
+# NHTSA vPIC SETTINGS
+# ---------------------------------------------------------
+NHTSA_BASE_URL = os.environ.get("NHTSA_BASE_URL", "https://vpic.nhtsa.dot.gov/api/vehicles")
+NHTSA_BATCH_SIZE = 50  # DecodeVINValuesBatch accepts at most 50 VINs per request
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+FALLBACK_YEAR = CURRENT_YEAR - 3
+
+
+class VinDecode(NamedTuple):
+    vin: str
+    make: str
+    model: str
+    year: int
+    error: str = ""
+
+
+def parse_result(vin, data):
+    """Turns one vPIC `Results` record into a VinDecode."""
+    make = (data.get('Make') or '').title()
+    model = (data.get('Model') or '').title()
+    try: year = int(data.get('ModelYear') or '')
+    except ValueError: year = model_year(vin) or FALLBACK_YEAR
+    error = "" if make else (data.get('ErrorText') or "Not found in NHTSA database")
+    return VinDecode(vin, make, model, year, error)
+
+def failed(vin, error, make=""):
+    return VinDecode(vin, make, "", (len(vin) == 17 and model_year(vin)) or FALLBACK_YEAR, error)
+
+
+class VinDecoder:
+    """
+    Decodes VINs through NHTSA vPIC over a single pooled `requests.Session`.
+    `decode_many` sends VINs to DecodeVINValuesBatch in chunks, with up to `max_workers`
+    chunks in flight, and returns one VinDecode per VIN (errors included, never raised).
+    VINs failing the offline checks (length, characters, check digit, year code) are rejected
+    without a request. Known WMI+VDS prefixes resolve from `index` (see vin_offline) and then
+    `cache` (see vin_cache.VinCache); only what's left goes to the network.
+    """
+
+    def __init__(self, base_url=NHTSA_BASE_URL, batch_size=NHTSA_BATCH_SIZE, max_workers=4,
+                 timeout=10, retries=3, backoff=0.5, session=None, cache=None, index=None):
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        self.cache = cache
+        self.index = index if index is not None else VinPrefixIndex()
+        self.base_url = base_url.rstrip('/')
+        self.batch_size = batch_size
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.session = session or requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_workers)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def _request(self, method, url, **kwargs):
+        import requests
+
+        for attempt in range(self.retries + 1):
+            try:
+                response = self.session.request(method, url, timeout=self.timeout, **kwargs)
+                if response.status_code == 200:
+                    return response.json()['Results']
+                if response.status_code not in RETRY_STATUSES or attempt == self.retries:
+                    raise RuntimeError(f"NHTSA returned HTTP {response.status_code}")
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt == self.retries: raise
+            time.sleep(self.backoff * (2 ** attempt))
+
+    def _learn(self, decodes):
+        for d in decodes: self.index.learn(d.vin, d.make, d.model)
+
+    @timed("vin_decode")
+    def decode(self, vin):
+        vin = str(vin).strip().upper()
+        error = vin_error(vin)
+        if error: return failed(vin, error)
+        hit = self.index.lookup(vin)
+        if hit: return VinDecode(vin, *hit)
+        if self.cache is not None:
+            hit = self.cache.get(vin)
+            if hit:
+                self._learn([VinDecode(vin, *hit)])
+                return VinDecode(vin, *hit)
+        try:
+            results = self._request("GET", f"{self.base_url}/DecodeVinValues/{vin}", params={"format": "json"})
+            decoded = parse_result(vin, results[0])
+        except Exception as e:
+            return failed(vin, str(e), make=self.index.make_for(vin) or "")
+        if not decoded.error:
+            self._learn([decoded])
+            if self.cache is not None: self.cache.put(vin, decoded.make, decoded.model, decoded.year)
+        return decoded
+
+    def _decode_chunk(self, chunk):
+        try:
+            results = self._request("POST", f"{self.base_url}/DecodeVINValuesBatch/",
+                                    data={"format": "json", "data": ";".join(chunk)})
+        except Exception as e:
+            return [failed(vin, str(e), make=self.index.make_for(vin) or "") for vin in chunk]
+        by_vin = {str(r.get('VIN', '')).upper(): r for r in results}
+        return [parse_result(vin, by_vin[vin]) if vin in by_vin else failed(vin, "Missing from NHTSA response")
+                for vin in chunk]
+
+    def _decode_many(self, vins):
+        vins = list(dict.fromkeys(str(v).strip().upper() for v in vins))
+        decoded = {vin: failed(vin, vin_error(vin)) for vin in vins if vin_error(vin)}
+        for vin in vins:
+            hit = vin not in decoded and self.index.lookup(vin)
+            if hit: decoded[vin] = VinDecode(vin, *hit)
+        if self.cache is not None:
+            hits = self.cache.get_many([vin for vin in vins if vin not in decoded])
+            cached = [VinDecode(vin, *hit) for vin, hit in hits.items()]
+            decoded.update((d.vin, d) for d in cached)
+            self._learn(cached)
+        pending = [vin for vin in vins if vin not in decoded]
+        chunks = [pending[i:i + self.batch_size] for i in range(0, len(pending), self.batch_size)]
+        fresh = []
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            for chunk_result in pool.map(self._decode_chunk, chunks):
+                decoded.update((d.vin, d) for d in chunk_result)
+                fresh.extend(d for d in chunk_result if not d.error)
+        self._learn(fresh)
+        if self.cache is not None and fresh:
+            self.cache.put_many([(d.vin, d.make, d.model, d.year) for d in fresh])
+        return decoded, fresh
+
+    @timed("vin_decode")
+    def decode_many(self, vins):
+        """Returns {vin: VinDecode} for every distinct VIN in `vins` (upper-cased)."""
+        return self._decode_many(vins)[0]
+
+    def warm_up(self, vins):
+        """Pre-loads the cache with `vins`; returns how many were newly decoded from NHTSA."""
+        return len(self._decode_many(vins)[1])
+
+    def close(self):
+        self.session.close()
+
+
+def apply_decodes(df, decoded):
+    """
+    Fills blank make/model/year in a normalized batch frame from `decoded` and adds a
+    `vin_check` column: "OK", "FILLED", "MISMATCH" (CSV disagrees with NHTSA) or "ERROR".
+    Partial decodes (make/year known from the VIN alone, NHTSA unreachable) count as errors.
+    """
+    import numpy as np
+    import pandas as pd
+
+    df = df.copy()
+    vins = df['vin'].astype(str).str.strip().str.upper()
+    dec_make = vins.map({v: d.make for v, d in decoded.items()}).fillna("")
+    dec_model = vins.map({v: d.model for v, d in decoded.items()}).fillna("")
+    dec_year = vins.map({v: d.year for v, d in decoded.items()}).fillna(FALLBACK_YEAR).astype(int)
+    ok = vins.map({v: not d.error for v, d in decoded.items()}).fillna(False).astype(bool)
+
+    blank = {c: df[c].isna() | (df[c].astype(str).str.strip() == "") for c in ['make', 'model', 'year']}
+    filled = ok & (blank['make'] | blank['model'] | blank['year'])
+    for col, dec in [('make', dec_make), ('model', dec_model), ('year', dec_year)]:
+        df[col] = df[col].where(~(ok & blank[col]), dec)
+
+    mismatch = ok & (
+        (df['make'].astype(str).str.lower() != dec_make.str.lower())
+        | (df['model'].astype(str).str.lower() != dec_model.str.lower())
+        | (pd.to_numeric(df['year'], errors='coerce') != dec_year)
+    )
+    df['vin_check'] = np.select([~ok, mismatch, filled], ["ERROR", "MISMATCH", "FILLED"], "OK")
+    return df
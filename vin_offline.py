@@ -0,0 +1,109 @@
+import threading
+
+from engine import CURRENT_YEAR
+
+# ---------------------------------------------------------
+# VIN STRUCTURE TABLES (49 CFR 565)
+# ---------------------------------------------------------
+TRANSLITERATION = {
+    **{str(d): d for d in range(10)},
+    'A': 1, 'B': 2, 'C': 3, 'D': 4, 'E': 5, 'F': 6, 'G': 7, 'H': 8,
+    'J': 1, 'K': 2, 'L': 3, 'M': 4, 'N': 5, 'P': 7, 'R': 9,
+    'S': 2, 'T': 3, 'U': 4, 'V': 5, 'W': 6, 'X': 7, 'Y': 8, 'Z': 9
+}
+CHECK_WEIGHTS = (8, 7, 6, 5, 4, 3, 2, 10, 0, 9, 8, 7, 6, 5, 4, 3, 2)
+
+# Position 10 repeats every 30 years: A=1980/2010 ... Y=2000/2030, 1=2001/2031 ... 9=2009/2039
+YEAR_CODES = {code: 1980 + i for i, code in enumerate("ABCDEFGHJKLMNPRSTVWXY123456789")}
+
+# World Manufacturer Identifiers for the VEHICLE_DB makes. Shared WMIs (e.g. 1C4 for
+# Chrysler/Dodge/Jeep) are left out on purpose; those resolve from past decodes instead.
+WMI_MAKES = {
+    **dict.fromkeys(["1G1", "1GC", "1GN", "2G1", "3G1", "3GC", "3GN", "KL7"], "Chevrolet"),
+    **dict.fromkeys(["1FA", "1FM", "1FT", "2FM", "3FA", "3FM"], "Ford"),
+    **dict.fromkeys(["19X", "1HG", "2HG", "2HK", "3CZ", "5FN", "5FP", "5J6", "7FA", "JHM"], "Honda"),
+    **dict.fromkeys(["5NM", "5NP", "KM8", "KMH"], "Hyundai"),
+    **dict.fromkeys(["3KP", "5XX", "5XY", "KNA", "KND"], "Kia"),
+    **dict.fromkeys(["1N4", "1N6", "3N1", "3N6", "5N1", "JN1", "JN8", "KNM"], "Nissan"),
+    **dict.fromkeys(["2T1", "2T3", "4T1", "4T3", "4T4", "5TD", "5TE", "5TF", "5YF", "JTD", "JTE", "JTM", "JTN"], "Toyota"),
+    **dict.fromkeys(["KMT", "KMU"], "Genesis"),
+    **dict.fromkeys(["1J4", "1J8"], "Jeep"),
+    **dict.fromkeys(["4S3", "4S4", "JF1", "JF2"], "Subaru"),
+    **dict.fromkeys(["1V2", "1VW", "3VV", "3VW", "WVG", "WVW"], "Volkswagen"),
+}
+
+AMBIGUOUS = object()  # marks a prefix/WMI that decoded to conflicting vehicles
+
+# ---------------------------------------------------------
+# VALIDATION
+# ---------------------------------------------------------
+def check_digit(vin):
+    total = sum(TRANSLITERATION[c] * w for c, w in zip(vin, CHECK_WEIGHTS))
+    remainder = total % 11
+    return 'X' if remainder == 10 else str(remainder)
+
+def model_year(vin):
+    """Model year from position 10, using position 7 (letter from 2010 on) to pick the 30-year cycle."""
+    year = YEAR_CODES.get(vin[9])
+    if year is None: return None
+    if vin[6].isalpha(): year += 30
+    if year > CURRENT_YEAR + 1: year -= 30
+    return year
+
+def vin_error(vin):
+    """Returns why `vin` can't be a valid 17-character VIN, or "" if it passes every offline check."""
+    if len(vin) != 17: return "Invalid VIN length"
+    if any(c not in TRANSLITERATION for c in vin): return "Invalid VIN characters"
+    if vin[8] != check_digit(vin): return "Invalid VIN check digit"
+    if vin[9] not in YEAR_CODES: return "Invalid VIN model year code"
+    return ""
+
+# ---------------------------------------------------------
+# PREFIX INDEX
+# ---------------------------------------------------------
+class VinPrefixIndex:
+    """
+    Offline make/model lookup keyed by WMI + VDS (VIN positions 1-8), learned from past decodes.
+    A prefix that has decoded to two different vehicles is marked ambiguous and never answers.
+    WMIs seen only in WMI_MAKES give the make but not the model, which isn't enough to skip NHTSA.
+    """
+
+    def __init__(self):
+        self.prefixes = {}
+        self.wmi_makes = dict(WMI_MAKES)
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_decodes(cls, decodes):
+        index = cls()
+        for vin, make, model in decodes: index.learn(vin, make, model)
+        return index
+
+    def learn(self, vin, make, model):
+        if not make or not model or len(vin) != 17: return
+        prefix, value = vin[:8], (make, model)
+        with self._lock:
+            if self.prefixes.setdefault(prefix, value) != value:
+                self.prefixes[prefix] = AMBIGUOUS
+            if self.wmi_makes.setdefault(vin[:3], make) != make and vin[:3] not in WMI_MAKES:
+                self.wmi_makes[vin[:3]] = AMBIGUOUS
+
+    def make_for(self, vin):
+        make = self.wmi_makes.get(vin[:3])
+        return None if make is AMBIGUOUS else make
+
+    def lookup(self, vin):
+        """Returns (make, model, year) for a VIN whose prefix is known, otherwise None."""
+        hit = self.prefixes.get(vin[:8])
+        year = model_year(vin)
+        with self._lock:
+            if hit is None or hit is AMBIGUOUS or year is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return hit[0], hit[1], year
+
+    def __len__(self):
+        return len(self.prefixes)